@@ -1,6 +1,13 @@
+import os
+import time
+
 import imgui
 from moderngl_window.integrations.imgui import ModernglWindowRenderer
 
+from coloredText import bcolors as colors
+
+PROFILER_FRAMES = 120  # frames the Profiler window averages over
+
 # TODO: Rewrite needed
 
 class ImGUIManager:
@@ -20,6 +27,7 @@ class ImGUIManager:
                 "render": [False, {}],
                 "postFX": [False, {}]
             }],
+            "profiler": [False, {}],
         }
 
     def closeTree_exclude_startNode(self, node):
@@ -38,6 +46,8 @@ class ImGUIManager:
         
         changedSettings = False
         changedSecondarySettings = False
+        changedTiles = False
+        changedWavefront = False
         # Render each Window (garbage)
         if imgui.begin(
             "mainMenu",
@@ -60,6 +70,11 @@ class ImGUIManager:
                     self.closeTree(self.openMenus["settingsMenu"])
                 #else:
                 self.closeTree(self.openMenus["fileMenu"])
+
+            imgui.same_line()
+
+            if imgui.button(label="Profiler"):
+                self.openMenus["profiler"][0] = not self.openMenus["profiler"][0]
         imgui.end()
 
         ##############################################################################
@@ -97,7 +112,7 @@ class ImGUIManager:
             if changed:
                 self.app.settings.rt_scenepath = text
             if imgui.button(label="Apply"):
-                self.app.scene.importFromFile(self.app.settings.rt_scenepath)
+                self.app.scene.importFromFile(self.app.settings.rt_scenepath, self.app.settings.rt_scenecache)
                 self.app.createScene()
             
             imgui.end()
@@ -157,6 +172,13 @@ class ImGUIManager:
                 self.app.settings.rt_accumframes = not self.app.settings.rt_accumframes
                 changedSettings = True
 
+            clicked, _ = imgui.checkbox(
+                label="Wavefront (compute)", state=self.app.settings.rt_wavefront
+            )
+            if clicked:
+                self.app.settings.rt_wavefront = not self.app.settings.rt_wavefront
+                changedWavefront = True
+
             imgui.push_item_width(40)
             changedsmp, samples = imgui.input_int(
                 "Samples", max(self.app.settings.rt_samples, 1), step=0
@@ -171,6 +193,66 @@ class ImGUIManager:
             if changedrfl:
                 self.app.settings.rt_reflections = min(max(reflections, 2), 1024)
                 changedSettings = True
+
+            clicked, _ = imgui.checkbox(
+                label="Russian roulette", state=self.app.settings.rt_roulette
+            )
+            if clicked:
+                self.app.settings.rt_roulette = not self.app.settings.rt_roulette
+                changedSettings = True
+
+            changedrrd, roulettedepth = imgui.input_int(
+                "Roulette depth", self.app.settings.rt_roulettedepth, step=0
+            )
+            if changedrrd:
+                self.app.settings.rt_roulettedepth = min(max(roulettedepth, 1), 1024)
+                changedSettings = True
+
+            clicked, _ = imgui.checkbox(
+                label="Light sampling", state=self.app.settings.rt_nee
+            )
+            if clicked:
+                self.app.settings.rt_nee = not self.app.settings.rt_nee
+                changedSettings = True
+
+            clicked, _ = imgui.checkbox(
+                label="Adaptive sampling", state=self.app.settings.rt_adaptive
+            )
+            if clicked:
+                self.app.settings.rt_adaptive = not self.app.settings.rt_adaptive
+                changedSettings = True
+
+            changednth, noisethreshold = imgui.input_float(
+                "Noise threshold", self.app.settings.rt_noisethreshold, format="%.3f"
+            )
+            if changednth:
+                self.app.settings.rt_noisethreshold = min(max(noisethreshold, 0.0), 1.0)
+                changedSettings = True
+
+            imgui.text(f"Avg path length: {self.app.averagePathLength:.2f}")
+            if self.app.glCalls is not None:
+                calls = self.app.glCallsPerFrame
+                skipped = calls.get("skipped uniforms", 0)
+                imgui.text(f"GL calls/frame: {sum(calls.values()) - skipped} ({skipped} uniform writes skipped)")
+                for kind, count in calls.items():
+                    if kind != "skipped uniforms":
+                        imgui.text(f"  {kind}: {count}")
+            if self.app.settings.rt_adaptive:
+                imgui.text(f"Converged pixels: {self.app.convergedFraction:.1%}")
+
+            changedtls, tilesize = imgui.input_int(
+                "Tile size (0 = off)", self.app.settings.rt_tilesize, step=0
+            )
+            if changedtls:
+                self.app.settings.rt_tilesize = min(max(tilesize, 0), 4096)
+                changedTiles = True
+
+            changedbdg, tilebudget = imgui.input_int(
+                "Tile budget (ms)", self.app.settings.rt_tilebudget, step=0
+            )
+            if changedbdg:
+                self.app.settings.rt_tilebudget = min(max(tilebudget, 1), 1000)
+                changedTiles = True
             imgui.pop_item_width()
             imgui.end()
         
@@ -194,6 +276,16 @@ class ImGUIManager:
 
         
 
+        if self.openMenus["profiler"][0] and imgui.begin("Profiler"):
+            self.renderProfiler()
+            imgui.end()
+
+        if changedTiles:
+            self.app.initTiles()
+            changedSettings = True
+        if changedWavefront:
+            self.app.initWavefront()
+            changedSettings = True
         if changedSettings:
             self.app.updateRTuniforms()
         if changedSecondarySettings:
@@ -201,3 +293,28 @@ class ImGUIManager:
 
         imgui.render()
         self.imgui.render(imgui.get_draw_data())
+
+    def renderProfiler(self):
+        profiler = self.app.profiler
+        clicked, _ = imgui.checkbox(label="GPU timer queries", state=profiler.enabled)
+        if clicked:
+            profiler.enabled = not profiler.enabled
+
+        summary = profiler.summary(PROFILER_FRAMES)
+        imgui.text(f"CPU frame: {summary['cpu_ms']:.2f} ms")
+        for name, elapsed in summary["gpu_ms"].items():
+            imgui.text(f"GPU {name}: {elapsed:.2f} ms")
+        imgui.text(f"Samples/sec: {summary['samples_per_sec']:,.0f}")
+        imgui.text(f"Rays/sec: {summary['rays_per_sec']:,.0f}")
+
+        if imgui.button(label="Export JSON"):
+            self.exportProfile("json")
+        imgui.same_line()
+        if imgui.button(label="Export CSV"):
+            self.exportProfile("csv")
+
+    def exportProfile(self, extension):
+        os.makedirs(self.app.settings.app_profilePath, exist_ok=True)
+        path = os.path.join(self.app.settings.app_profilePath, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.{extension}")
+        self.app.profiler.export(path)
+        print(f"{colors.HEADER}Profiler{colors.ENDC} - {colors.OKGREEN}Exported{colors.ENDC} {colors.OKBLUE}[{path}]{colors.ENDC}")
@@ -24,4 +24,5 @@ class VAO:
             1, 2, 3
         ]).astype(np.int32)
         idx_buffer = self.ctx.buffer(idx_data)
-        return self.ctx.vertex_array(program,content,idx_buffer)
\ No newline at end of file
+        # programs that only use gl_FragCoord (accumulator) let the compiler drop in_uv
+        return self.ctx.vertex_array(program,content,idx_buffer,skip_errors=True)
\ No newline at end of file
@@ -0,0 +1,150 @@
+import argparse
+import os
+from dataclasses import dataclass, asdict
+
+import numpy as np
+
+SHAPES = ("spheres", "cubes", "cylinders", "quads")
+GROUP_CHAINS = 4  # shapes are spread over this many chains of group_depth nested groups
+
+
+@dataclass
+class BenchCase:
+    """ One procedurally generated scene: count primitives of one type (or all four, 'mixed') on a jittered grid
+        in front of the default camera, placed in chains of group_depth nested $groups and using materials materials.
+        With room the grid is closed in by six walls, so paths bounce until reflections runs out """
+    count: int
+    shapes: str = "mixed"
+    group_depth: int = 0
+    materials: int = 8
+    seed: int = 0
+    room: bool = False
+
+    @property
+    def name(self):
+        return f"{self.shapes}-{self.count}-d{self.group_depth}-m{self.materials}" + ("-room" if self.room else "")
+
+    def params(self):
+        return asdict(self)
+
+
+# scaling over 10^2..10^5 primitives, then one parameter at a time at 10^4
+SUITE = (
+    [BenchCase(10 ** exponent) for exponent in range(2, 6)]
+    + [BenchCase(10_000, shapes=shapes) for shapes in SHAPES]
+    + [BenchCase(10_000, group_depth=depth) for depth in (1, 4)]
+    + [BenchCase(10_000, materials=materials) for materials in (1, 64)]
+)
+
+# 64 primitives of every type alone and mixed, 16 of each, in a closed room: the samples/sec of these
+# compare shader changes of the per-type intersection loops (render.py --no-bvh)
+ROOMS = [BenchCase(64, shapes=shapes, materials=2, room=True) for shapes in SHAPES + ("mixed",)]
+ROOM_BOUNDS = ((-4, -12, -12), (30, 12, 12))  # around the grid, the camera at the origin is inside
+
+
+def _number(value):
+    """ fixed point, .pyrt has no exponent notation """
+    return f"{value:.4f}".rstrip("0").rstrip(".")
+
+
+def _vector(values):
+    return "(" + ", ".join(_number(value) for value in values) + ")"
+
+
+def _room(lo, hi):
+    """ Six Wall quads facing into the box lo..hi """
+    lines = []
+    for axis in range(3):
+        u, v = (axis + 1) % 3, (axis + 2) % 3
+        for side in (lo, hi):
+            corners = []
+            for a, b in ((lo[u], lo[v]), (lo[u], hi[v]), (hi[u], hi[v]), (hi[u], lo[v])):
+                corner = [0, 0, 0]
+                corner[axis], corner[u], corner[v] = side[axis], a, b
+                corners.append(_vector(corner))
+            lines.append(f"quad(bottomLeft = {corners[0]}, bottomRight = {corners[1]}, topRight = {corners[2]}, topLeft = {corners[3]}, "
+                         f"rotation = (0, 0, 0), material = Wall)")
+    return lines
+
+
+def generate_scene(case):
+    """ .pyrt source of the case, the same text for the same parameters """
+    rng = np.random.default_rng(case.seed)
+    lines = [f"# generated by bench_scenes.py: {case.params()}", ""]
+
+    for index in range(case.materials):
+        color = rng.uniform(0.2, 0.9, 3)
+        lines.append(f"$material M{index}(color = {_vector(color)}, specularColor = {_vector(color)}, "
+                     f"roughness = {_number(rng.uniform(0.1, 1))}, metalness = {int(rng.random() < 0.3)}, emissive = 0, refractive = 0)")
+    lines.append("$material Light(color = (1, 0.9, 0.8), specularColor = (1, 1, 1), roughness = 1, metalness = 0, emissive = 6, refractive = 0)")
+    if case.room:
+        lines.append("$material Wall(color = (0.7, 0.7, 0.7), specularColor = (0.6, 0.6, 0.6), roughness = 1, metalness = 0, emissive = 0, refractive = 0)")
+        lines.extend(_room(*ROOM_BOUNDS))
+        lines.append("sphere(position = (16, 9, 0), rotation = (0, 0, 0), size = 1.5, material = Light)")
+    else:
+        lines.append("sphere(position = (16, 14, 0), rotation = (0, 0, 0), size = 3, material = Light)")
+
+    # every chain nests group_depth groups with a small twist each, the shapes go into the innermost one
+    prefixes = [""]
+    if case.group_depth > 0:
+        prefixes = []
+        for chain in range(GROUP_CHAINS):
+            path = []
+            for level in range(case.group_depth):
+                path.append(f"C{chain}L{level}")
+                twist = _vector((0, 0.01 * (level + 1), -0.01 * (chain + 1)))
+                lines.append(f"$group {':'.join(path)}(position = (0, 0, 0), rotation = {twist})")
+            prefixes.append(":".join(path) + ":")
+
+    # a grid 20 units deep and 10 across, starting 6 units in front of the camera at the origin (it looks along +x)
+    side = int(np.ceil(case.count ** (1 / 3)))
+    spacing = np.array([20.0, 10.0, 10.0]) / side
+    size = 0.35 * spacing.min()
+    cells = rng.permutation(side ** 3)[:case.count]
+    grid = np.stack(np.unravel_index(cells, (side, side, side)), axis=1)
+    centers = (grid + 0.5) * spacing + (6, -5, -5) + rng.uniform(-0.2, 0.2, (case.count, 3)) * spacing
+    rotations = rng.uniform(-np.pi, np.pi, (case.count, 3))
+    extents = size * rng.uniform(0.6, 1.0, (case.count, 3))
+
+    for index in range(case.count):
+        shapes = SHAPES[index % len(SHAPES)] if case.shapes == "mixed" else case.shapes
+        prefix = prefixes[index % len(prefixes)]
+        material = f"M{index % case.materials}"
+        center, rotation, extent = centers[index], _vector(rotations[index]), extents[index]
+        match shapes:
+            case "spheres":
+                lines.append(f"{prefix}sphere(position = {_vector(center)}, rotation = {rotation}, size = {_number(extent[0])}, material = {material})")
+            case "cubes":
+                lines.append(f"{prefix}cube(position = {_vector(center)}, rotation = {rotation}, size = {_vector(extent)}, material = {material})")
+            case "cylinders":
+                axis = np.array([0, extent[1], 0])
+                lines.append(f"{prefix}cylinder(topPosition = {_vector(center + axis)}, bottomPosition = {_vector(center - axis)}, "
+                             f"rotation = {rotation}, size = {_number(0.5 * extent[0])}, material = {material})")
+            case "quads":
+                u, v = np.array([0, extent[1], 0]), np.array([0, 0, extent[2]])
+                lines.append(f"{prefix}quad(bottomLeft = {_vector(center - u - v)}, bottomRight = {_vector(center - u + v)}, "
+                             f"topRight = {_vector(center + u + v)}, topLeft = {_vector(center + u - v)}, rotation = {rotation}, material = {material})")
+            case _:
+                raise ValueError(f"unknown shape type {shapes}, expected one of {SHAPES} or 'mixed'")
+    return "\n".join(lines) + "\n"
+
+
+def write_scene(case, directory):
+    """ Path of the case's .pyrt in directory, only (re)written when the file is missing or differs """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{case.name}.pyrt")
+    source = generate_scene(case)
+    if not os.path.isfile(path) or open(path).read() != source:
+        with open(path, "w") as file:
+            file.write(source)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write the room scenes (or every benchmark case) as .pyrt files")
+    parser.add_argument("--all", action="store_true", help="also write the scaling suite benchmark.py runs")
+    parser.add_argument("--scene-dir", help="defaults to scenes/bench/generated")
+    args = parser.parse_args()
+    directory = os.path.abspath(args.scene_dir) if args.scene_dir else os.path.join(os.path.dirname(os.path.abspath(__file__)), "../scenes/bench/generated")
+    for case in ROOMS + (SUITE if args.all else []):
+        print(os.path.relpath(write_scene(case, directory)))
@@ -0,0 +1,294 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from bench_scenes import SUITE, write_scene
+from coloredText import bcolors as colors
+from pyrt_lexer import Lexer
+from pyrt_parser import Parser
+from scene import Scene
+from scene_packer import PackedSceneBuilder
+from settings import Settings
+
+# seconds per stage, lower is better, and throughput, higher is better
+STAGES = ("lex", "parse", "interpret", "pack", "bvh", "upload")
+THROUGHPUT = ("samples_per_sec",)
+
+# python arguments of every entry point --startup measures, and its budget for the -X importtime total in ms.
+# main needs moderngl_window and imgui, it is reported as skipped when they are missing
+STARTUP = {
+    "render --help": (["render.py", "--help"], 80),
+    "settings": (["-c", "from settings import Settings; Settings()"], 80),
+    "headless": (["-c", "import headless"], 300),
+    "cpu_renderer": (["-c", "import cpu_renderer"], 330),
+    "main": (["-c", "import main"], 350),
+}
+
+
+def best_of(repeat, function):
+    """ (shortest time, result of the last call) """
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def import_stages(source, repeat):
+    """ Times of every step of Scene.importFromFile, which streams them into each other, done one after the other here.
+        Returns (times, scene) """
+    def lex():
+        lexer = Lexer()
+        lexer.set_src(source)
+        return list(lexer.token_iter())
+
+    def parse():
+        lexer = Lexer()
+        lexer.set_src(source)
+        parser = Parser()
+        parser.set_lexer(lexer)
+        units = list(parser.iter_units())
+        if parser.errors:
+            raise ValueError(f"{len(parser.errors)} parse error(s), first: {parser.errors[0]}")
+        return units
+
+    def interpret():
+        scene = Scene()
+        scene.builder = PackedSceneBuilder()
+        scene.PYRTManager.interpreter.interpret_units(units)
+        return scene
+
+    times = {}
+    times["lex"], _ = best_of(repeat, lex)
+    # the parser pulls its tokens from the lexer, its time is what it adds on top
+    parse_time, units = best_of(repeat, parse)
+    times["parse"] = max(parse_time - times["lex"], 0.0)
+    # build() bakes the group transforms in place, so every run packs the builder its own interpret run filled
+    times["interpret"] = times["pack"] = float("inf")
+    for _ in range(repeat):
+        interpret_time, scene = best_of(1, interpret)
+        pack_time, scene.packed = best_of(1, scene.builder.build)
+        scene.builder = None
+        times["interpret"] = min(times["interpret"], interpret_time)
+        times["pack"] = min(times["pack"], pack_time)
+    times["bvh"], _ = best_of(repeat, scene.build_bvh)
+    return times, scene
+
+
+def import_time(arguments):
+    """ Milliseconds of the modules a fresh interpreter imports for arguments, summed over the top level ones
+        of its -X importtime report, None if the process fails """
+    process = subprocess.run([sys.executable, "-X", "importtime", *arguments], capture_output=True, text=True)
+    if process.returncode != 0:
+        return None
+    total = 0
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        # nested imports are indented below the one that pulled them in
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            total += int(cumulative)
+    return total / 1e3
+
+
+def startup_times(repeat):
+    """ {entry point: {"imports": ms, "wall": ms, "budget": ms}}, the fastest of repeat runs each """
+    times = {}
+    for name, (arguments, budget) in STARTUP.items():
+        imports = [import_time(arguments) for _ in range(repeat)]
+        if None in imports:
+            times[name] = None
+            continue
+        wall, _ = best_of(repeat, lambda: subprocess.run([sys.executable, *arguments], capture_output=True))
+        times[name] = {"imports": min(imports), "wall": wall * 1e3, "budget": budget}
+    return times
+
+
+class GLBench:
+    """ One headless renderer reused for every case, only the scene is swapped """
+
+    def __init__(self, settings, first_scene, backend):
+        from headless import HeadlessRenderer
+        settings.rt_scenepath = first_scene
+        self.renderer = HeadlessRenderer(settings, backend=backend)
+
+    def run(self, scene, frames, repeat):
+        renderer = self.renderer
+        renderer.scene = scene
+
+        # upload of the geometry, material and light buffers alone, the BVH build is timed on its own
+        bvh = renderer.settings.rt_bvh
+        renderer.settings.rt_bvh = False
+        def upload():
+            renderer.createScene()
+            renderer.ctx.finish()
+        upload_time, _ = best_of(repeat, upload)
+        renderer.settings.rt_bvh = bvh
+        renderer.createBVH()
+
+        # one frame first, so driver compiles and scene buffer first touches stay out of the measurement
+        renderer.frames = 0
+        renderer.render(1)
+        renderer.resetAccumulation()
+        render_time = renderer.render(frames)
+        width, height = renderer.window_size
+        return upload_time, width * height * renderer.settings.rt_samples * renderer.frames / render_time
+
+    @property
+    def info(self):
+        return {key: self.renderer.ctx.info[key] for key in ("GL_RENDERER", "GL_VERSION")}
+
+
+def compare(results, baseline, tolerance):
+    """ Prints every metric next to its baseline value, returns the regressions beyond tolerance """
+    regressions = []
+    if baseline.get("gl") != results.get("gl"):
+        print(f"{colors.WARNING}baseline was measured on {baseline.get('gl')}, this run on {results.get('gl')}{colors.ENDC}")
+    for name, case in results["cases"].items():
+        old = baseline["cases"].get(name)
+        if old is None:
+            print(f"{colors.OKBLUE}{name}{colors.ENDC}: not in the baseline")
+            continue
+        print(f"{colors.OKBLUE}{name}{colors.ENDC}")
+        for metric in STAGES + THROUGHPUT:
+            if case.get(metric) is None or old.get(metric) is None:
+                continue
+            ratio = case[metric] / old[metric] if old[metric] else float("inf")
+            # stages are times, so a larger ratio is worse, for throughput a smaller one
+            change = ratio if metric in STAGES else 1 / ratio if ratio else float("inf")
+            worse, better = change > 1 + tolerance, change < 1 - tolerance
+            color = colors.FAIL if worse else colors.OKGREEN if better else colors.ENDC
+            print(f"    {metric:<16}{old[metric]:>14.4g} -> {case[metric]:<14.4g}{color}{ratio:>7.2f}x{colors.ENDC}")
+            if worse:
+                regressions.append((name, metric, ratio))
+    for name, times in results.get("startup", {}).items():
+        old = baseline.get("startup", {}).get(name)
+        if times is None or old is None:
+            continue
+        ratio = times["imports"] / old["imports"] if old["imports"] else float("inf")
+        color = colors.FAIL if ratio > 1 + tolerance else colors.OKGREEN if ratio < 1 - tolerance else colors.ENDC
+        print(f"{colors.OKBLUE}startup {name}{colors.ENDC}")
+        print(f"    {'imports':<16}{old['imports']:>14.4g} -> {times['imports']:<14.4g}{color}{ratio:>7.2f}x{colors.ENDC}")
+        if ratio > 1 + tolerance:
+            regressions.append((name, "imports", ratio))
+    return regressions
+
+
+def check_startup(startup):
+    """ Prints every entry point's import time against its budget, returns the ones over it """
+    over = []
+    for name, times in startup.items():
+        if times is None:
+            print(f"{colors.HEADER}startup{colors.ENDC} - {colors.OKBLUE}[{name}]{colors.ENDC} {colors.WARNING}skipped{colors.ENDC}, it doesn't import here")
+            continue
+        color = colors.FAIL if times["imports"] > times["budget"] else colors.OKGREEN
+        print(f"{colors.HEADER}startup{colors.ENDC} - {colors.OKBLUE}[{name}]{colors.ENDC} "
+              f"imports {color}{times['imports']:.1f}ms{colors.ENDC} of {times['budget']}ms  wall {times['wall']:.1f}ms")
+        if times["imports"] > times["budget"]:
+            over.append(name)
+    return over
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the benchmark scenes and time import, upload and rendering of each")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against, exits with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change that counts as a regression, default 0.1")
+    parser.add_argument("--cases", nargs="*", help="only run cases whose name contains one of these strings")
+    parser.add_argument("--max-count", type=int, help="skip cases with more primitives than this")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per CPU stage, the fastest counts")
+    parser.add_argument("-f", "--frames", type=int, default=8, help="frames rendered for samples/sec")
+    parser.add_argument("-r", "--resolution", type=int, nargs=2, default=(160, 90), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--scene-dir", help="where the generated scenes are written, defaults to scenes/bench/generated")
+    parser.add_argument("--no-gl", action="store_true", help="only time the CPU stages")
+    parser.add_argument("--startup", action="store_true", help="time the imports of the entry points instead of the scenes, "
+                                                                "exits with 1 when one is over its budget")
+    parser.add_argument("--backend", default="egl", help="moderngl standalone backend, pass '' for the platform default")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    scene_dir = os.path.abspath(args.scene_dir) if args.scene_dir else None
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    scene_dir = scene_dir or os.path.abspath("../scenes/bench/generated")
+
+    cases = [] if args.startup else [case for case in SUITE
+             if (not args.cases or any(pattern in case.name for pattern in args.cases))
+             and (args.max_count is None or case.count <= args.max_count)]
+    if not cases and not args.startup:
+        print(f"{colors.HEADER}benchmark{colors.ENDC} - {colors.WARNING}no case matches{colors.ENDC}")
+        return 1
+
+    settings = Settings()
+    settings.window_size = tuple(args.resolution)
+    settings.rt_scenecache = False
+    settings.rt_tilesize = 0
+    settings.app_profiler = False
+
+    results = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"resolution": list(settings.window_size), "frames": args.frames, "samples": settings.rt_samples,
+                     "reflections": settings.rt_reflections, "bvh": settings.rt_bvh, "nee": settings.rt_nee},
+        "gl": None,
+        "cases": {},
+    }
+    gl = None
+    for case in cases:
+        path = write_scene(case, scene_dir)
+        with open(path) as file:
+            source = file.read()
+
+        # the scene modules print as they go, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            times, scene = import_stages(source, args.repeat)
+            if not args.no_gl and gl is None:
+                gl = GLBench(settings, path, args.backend)
+                results["gl"] = gl.info
+            if gl is not None:
+                times["upload"], times["samples_per_sec"] = gl.run(scene, args.frames, args.repeat)
+
+        results["cases"][case.name] = {"params": case.params(), "primitives": scene.get_object_count(), **times}
+        report = "  ".join(f"{metric} {times[metric] * 1e3:.1f}ms" for metric in STAGES if metric in times)
+        if "samples_per_sec" in times:
+            report += f"  {times['samples_per_sec']:,.0f} samples/sec"
+        print(f"{colors.HEADER}benchmark{colors.ENDC} - {colors.OKBLUE}[{case.name}]{colors.ENDC} {report}")
+
+    over = []
+    if args.startup:
+        results["startup"] = startup_times(args.repeat)
+        over = check_startup(results["startup"])
+
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, "w") as file:
+            json.dump(results, file, indent=1)
+        print(f"{colors.HEADER}benchmark{colors.ENDC} - {colors.OKGREEN}Saved{colors.ENDC} {colors.OKBLUE}[{output}]{colors.ENDC}")
+
+    if baseline_path:
+        with open(baseline_path) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print(f"{colors.HEADER}benchmark{colors.ENDC} - {colors.FAIL}{len(regressions)} regression(s){colors.ENDC} beyond {args.tolerance:.0%}")
+            return 1
+        print(f"{colors.HEADER}benchmark{colors.ENDC} - {colors.OKGREEN}no regressions{colors.ENDC} beyond {args.tolerance:.0%}")
+    if over:
+        print(f"{colors.HEADER}startup{colors.ENDC} - {colors.FAIL}{len(over)} entry point(s) over budget{colors.ENDC}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
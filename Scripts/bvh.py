@@ -0,0 +1,352 @@
+from dataclasses import dataclass
+from functools import cached_property
+from math import inf
+
+import numpy as np
+
+from scene_packer import CATEGORIES
+from transforms import quaternion_matrices
+
+# primitive type ids, same as hitObjID.x in RT.frag
+PRIMITIVE_TYPES = {"spheres": 1, "cubes": 2, "cylinders": 3, "quads": 4}
+
+MAX_LEAF_SIZE = 4
+BIN_COUNT = 8
+MAX_DEPTH = 32  # must not exceed BVH_STACK_SIZE in RT.frag
+
+BVH_PIXELS_PER_NODE = 2
+
+
+def category_bounds(category, pixels):
+    """ float64 world-space AABBs of (n, pixels per object, 4) packed primitives of one category """
+    pixels = pixels.astype(np.float64)
+    match category:
+        case "spheres":
+            center, radius = pixels[:, 0, :3], pixels[:, 0, 3:4]
+            return center - radius, center + radius
+        case "cubes":
+            center, half_size = pixels[:, 0, :3], pixels[:, 1, :3]
+            extent = np.einsum('nij,nj->ni', np.abs(quaternion_matrices(pixels[:, 2])), half_size)
+            return center - extent, center + extent
+        case "cylinders":
+            a, b, radius = pixels[:, 0, :3], pixels[:, 1, :3], pixels[:, 1, 3:4]
+            axis = b - a
+            length2 = np.maximum(np.einsum('ni,ni->n', axis, axis)[:, None], 1e-30)
+            extent = radius * np.sqrt(np.clip(1.0 - axis * axis / length2, 0.0, 1.0))
+            return np.minimum(a, b) - extent, np.maximum(a, b) + extent
+        case "quads":
+            vertices = np.stack([pixels[:, 0, :3], pixels[:, 1, :3], pixels[:, 2, :3],
+                                 np.stack([pixels[:, 0, 3], pixels[:, 1, 3], pixels[:, 2, 3]], axis=-1)], axis=1)
+            return vertices.min(axis=1), vertices.max(axis=1)
+
+
+def primitive_bounds(packed):
+    """ World-space AABBs and (type, index in the type's buffer, geometry index) refs of every packed primitive, in geometry order """
+    mins, maxs, refs = [], [], []
+    geometry_index = 0
+
+    for category in CATEGORIES:
+        count = packed.counts[category]
+        if count == 0:
+            continue
+        lo, hi = category_bounds(category, packed.category(category))
+
+        ref = np.zeros((count, 4), dtype=np.float64)
+        ref[:, 0] = PRIMITIVE_TYPES[category]
+        ref[:, 1] = np.arange(count)
+        ref[:, 2] = geometry_index + np.arange(count)
+        geometry_index += count
+
+        mins.append(lo)
+        maxs.append(hi)
+        refs.append(ref)
+
+    if not refs:
+        return np.empty((0, 3)), np.empty((0, 3)), np.empty((0, 4))
+    return np.concatenate(mins), np.concatenate(maxs), np.concatenate(refs)
+
+
+def _round_outwards(node_min, node_max):
+    """ float32 bounds that never clip the float64 ones they come from """
+    node_min32, node_max32 = node_min.astype(np.float32), node_max.astype(np.float32)
+    node_min32 = np.where(node_min32 > node_min, np.nextafter(node_min32, np.float32(-inf)), node_min32)
+    node_max32 = np.where(node_max32 < node_max, np.nextafter(node_max32, np.float32(inf)), node_max32)
+    return node_min32, node_max32
+
+
+def _surface_area(lo, hi):
+    """ Coordinate-first (3, ...) bounds, empty boxes (min > max) have zero area """
+    d = np.maximum(hi - lo, 0.0)
+    return 2.0 * (d[0] * d[1] + d[1] * d[2] + d[2] * d[0])
+
+
+def _ranges(starts, counts):
+    """ Concatenated np.arange(start, start + count) for every segment """
+    offsets = np.cumsum(counts) - counts
+    return np.arange(counts.sum()) - np.repeat(offsets - starts, counts)
+
+
+@dataclass
+class BVH:
+    node_min   : np.ndarray  # (nodes, 3)
+    node_max   : np.ndarray  # (nodes, 3)
+    left_first : np.ndarray  # left child index for inner nodes, first index into order for leaves
+    count      : np.ndarray  # primitives in a leaf, 0 for inner nodes
+    order      : np.ndarray  # primitive indices referenced by the leaves
+    refs       : np.ndarray  # (primitives, 4) type, index in the type's buffer, geometry index, 0
+
+    @property
+    def node_count(self):
+        return len(self.count)
+
+    def get_pixel_count(self):
+        return self.node_count * BVH_PIXELS_PER_NODE + len(self.order)
+
+    def node_pixels(self, start=0, stop=None):
+        """ (nodes * 2, 4) float32 vec4s of the nodes [start, stop) """
+        nodes = slice(start, stop)
+        pixels = np.empty((len(self.count[nodes]), BVH_PIXELS_PER_NODE, 4), dtype=np.float32)
+        pixels[:, 0, :3] = self.node_min[nodes]
+        pixels[:, 0, 3] = self.left_first[nodes]
+        pixels[:, 1, :3] = self.node_max[nodes]
+        pixels[:, 1, 3] = self.count[nodes]
+        return pixels.reshape(-1, 4)
+
+    def pack(self):
+        """ BVH buffer layout, 2 vec4 per node followed by one ref vec4 per leaf primitive:
+            (min.xyz, leftFirst) (max.xyz, count) ... (type, index, geometryIndex, 0) ... """
+        data = np.concatenate([self.node_pixels(), self.refs[self.order].astype(np.float32)])
+        return memoryview(data).cast('B')
+
+    @cached_property
+    def parents(self):
+        inner = np.flatnonzero(self.count == 0)
+        parents = np.full(self.node_count, -1, dtype=np.int64)
+        parents[self.left_first[inner]] = inner
+        parents[self.left_first[inner] + 1] = inner
+        return parents
+
+    @cached_property
+    def leaves(self):
+        """ leaf node of every primitive """
+        leaf = np.flatnonzero(self.count > 0)
+        leaves = np.empty(len(self.order), dtype=np.int64)
+        leaves[self.order[_ranges(self.left_first[leaf], self.count[leaf])]] = np.repeat(leaf, self.count[leaf])
+        return leaves
+
+    def refit(self, packed, primitive):
+        """ Recomputes the bounds of the leaf holding an edited primitive and of the nodes above it, returns the changed nodes.
+            The tree itself is kept, so a shape that keeps moving belongs in the dynamic geometry instead """
+        node = self.leaves[primitive]
+        first = self.left_first[node]
+        refs = self.refs[self.order[first:first + self.count[node]]]
+        mins, maxs = [], []
+        for category in CATEGORIES:
+            indices = refs[refs[:, 0] == PRIMITIVE_TYPES[category], 1].astype(np.int64)
+            if len(indices):
+                lo, hi = category_bounds(category, packed.category(category)[indices])
+                mins.append(lo)
+                maxs.append(hi)
+        node_min, node_max = _round_outwards(np.concatenate(mins).min(axis=0), np.concatenate(maxs).max(axis=0))
+
+        changed = []
+        while True:
+            if (self.node_min[node] == node_min).all() and (self.node_max[node] == node_max).all():
+                break
+            self.node_min[node], self.node_max[node] = node_min, node_max
+            changed.append(node)
+            node = self.parents[node]
+            if node < 0:
+                break
+            children = slice(self.left_first[node], self.left_first[node] + 2)
+            node_min, node_max = self.node_min[children].min(axis=0), self.node_max[children].max(axis=0)
+        return changed
+
+    def traverse(self, origin, direction, max_dist=inf):
+        """ Pure-Python mirror of raycast() in RT.frag, yields the primitives of every leaf the ray reaches.
+            Sending a distance into the generator shrinks max_dist, same as minDist does in the shader. """
+        node_min, node_max = self.node_min.tolist(), self.node_max.tolist()
+        left_first, count, order = self.left_first.tolist(), self.count.tolist(), self.order.tolist()
+        inv_dir = [1.0 / d if d != 0 else 1e20 for d in direction]
+
+        def distance(node):
+            t_near, t_far = 0.0, inf
+            for axis in range(3):
+                t1 = (node_min[node][axis] - origin[axis]) * inv_dir[axis]
+                t2 = (node_max[node][axis] - origin[axis]) * inv_dir[axis]
+                t_near = max(t_near, min(t1, t2))
+                t_far = min(t_far, max(t1, t2))
+            return t_near if t_near <= t_far and t_near < max_dist else inf
+
+        if self.node_count == 0 or distance(0) == inf:
+            return
+
+        stack = []
+        node = 0
+        while True:
+            if count[node] > 0:
+                for i in range(left_first[node], left_first[node] + count[node]):
+                    hit = yield order[i]
+                    if hit is not None:
+                        max_dist = min(max_dist, hit)
+                if not stack:
+                    return
+                node = stack.pop()
+                continue
+
+            near, far = left_first[node], left_first[node] + 1
+            d_near, d_far = distance(near), distance(far)
+            if d_near > d_far:
+                near, far, d_near, d_far = far, near, d_far, d_near
+
+            if d_near == inf:
+                if not stack:
+                    return
+                node = stack.pop()
+                continue
+            if d_far != inf:
+                stack.append(far)
+            node = near
+
+    def closest_hit(self, origin, direction, intersect):
+        """ intersect(primitive index, origin, direction) -> distance or None """
+        closest, closest_prim = inf, None
+        walker = self.traverse(origin, direction)
+        try:
+            prim = next(walker)
+            while True:
+                t = intersect(prim, origin, direction)
+                if t is not None and 0 < t < closest:
+                    closest, closest_prim = t, prim
+                    prim = walker.send(t)
+                else:
+                    prim = next(walker)
+        except StopIteration:
+            pass
+        return (closest, closest_prim) if closest_prim is not None else None
+
+
+def build_bvh(bounds_min, bounds_max, refs, max_leaf_size=MAX_LEAF_SIZE, bin_count=BIN_COUNT):
+    """ Binned SAH build, processed breadth-first so every tree level is a handful of NumPy passes """
+    primitive_count = len(bounds_min)
+    bounds_min = np.asarray(bounds_min, dtype=np.float64)
+    bounds_max = np.asarray(bounds_max, dtype=np.float64)
+    centroids = (bounds_min + bounds_max) * 0.5
+    # split costs are only estimates, bin them in single precision to halve the memory traffic
+    bin_bounds_min, bin_bounds_max = bounds_min.astype(np.float32), bounds_max.astype(np.float32)
+    order = np.arange(primitive_count)
+
+    capacity = max(2 * primitive_count - 1, 1)
+    node_min = np.full((capacity, 3), 1e30)
+    node_max = np.full((capacity, 3), -1e30)
+    left_first = np.zeros(capacity, dtype=np.int64)
+    count = np.zeros(capacity, dtype=np.int64)
+    node_total = 1
+
+    starts = np.array([0] if primitive_count else [], dtype=np.int64)
+    counts = np.array([primitive_count] if primitive_count else [], dtype=np.int64)
+    ids = np.array([0] if primitive_count else [], dtype=np.int64)
+    depth = 0
+
+    while len(starts):
+        offsets = np.cumsum(counts) - counts
+        prims = order[_ranges(starts, counts)]
+        node_min[ids] = np.minimum.reduceat(np.take(bounds_min, prims, axis=0), offsets)
+        node_max[ids] = np.maximum.reduceat(np.take(bounds_max, prims, axis=0), offsets)
+
+        leaf = (counts <= max_leaf_size) | (depth >= MAX_DEPTH - 1)
+        left_first[ids[leaf]] = starts[leaf]
+        count[ids[leaf]] = counts[leaf]
+
+        starts, counts, ids = starts[~leaf], counts[~leaf], ids[~leaf]
+        if not len(starts):
+            break
+
+        segments = len(starts)
+        offsets = np.cumsum(counts) - counts
+        positions = _ranges(starts, counts)
+        prims = order[positions]
+        prim_min, prim_max, prim_centroid = (np.take(a, prims, axis=0) for a in (bin_bounds_min, bin_bounds_max, centroids))
+        segment_of = np.repeat(np.arange(segments), counts)
+
+        # bin centroids along every axis
+        centroid_min = np.minimum.reduceat(prim_centroid, offsets)
+        centroid_max = np.maximum.reduceat(prim_centroid, offsets)
+        extent = centroid_max - centroid_min
+        scale = np.where(extent > 0, bin_count / np.where(extent > 0, extent, 1), 0)
+        bins = ((prim_centroid - np.repeat(centroid_min, counts, axis=0)) * np.repeat(scale, counts, axis=0)).astype(np.int64)
+        np.clip(bins, 0, bin_count - 1, out=bins)
+
+        # split costs laid out (axis, split, segment) so prefix scans run over long contiguous rows
+        costs = np.empty((3, bin_count - 1, segments))
+        for axis in range(3):
+            # per-bin counts and bounds, scattered one coordinate at a time
+            key = bins[:, axis] * segments + segment_of
+            bin_counts = np.bincount(key, minlength=segments * bin_count).reshape(bin_count, segments)
+            bin_min = np.full((3, bin_count * segments), inf, dtype=np.float32)
+            bin_max = np.full((3, bin_count * segments), -inf, dtype=np.float32)
+            for coordinate in range(3):
+                np.minimum.at(bin_min[coordinate], key, prim_min[:, coordinate])
+                np.maximum.at(bin_max[coordinate], key, prim_max[:, coordinate])
+            bin_min = bin_min.reshape(3, bin_count, segments)
+            bin_max = bin_max.reshape(3, bin_count, segments)
+
+            left_count = np.cumsum(bin_counts, axis=0)[:-1]
+            right_count = counts - left_count
+            left_area = _surface_area(np.minimum.accumulate(bin_min, axis=1)[:, :-1],
+                                      np.maximum.accumulate(bin_max, axis=1)[:, :-1])
+            right_area = _surface_area(np.minimum.accumulate(bin_min[:, ::-1], axis=1)[:, -2::-1],
+                                       np.maximum.accumulate(bin_max[:, ::-1], axis=1)[:, -2::-1])
+            cost = left_count * left_area + right_count * right_area
+            costs[axis] = np.where((left_count > 0) & (right_count > 0), cost, inf)
+
+        costs = costs.reshape(3 * (bin_count - 1), segments)
+        best = costs.argmin(axis=0)
+        best_axis, best_split = np.divmod(best, bin_count - 1)
+        valid = np.isfinite(costs[best, np.arange(segments)])
+
+        # partition, falling back to an object median when every centroid landed in one bin
+        right_side = bins[np.arange(len(prims)), best_axis[segment_of]] > best_split[segment_of]
+        median_side = (positions - starts[segment_of]) >= (counts[segment_of] // 2)
+        right_side = np.where(valid[segment_of], right_side, median_side)
+
+        regroup = np.argsort(segment_of * 2 + right_side, kind='stable')
+        order[positions] = prims[regroup]
+
+        right_counts = np.bincount(segment_of, weights=right_side, minlength=segments).astype(np.int64)
+        left_counts = counts - right_counts
+
+        children = node_total + 2 * np.arange(segments)
+        left_first[ids] = children
+        count[ids] = 0
+        node_total += 2 * segments
+
+        starts = np.stack([starts, starts + left_counts], axis=1).ravel()
+        counts = np.stack([left_counts, right_counts], axis=1).ravel()
+        ids = np.stack([children, children + 1], axis=1).ravel()
+        depth += 1
+
+    if primitive_count == 0:
+        node_total = 0
+    else:
+        # group every leaf's primitives by type, so neighbouring threads take the same intersector branch
+        leaves = np.flatnonzero(count[:node_total])
+        leaves = leaves[np.argsort(left_first[leaves])]
+        types = np.asarray(refs)[order, 0]
+        order = order[np.lexsort((types, np.repeat(left_first[leaves], count[leaves])))]
+
+    # round outwards so float32 bounds never clip the primitives they contain
+    node_min32, node_max32 = _round_outwards(node_min[:node_total], node_max[:node_total])
+
+    return BVH(
+        node_min32,
+        node_max32,
+        left_first[:node_total],
+        count[:node_total],
+        order,
+        np.asarray(refs),
+    )
+
+
+def build_scene_bvh(packed):
+    return build_bvh(*primitive_bounds(packed))
@@ -0,0 +1,83 @@
+import argparse
+import contextlib
+import io
+import sys
+import tempfile
+
+import numpy as np
+
+from bench_scenes import SHAPES, BenchCase, write_scene
+from bvh import PRIMITIVE_TYPES, primitive_bounds
+from coloredText import bcolors as colors
+from cpu_tracer import CPUTracer, F, NO_HIT
+from scene import Scene
+
+# every shape type alone and mixed, flat and inside nested groups, small enough for the pure-Python traversal
+CASES = [BenchCase(200, shapes=shapes, seed=seed) for seed, shapes in enumerate(SHAPES + ("mixed",))] + [
+    BenchCase(200, group_depth=2, seed=5),
+    BenchCase(3, seed=6),
+]
+TOLERANCE = 1e-4  # relative difference of the hit distances
+
+
+def random_rays(rng, count, lo, hi, targets):
+    """ Origins scattered through the scene bounds, half of the rays aimed at a random primitive's center
+        and the other half in uniform random directions """
+    origins = rng.uniform(lo, hi, (count, 3))
+    directions = rng.normal(size=(count, 3))
+    aimed = np.arange(count) % 2 == 0
+    directions[aimed] = targets[rng.integers(len(targets), size=np.count_nonzero(aimed))] - origins[aimed]
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    return origins.astype(F), directions.astype(F)
+
+
+def check_case(case, directory, rays, seed):
+    """ Closest hits through BVH.closest_hit and through CPUTracer's BVH traversal against brute force,
+        returns the number of rays where either disagrees """
+    with contextlib.redirect_stdout(io.StringIO()):
+        scene = Scene()
+        scene.importFromFile(write_scene(case, directory), False)
+        bvh = scene.build_bvh()
+    linear = CPUTracer(*scene.pack_data(), nee=False)
+    traced = CPUTracer(*scene.pack_data(), bvh=bvh, nee=False)
+    categories = {PRIMITIVE_TYPES[category]: category for category in PRIMITIVE_TYPES}
+
+    def intersect(primitive, origin, direction):
+        primitive_type, index, _, _ = bvh.refs[primitive]
+        _, _, parameters = linear.primitives[categories[int(primitive_type)]]
+        t, _, _ = linear._intersect[categories[int(primitive_type)]](origin[None], direction[None], *(p[int(index)] for p in parameters))
+        return float(t[0]) if 0.0 < t[0] < NO_HIT else None
+
+    lo, hi, _ = primitive_bounds(scene.packed)
+    origins, directions = random_rays(np.random.default_rng(seed), rays, bvh.node_min[0], bvh.node_max[0], (lo + hi) * 0.5)
+    expected = linear.raycast(origins, directions)["distance"]
+    batched = traced.raycast(origins, directions)["distance"]
+
+    mismatches = 0
+    for ray in range(rays):
+        hit = bvh.closest_hit(origins[ray], directions[ray], intersect)
+        walked = hit[0] if hit is not None else NO_HIT
+        for distance in (walked, batched[ray]):
+            if abs(distance - expected[ray]) > TOLERANCE * max(expected[ray], 1.0):
+                mismatches += 1
+                break
+    hits = np.count_nonzero(expected < NO_HIT)
+    color = colors.FAIL if mismatches else colors.OKGREEN
+    print(f"{colors.HEADER}check_bvh{colors.ENDC} - {colors.OKBLUE}[{case.name}]{colors.ENDC} {bvh.node_count} nodes, "
+          f"{hits}/{rays} rays hit, {color}{mismatches} mismatches{colors.ENDC}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare BVH closest hits against intersecting every primitive, on random scenes and rays")
+    parser.add_argument("--rays", type=int, default=300, help="random rays per scene")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        mismatches = sum(check_case(case, directory, args.rays, args.seed + index) for index, case in enumerate(CASES))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
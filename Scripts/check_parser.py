@@ -0,0 +1,60 @@
+import contextlib
+import io
+import re
+import sys
+
+from coloredText import bcolors as colors
+from scene import Scene
+from scene_packer import PackedSceneBuilder
+
+VALID = """$material M(color = (1, 1, 1), specularColor = (1, 1, 1), roughness = 1, metalness = 0, emissive = 0, refractive = 0)
+$group G(position = (0, 0, 0), rotation = (0, 0, 0))
+sphere(position = (1, 2, 3), rotation = (0, 0, 0), size = 1, material = M)
+G:cube(position = (0, 0, 0), rotation = (0, 0, 0), size = (1, 1, 1), material = M)
+"""
+
+# every source has to stop with the "N parse error(s)" exception before the interpreter sees a broken unit
+MALFORMED = {
+    "missing comma": "sphere(position = (1, 2 3), size = 1)\n",
+    "unclosed shape": "sphere(position = (1, 2, 3), size = 1\n",
+    "unclosed shape before a valid one": "cube(position = (1, 2, 3)\nsphere(position = (0, 0, 0), size = 1)\n",
+    "unclosed vector": "sphere(position = (1, 2, 3, size = 1)\n",
+    "missing value": "sphere(position = (1, 2, 3), size = 1, material = )\n",
+    "unclosed material": "$material M(color = (1, 1, 1)\n" + VALID,
+    "bad group path": "G:(position = (0, 0, 0))\n",
+}
+PARSE_ERROR = re.compile(r"^\d+ parse error\(s\), first: ")
+
+
+def read(source):
+    """ None if source loads, else the exception it raised """
+    scene = Scene()
+    scene.builder = PackedSceneBuilder()
+    # the parser prints every error as it finds it
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            scene.PYRTManager.readSource(source)
+        except Exception as error:
+            return error
+    return None
+
+
+def report(name, passed, detail):
+    color = colors.OKGREEN if passed else colors.FAIL
+    print(f"{colors.HEADER}check_parser{colors.ENDC} - {colors.OKBLUE}[{name}]{colors.ENDC} {color}{detail}{colors.ENDC}")
+    return passed
+
+
+def main():
+    failures = 0
+    error = read(VALID)
+    failures += not report("valid", error is None, "loads" if error is None else f"{type(error).__name__}: {error}")
+    for name, source in MALFORMED.items():
+        error = read(source)
+        passed = error is not None and type(error) is Exception and PARSE_ERROR.match(str(error)) is not None
+        failures += not report(name, passed, "no error" if error is None else f"{type(error).__name__}: {error}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
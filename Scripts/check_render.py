@@ -0,0 +1,133 @@
+import argparse
+import contextlib
+import io
+import os
+import sys
+
+import numpy as np
+
+from coloredText import bcolors as colors
+
+SCENES = ("../scenes/scene.pyrt", "../scenes/towers.pyrt")
+TOLERANCE = 1e-3  # largest difference of a linear color channel
+# float32 rounding differs between NumPy and the shaders, and between the differently compiled GPU modes, so now and
+# then a path grazes past what the other render hits and the two go separate ways. Up to this share of pixels may
+# differ by more than TOLERANCE. Every bounce is another chance to part, so the renders stop after REFLECTIONS
+OUTLIERS = 0.005
+REFLECTIONS = 3
+# those few pixels barely move the mean difference, a shading change that is off everywhere or in one region does
+MEAN = 1e-3
+TILE_MEAN = 5e-3
+TILE_SIZE = 16
+
+
+def make_settings(scene, resolution, bvh):
+    """ settings.toml with everything random besides the per-pixel streams turned off, so renders are comparable """
+    from settings import Settings
+
+    settings = Settings()
+    settings.rt_scenepath = scene
+    settings.window_size = tuple(resolution)
+    settings.rt_scenecache = False
+    settings.rt_accumframes = True
+    settings.rt_roulette = False
+    settings.rt_adaptive = False
+    settings.rt_tilesize = 0
+    settings.rt_bvh = bvh
+    settings.rt_reflections = min(settings.rt_reflections, REFLECTIONS)
+    settings.app_profiler = False
+    return settings
+
+
+def gpu_image(settings, frames, backend, wavefront=False):
+    """ (height, width, 3) linear accumulation of the headless renderer, rows bottom first like every image here """
+    from headless import HeadlessRenderer
+
+    settings.rt_wavefront = wavefront
+    renderer = HeadlessRenderer(settings, backend=backend)
+    renderer.render(frames)
+    width, height = renderer.window_size
+    return np.frombuffer(renderer.accumulator_texture.read(), dtype=np.float32).reshape(height, width, 4)[..., :3]
+
+
+def cpu_image(settings, frames, workers):
+    """ Same as gpu_image with cpu_tracer, the reference for shader changes """
+    from cpu_renderer import CPURenderer
+
+    renderer = CPURenderer(settings, workers=workers)
+    try:
+        renderer.render(frames)
+    finally:
+        renderer.close()
+    return renderer.accumulated
+
+
+def tile_means(difference, size=TILE_SIZE):
+    """ Mean of difference over every size x size tile """
+    height, width = difference.shape[:2]
+    return np.array([difference[y:y + size, x:x + size].mean()
+                     for y in range(0, height, size) for x in range(0, width, size)])
+
+
+def compare(name, image, reference, tolerance, outliers=OUTLIERS, mean=MEAN, tile_mean=TILE_MEAN):
+    """ Prints the largest and mean difference and the share of pixels beyond tolerance. The images match when
+        that share is at most outliers and the mean difference over the image and over every tile
+        stays below mean and tile_mean """
+    difference = np.abs(image - reference)
+    share = np.mean(difference.max(axis=-1) > tolerance)
+    worst_tile = tile_means(difference).max()
+    matches = bool(share <= outliers
+                   and difference.mean() <= mean
+                   and worst_tile <= tile_mean)
+    color = colors.OKGREEN if matches else colors.FAIL
+    print(f"{colors.HEADER}check_render{colors.ENDC} - {colors.OKBLUE}[{name}]{colors.ENDC} "
+          f"max {difference.max():.2e} mean {difference.mean():.2e} worst tile {worst_tile:.2e} "
+          f"{color}{share:.2%} of pixels differ{colors.ENDC}")
+    return matches
+
+
+def gl_available(backend):
+    try:
+        import moderngl as mgl
+        mgl.create_standalone_context(require=430, **({"backend": backend} if backend else {})).release()
+        return True
+    except Exception as error:
+        print(f"{colors.HEADER}check_render{colors.ENDC} - {colors.WARNING}skipped{colors.ENDC}, no OpenGL 4.3 context: {error}")
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render small scenes in wavefront and megakernel mode and on the CPU and compare the images")
+    parser.add_argument("scenes", nargs="*", help="defaults to the scenes in SCENES")
+    parser.add_argument("-r", "--resolution", type=int, nargs=2, default=(64, 48), metavar=("WIDTH", "HEIGHT"), help=f"multiples of {TILE_SIZE} keep every tile whole")
+    parser.add_argument("-f", "--frames", type=int, default=2)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help=f"largest allowed difference, default {TOLERANCE}")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes of the CPU render, defaults to one per core")
+    parser.add_argument("--no-cpu", action="store_true", help="only compare the two GPU modes")
+    parser.add_argument("--backend", default="egl", help="moderngl standalone backend, pass '' for the platform default")
+    args = parser.parse_args()
+
+    scenes = [os.path.abspath(scene) for scene in args.scenes]
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    scenes = scenes or [os.path.abspath(scene) for scene in SCENES]
+    if not gl_available(args.backend):
+        return 0
+
+    failures = 0
+    for scene in scenes:
+        for bvh in (True, False):
+            name = f"{os.path.basename(scene)}{'' if bvh else ' no-bvh'}"
+            # the renderers log every step, keep the report readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                megakernel = gpu_image(make_settings(scene, args.resolution, bvh), args.frames, args.backend)
+                wavefront = gpu_image(make_settings(scene, args.resolution, bvh), args.frames, args.backend, wavefront=True)
+            failures += not compare(f"{name} wavefront", wavefront, megakernel, args.tolerance)
+            if not args.no_cpu:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    cpu = cpu_image(make_settings(scene, args.resolution, bvh), args.frames, args.workers)
+                failures += not compare(f"{name} cpu", cpu, megakernel, args.tolerance)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
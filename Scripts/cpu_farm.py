@@ -0,0 +1,131 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from bvh import BVH
+from cpu_tracer import CPUTracer
+from scene_packer import CATEGORIES
+from tiles import TileScheduler
+
+DEFAULT_TILE_SIZE = 32
+
+# state of a worker process, set once by _attach
+_shared = None
+_tracer = None
+_image = None
+
+
+class SharedArrays:
+    """ Named NumPy arrays laid out back to back in one shared memory block.
+        Only the layout is pickled to the workers, they map the same pages with attach() """
+
+    ALIGNMENT = 64
+
+    def __init__(self, arrays):
+        self.layout = {}
+        offset = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            self.layout[name] = (offset, array.dtype.str, array.shape)
+            offset += -(-array.nbytes // self.ALIGNMENT) * self.ALIGNMENT
+
+        self.memory = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        self.arrays = self._views(self.memory, self.layout)
+        for name, array in arrays.items():
+            self.arrays[name][...] = array
+
+    @staticmethod
+    def _views(memory, layout):
+        return {
+            name: np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset)
+            for name, (offset, dtype, shape) in layout.items()
+        }
+
+    @classmethod
+    def attach(cls, memory_name, layout):
+        """ (SharedMemory, arrays) of a block created in another process """
+        memory = shared_memory.SharedMemory(name=memory_name)
+        return memory, cls._views(memory, layout)
+
+    def close(self):
+        self.arrays = None
+        self.memory.close()
+        self.memory.unlink()
+
+
+def _tracer_from_arrays(arrays, roulette_depth, nee):
+    bvh = None
+    if "bvh.count" in arrays:
+        bvh = BVH(**{field.name: arrays[f"bvh.{field.name}"] for field in fields(BVH)})
+    return CPUTracer(
+        {category: arrays[f"geometry.{category}"] for category in CATEGORIES},
+        arrays["material_data"],
+        arrays["material_index_data"],
+        bvh=bvh,
+        skybox=arrays.get("skybox"),
+        roulette_depth=roulette_depth,
+        dynamic_data=({category: arrays[f"dynamic.{category}"] for category in CATEGORIES}, arrays["dynamic_material_index_data"]),
+        nee=nee,
+    )
+
+
+def _attach(memory_name, layout, roulette_depth, nee):
+    """ Pool initializer, the worker builds its tracer on views into the shared scene instead of unpickled copies """
+    global _shared, _tracer, _image
+    _shared, arrays = SharedArrays.attach(memory_name, layout)
+    _tracer = _tracer_from_arrays(arrays, roulette_depth, nee)
+    _image = arrays["image"]
+
+
+def _render_tile(size, tile, frame, samples, reflections, camera_position, camera_rotation):
+    """ Returns the raycasts the tile took """
+    x, y, width, height = tile
+    raycasts = _tracer.raycasts
+    _image[y:y + height, x:x + width] = _tracer.render_tile(size, tile, frame, samples, reflections, camera_position, camera_rotation)
+    return _tracer.raycasts - raycasts
+
+
+class CPUFarm:
+    """ Renders frames with a pool of processes, each worker traces whole tiles straight into a shared image.
+        Pixels seed their own random streams, so the result is the same for any worker count or tile size """
+
+    def __init__(self, size, geometry_data, material_data, material_index_data, bvh=None, skybox=None,
+                 workers=None, tile_size=DEFAULT_TILE_SIZE, roulette_depth=0, dynamic_data=None, nee=True):
+        self.size = tuple(size)
+        self.workers = workers or os.cpu_count()
+        self.tiles = TileScheduler(self.size, tile_size, 0).tiles
+        self.raycasts = 0
+
+        width, height = self.size
+        arrays = {f"geometry.{category}": np.asarray(geometry_data[category], dtype=np.float32) for category in CATEGORIES}
+        arrays["material_data"] = np.frombuffer(material_data, dtype=np.float32)
+        arrays["material_index_data"] = np.frombuffer(material_index_data, dtype=np.float32)
+        dynamic_geometry_data, dynamic_material_index_data = dynamic_data or ({}, b"")
+        for category in CATEGORIES:
+            arrays[f"dynamic.{category}"] = np.asarray(dynamic_geometry_data.get(category, np.empty((0, 4))), dtype=np.float32)
+        arrays["dynamic_material_index_data"] = np.frombuffer(dynamic_material_index_data, dtype=np.float32)
+        if bvh is not None:
+            arrays.update({f"bvh.{field.name}": getattr(bvh, field.name) for field in fields(BVH)})
+        if skybox is not None:
+            arrays["skybox"] = skybox
+        arrays["image"] = np.zeros((height, width, 3), dtype=np.float32)
+
+        self.shared = SharedArrays(arrays)
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_attach, initargs=(self.shared.memory.name, self.shared.layout, roulette_depth, nee))
+
+    def render_frame(self, frame, samples, reflections, camera_position, camera_rotation):
+        """ Same as CPUTracer.render_frame, returns a copy of the shared image """
+        jobs = [
+            self.pool.submit(_render_tile, self.size, tile, frame, samples, reflections, tuple(camera_position), tuple(camera_rotation))
+            for tile in self.tiles
+        ]
+        for job in jobs:
+            self.raycasts += job.result()
+        return self.shared.arrays["image"].copy()
+
+    def close(self):
+        self.pool.shutdown()
+        self.shared.close()
@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+
+import cpu_tracer
+from cpu_farm import CPUFarm, DEFAULT_TILE_SIZE
+from scene import Scene
+from image_writer import save_image
+from coloredText import bcolors as colors
+
+
+class CPURenderer:
+    """ GPU-free stand-in for HeadlessRenderer, traces the same packed scene with cpu_tracer,
+        in this process or, with more than one worker, tile by tile on a CPUFarm """
+
+    def __init__(self, settings, camera_position=None, camera_rotation=None, workers=1):
+        self.settings = settings
+        self.window_size = tuple(settings.window_size)
+        self.cameraPosition = list(camera_position) if camera_position is not None else [0, 0, 0]
+        self.cameraRotation = list(camera_rotation) if camera_rotation is not None else [0, 0]
+
+        self.scene = Scene()
+        self.scene.importFromFile(settings.rt_scenepath, settings.rt_scenecache)
+        bvh = self.scene.build_bvh() if settings.rt_bvh and self.scene.get_object_count() else None
+        roulette_depth = settings.rt_roulettedepth if settings.rt_roulette else 0
+        skybox = cpu_tracer.load_skybox(settings.rt_skyboxpath)
+        if skybox is None:
+            print(f"{colors.HEADER}CPURenderer{colors.ENDC} - {colors.WARNING}FileNotFoundError: {colors.ENDC}file {colors.OKBLUE}[{settings.rt_skyboxpath}]{colors.ENDC} doesn't exist!")
+        if workers > 1:
+            self.tracer = None
+            self.farm = CPUFarm(self.window_size, *self.scene.pack_data(), bvh=bvh, skybox=skybox,
+                                workers=workers, tile_size=settings.rt_tilesize or DEFAULT_TILE_SIZE, roulette_depth=roulette_depth,
+                                dynamic_data=self.scene.pack_dynamic_data(), nee=settings.rt_nee)
+        else:
+            self.tracer = cpu_tracer.CPUTracer(*self.scene.pack_data(), bvh=bvh, skybox=skybox, roulette_depth=roulette_depth,
+                                               dynamic_data=self.scene.pack_dynamic_data(), nee=settings.rt_nee)
+            self.farm = None
+
+        width, height = self.window_size
+        self.accumulated = np.zeros((height, width, 3), dtype=np.float32)
+        self.frames = 0
+        self.averagePathLength = 0.0
+        self.tracedSamples = 0
+        # adaptive sampling lives in the GPU accumulator, the CPU always traces every pixel
+        self.convergedFraction = 0.0
+        self.converged = False
+
+    def render(self, frame_budget, time_budget=None):
+        start = time.perf_counter()
+        width, height = self.window_size
+        previous_raycasts = (self.farm or self.tracer).raycasts
+        while self.frames < frame_budget:
+            arguments = (self.frames, self.settings.rt_samples, self.settings.rt_reflections, self.cameraPosition, self.cameraRotation)
+            if self.farm is not None:
+                current = self.farm.render_frame(*arguments)
+            else:
+                current = self.tracer.render_frame(self.window_size, *arguments)
+            self.accumulated = cpu_tracer.accumulate(self.accumulated, current, self.frames)
+            raycasts = (self.farm or self.tracer).raycasts
+            self.averagePathLength = (raycasts - previous_raycasts) / (width * height * self.settings.rt_samples)
+            previous_raycasts = raycasts
+            self.tracedSamples += width * height * self.settings.rt_samples
+            self.frames += 1
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                break
+        return time.perf_counter() - start
+
+    def save(self, path):
+        linear = np.concatenate([self.accumulated, np.ones_like(self.accumulated[..., :1])], axis=-1)
+        tonemapped = cpu_tracer.tonemap(self.accumulated, self.settings.rtfx_exposure)
+        save_image(path, tonemapped.tobytes(), linear.astype(np.float32).tobytes(), self.window_size)
+
+    def close(self):
+        if self.farm is not None:
+            self.farm.close()
@@ -0,0 +1,647 @@
+import numpy as np
+
+from scene_packer import CATEGORIES, LIGHT_CATEGORIES, PIXELS_PER_MATERIAL, PIXELS_PER_OBJECT
+
+# NumPy mirror of programs/RT.frag (and the accumulator/pygameBlit passes), float32 like the GPU.
+# Rays are traced as wavefronts: every pixel of a chunk is one ray, all of them advance one bounce
+# at a time and the ones that left the scene are compacted away after every bounce.
+
+F = np.float32
+PI = F(3.14159265)
+MISS = F(-1.0)
+NO_HIT = F(99999)
+PRIMITIVE_TYPES = {"spheres": 1, "cubes": 2, "cylinders": 3, "quads": 4}
+
+
+#----------------------------------------------------------------------------------------------------------
+# randomness, bit exact with wang_hash/RandomFloat01 so every ray makes the same choices as on the GPU
+#----------------------------------------------------------------------------------------------------------
+def random_float01(state, index):
+    """ Advances state[index] (uint32) and returns the floats, RandomFloat01 """
+    seed = state[index]
+    seed = (seed ^ np.uint32(61)) ^ (seed >> np.uint32(16))
+    seed *= np.uint32(9)
+    seed ^= seed >> np.uint32(4)
+    seed *= np.uint32(0x27d4eb2d)
+    seed ^= seed >> np.uint32(15)
+    state[index] = seed
+    return seed.astype(F) / F(4294967296.0)
+
+
+def random_unit_vector(state, index):
+    z = random_float01(state, index) * F(2.0) - F(1.0)
+    a = random_float01(state, index) * PI * F(2)
+    r = np.sqrt(F(1.0) - z * z)
+    return np.stack([r * np.cos(a), r * np.sin(a), z], axis=-1)
+
+
+#----------------------------------------------------------------------------------------------------------
+# vector helpers
+#----------------------------------------------------------------------------------------------------------
+def dot(a, b):
+    return np.sum(a * b, axis=-1)
+
+
+def cross(a, b):
+    return np.cross(a, b)
+
+
+def normalize(v):
+    return v / np.sqrt(dot(v, v))[..., None]
+
+
+def reflect(i, n):
+    return i - F(2.0) * dot(n, i)[..., None] * n
+
+
+def mix(x, y, a):
+    return x * (F(1) - a) + y * a
+
+
+def q_mul(q1, q2):
+    """ Q_rotate in RT.frag """
+    x1, y1, z1, w1 = np.moveaxis(q1, -1, 0)
+    x2, y2, z2, w2 = np.moveaxis(q2, -1, 0)
+    return np.stack([
+        (w1 * x2) + (x1 * w2) + (y1 * z2) - (z1 * y2),
+        (w1 * y2) - (x1 * z2) + (y1 * w2) + (z1 * x2),
+        (w1 * z2) + (x1 * y2) - (y1 * x2) + (z1 * w2),
+        (w1 * w2) - (x1 * x2) - (y1 * y2) - (z1 * z2),
+    ], axis=-1)
+
+
+def q_inverse(q):
+    return q * np.array([-1, -1, -1, 1], dtype=F)
+
+
+def q_rotate_v(q, v):
+    qv = np.concatenate([v, np.zeros_like(v[..., :1])], axis=-1)
+    q, qv = np.broadcast_arrays(q, qv)
+    return q_mul(q_mul(q, qv), q_inverse(q))[..., :3]
+
+
+#----------------------------------------------------------------------------------------------------------
+# intersections, every function takes (rays, 3) origins/directions and one primitive, returns (distance, hitpoint, normal)
+#----------------------------------------------------------------------------------------------------------
+def sphere_intersect(ro, rd, center, radius):
+    oc = ro - center
+    b = dot(oc, rd)
+    c = dot(oc, oc) - radius * radius
+    h = b * b - c
+    t = np.where(h < 0.0, MISS, -b - np.sqrt(np.maximum(h, 0)))
+    hitpoint = ro + rd * t[:, None]
+    return t, hitpoint, normalize(hitpoint - center)
+
+
+def box_intersect(ro, rd, position, size, rotation):
+    inverse = q_inverse(rotation)
+    qro = q_rotate_v(inverse, ro - position)
+    qrd = q_rotate_v(inverse, rd)
+
+    m = F(1.0) / qrd
+    n = m * qro
+    k = np.abs(m) * size
+    t1 = -n - k
+    t2 = -n + k
+    t_near = np.fmax(np.fmax(t1[:, 0], t1[:, 1]), t1[:, 2])
+    t_far = np.fmin(np.fmin(t2[:, 0], t2[:, 1]), t2[:, 2])
+    t = np.where((t_near > t_far) | (t_far < 0.0), MISS, t_near)
+
+    normal = np.where((t_near > 0.0)[:, None], t1 >= t_near[:, None], t_far[:, None] >= t2).astype(F)
+    normal *= -np.sign(qrd)
+    hitpoint = q_rotate_v(rotation, qro) + position + q_rotate_v(rotation, qrd) * t[:, None]
+    return t, hitpoint, q_rotate_v(rotation, normal)
+
+
+def cylinder_intersect(ro, rd, a, b, radius):
+    ba = b - a
+    oc = ro - a
+    baba = dot(ba, ba)
+    bard = dot(rd, ba)
+    baoc = dot(oc, ba)
+    k2 = baba - bard * bard
+    k1 = baba * dot(oc, rd) - baoc * bard
+    k0 = baba * dot(oc, oc) - baoc * baoc - radius * radius * baba
+    h = k1 * k1 - k2 * k0
+    hit = h >= 0.0
+    h = np.sqrt(np.maximum(h, 0))
+
+    # body
+    t = (-k1 - h) / k2
+    y = baoc + t * bard
+    body = (y > 0.0) & (y < baba)
+    body_normal = (oc + t[:, None] * rd - ba * y[:, None] / baba) / radius
+
+    # caps
+    t_cap = (np.where(y < 0.0, F(0.0), baba) - baoc) / bard
+    cap = np.abs(k1 + k2 * t_cap) < h
+    cap_normal = ba * np.sign(y)[:, None] / np.sqrt(baba)
+
+    t = np.where(hit & body, t, np.where(hit & cap, t_cap, MISS))
+    normal = np.where(body[:, None], body_normal, cap_normal)
+    return t, ro + rd * t[:, None], normal
+
+
+def quad_intersect(ro, rd, a, b, c, d):
+    normal = normalize(cross(c - a, c - b))
+    flip = (dot(normal, rd) > 0.0)[:, None]
+    normal = np.where(flip, -normal, normal)
+    a, d = np.where(flip, d, a), np.where(flip, a, d)
+    b, c = np.where(flip, c, b), np.where(flip, b, c)
+
+    p = ro
+    pq = (ro + rd) - p
+    pa = a - p
+    pb = b - p
+    pc = c - p
+    pd = d - p
+
+    m = cross(pc, pq)
+    v = dot(pa, m)
+    first = v >= 0.0
+
+    # triangle a, b, c
+    u1 = -dot(pb, m)
+    w1 = dot(cross(pq, pb), pa)
+    denom1 = F(1.0) / (u1 + v + w1)
+    position1 = (u1 * denom1)[:, None] * a + (v * denom1)[:, None] * b + (w1 * denom1)[:, None] * c
+
+    # triangle a, d, c
+    u2 = dot(pd, m)
+    w2 = dot(cross(pq, pa), pd)
+    denom2 = F(1.0) / (u2 - v + w2)
+    position2 = (u2 * denom2)[:, None] * a + (-v * denom2)[:, None] * d + (w2 * denom2)[:, None] * c
+
+    missed = np.where(first, (u1 < 0.0) | (w1 < 0.0), (u2 < 0.0) | (w2 < 0.0))
+    position = np.where(first[:, None], position1, position2)
+
+    axis = np.where(np.abs(rd[:, 0]) > 0.1, 0, np.where(np.abs(rd[:, 1]) > 0.1, 1, 2))
+    rows = np.arange(len(rd))
+    dist = (position[rows, axis] - ro[rows, axis]) / rd[rows, axis]
+
+    t = np.where(missed | ~(dist > 0), MISS, dist)
+    return t, ro + rd * t[:, None], normal
+
+
+#----------------------------------------------------------------------------------------------------------
+# lights (next-event estimation), every function takes (rays, 3) origins and one light per ray
+#----------------------------------------------------------------------------------------------------------
+def sphere_light_cone(ro, center, radius):
+    """ sphereLightCone, (1 - cos of the cone's half angle, cone axis), 0 from inside the sphere """
+    to_center = center - ro
+    distance2 = dot(to_center, to_center)
+    radius2 = radius * radius
+    sin2 = radius2 / distance2
+    cone = np.where(distance2 <= radius2, F(0.0), sin2 / (F(1.0) + np.sqrt(np.maximum(F(1.0) - sin2, F(0.0)))))
+    return cone, to_center / np.sqrt(distance2)[:, None]
+
+
+def quad_light_areas(a, b, c, d):
+    first = F(0.5) * np.sqrt(dot(cross(b - a, c - a), cross(b - a, c - a)))
+    second = F(0.5) * np.sqrt(dot(cross(c - a, d - a), cross(c - a, d - a)))
+    return first, first + second
+
+
+def quad_light_pdf(a, b, c, d, rd, dist):
+    cos_light = np.abs(dot(normalize(cross(b - a, c - a)), rd))
+    _, area = quad_light_areas(a, b, c, d)
+    return np.where(cos_light > 1e-6, dist * dist / np.maximum(cos_light * area, F(1e-30)), F(0.0))
+
+
+def sample_sphere_light(ro, center, radius, u):
+    """ Direction inside the cone the sphere subtends, returns (direction, distance to the sphere, solid angle pdf, valid) """
+    cone, axis = sphere_light_cone(ro, center, radius)
+    cos_theta = F(1.0) - u[:, 0] * cone
+    sin_theta = np.sqrt(np.maximum(F(1.0) - cos_theta * cos_theta, F(0.0)))
+    phi = F(2) * PI * u[:, 1]
+    s = np.where(axis[:, 2] >= 0.0, F(1.0), F(-1.0))
+    a = F(-1.0) / (s + axis[:, 2])
+    b = axis[:, 0] * axis[:, 1] * a
+    tangent = np.stack([F(1.0) + s * axis[:, 0] * axis[:, 0] * a, s * b, -s * axis[:, 0]], axis=-1)
+    bitangent = np.stack([b, s + axis[:, 1] * axis[:, 1] * a, -axis[:, 1]], axis=-1)
+    rd = normalize(tangent * (np.cos(phi) * sin_theta)[:, None] + bitangent * (np.sin(phi) * sin_theta)[:, None] + axis * cos_theta[:, None])
+    dist, _, _ = sphere_intersect(ro, rd, center, radius)
+    pdf = F(1.0) / (F(2) * PI * np.where(cone > 0.0, cone, F(1.0)))
+    return rd, dist, pdf, (cone > 0.0) & (dist > 0.0)
+
+
+def sample_quad_light(ro, a, b, c, d, u):
+    """ Point uniform over the quad's area, returns (direction, distance, solid angle pdf, valid) """
+    first, area = quad_light_areas(a, b, c, d)
+    second = (u[:, 2] * area >= first)[:, None]
+    p1, p2 = np.where(second, c, b), np.where(second, d, c)
+    root = np.sqrt(u[:, 0])
+    point = a * (F(1.0) - root)[:, None] + p1 * (root * (F(1.0) - u[:, 1]))[:, None] + p2 * (root * u[:, 1])[:, None]
+    rd = point - ro
+    dist = np.sqrt(dot(rd, rd))
+    rd = rd / dist[:, None]
+    pdf = quad_light_pdf(a, b, c, d, rd, dist)
+    return rd, dist, pdf, pdf > 0.0
+
+
+def power_heuristic(pdf, other_pdf):
+    return (pdf * pdf) / (pdf * pdf + other_pdf * other_pdf)
+
+
+#----------------------------------------------------------------------------------------------------------
+# materials and sky
+#----------------------------------------------------------------------------------------------------------
+def my_refract(direction, n, N):
+    """ myrefract in RT.frag, returns (new direction, fres) """
+    dn = dot(direction, n)
+    fres = F(1.0) - np.abs(dn)
+    fres = fres * fres * fres
+    fres = F(.1) + F(.9) * fres
+    N = np.where(dn > 0.0, F(1.0) / F(N), F(N))
+    ds = direction - dn[:, None] * n
+    total = np.sqrt(dot(ds, ds)) * (F(1.0) - F(1.0) / N) > 1.0
+
+    refracted = direction - ds * (F(1.0) - F(1.0) / N)[:, None]
+    inner = F(1.0) - np.abs(dot(refracted, n))
+    inner = F(.2) + F(.8) * inner * inner * inner
+    fres = np.where(dn > 0.0, inner, fres)
+    refracted = normalize(refracted)
+
+    direction = np.where(total[:, None], reflect(direction, n), refracted)
+    return direction, np.where(total, F(1.0), fres)
+
+
+def srgb_to_linear(rgb):
+    rgb = np.clip(rgb, 0.0, 1.0)
+    return np.where(rgb < 0.04045, rgb / F(12.92), np.power((rgb + F(0.055)) / F(1.055), F(2.4)))
+
+
+def linear_to_srgb(rgb):
+    rgb = np.clip(rgb, 0.0, 1.0)
+    return np.where(rgb < 0.0031308, rgb * F(12.92), np.power(rgb, F(1.0 / 2.4)) * F(1.055) - F(0.055))
+
+
+def aces_film(x):
+    return np.clip((x * (F(2.51) * x + F(0.03))) / (x * (F(2.43) * x + F(0.59)) + F(0.14)), 0.0, 1.0)
+
+
+def tonemap(linear, exposure):
+    """ pygameBlit.frag, (..., 3) linear colors -> (..., 4) RGBA8 """
+    rgb = linear_to_srgb(aces_film(linear * F(exposure)))
+    rgba = np.concatenate([rgb, np.ones_like(rgb[..., :1])], axis=-1)
+    return np.round(rgba * 255).astype(np.uint8)
+
+
+def load_skybox(path):
+    """ (height, width, 3) float32 texels in texture row order, or None if there is no such file """
+    from PIL import Image
+
+    try:
+        image = Image.open(path).convert("RGB")
+    except FileNotFoundError:
+        return None
+    return np.asarray(image, dtype=F) / F(255)
+
+
+def sample_skybox(skybox, uv):
+    """ texture() with linear filtering and repeat wrapping """
+    height, width = skybox.shape[:2]
+    x = uv[:, 0] * width - 0.5
+    y = uv[:, 1] * height - 0.5
+    x0, y0 = np.floor(x), np.floor(y)
+    fx, fy = (x - x0)[:, None], (y - y0)[:, None]
+    x0, y0 = x0.astype(np.int64) % width, y0.astype(np.int64) % height
+    x1, y1 = (x0 + 1) % width, (y0 + 1) % height
+    top = skybox[y0, x0] * (1 - fx) + skybox[y0, x1] * fx
+    bottom = skybox[y1, x0] * (1 - fx) + skybox[y1, x1] * fx
+    return top * (1 - fy) + bottom * fy
+
+
+def skybox_color(skybox, rd):
+    uv = np.stack([F(0.5) + np.arctan2(rd[:, 0], rd[:, 2]) / (F(2) * PI),
+                   F(0.5) + np.arcsin(np.clip(-rd[:, 1], -1, 1)) / PI], axis=-1)
+    if skybox is None:
+        stripes = np.maximum(np.sin(uv[:, 0] * 100) * 100 * np.cos(uv[:, 1] * 100) * 100, 0)
+        return np.stack([stripes, np.zeros_like(stripes), stripes], axis=-1)
+    return sample_skybox(skybox, uv)
+
+
+#----------------------------------------------------------------------------------------------------------
+# tracer
+#----------------------------------------------------------------------------------------------------------
+class CPUTracer:
+    """ Traces the buffers Scene.pack_data produces the way RT.frag does, optionally through the scene BVH """
+
+    def __init__(self, geometry_data, material_data, material_index_data, bvh=None, skybox=None, wavefront_size=1 << 20,
+                 roulette_depth=0, dynamic_data=None, nee=True):
+        self.primitives = self._unpack(geometry_data, 0)
+        geometry_count = sum(count for _, count, _ in self.primitives.values())
+        material_indices = np.frombuffer(material_index_data, dtype=F)
+
+        # Scene.pack_dynamic_data, traced linearly after the static geometry and numbered after it like in RT_common.glsl
+        self.dynamic = {}
+        if dynamic_data is not None:
+            dynamic_geometry_data, dynamic_material_index_data = dynamic_data
+            self.dynamic = self._unpack(dynamic_geometry_data, geometry_count)
+            material_indices = np.concatenate([material_indices, np.frombuffer(dynamic_material_index_data, dtype=F)])
+
+        self.materials = np.frombuffer(material_data, dtype=F).reshape(-1, PIXELS_PER_MATERIAL, 4)
+        self.material_indices = material_indices.astype(np.int64)
+        self.bvh = bvh
+        self.skybox = skybox
+        self.wavefront_size = wavefront_size
+        self.roulette_depth = roulette_depth
+        self.raycasts = 0  # statRaycasts in RT.frag
+
+        self._intersect = {
+            "spheres": sphere_intersect,
+            "cubes": box_intersect,
+            "cylinders": cylinder_intersect,
+            "quads": quad_intersect,
+        }
+        self._categories_by_type = {PRIMITIVE_TYPES[c]: c for c in CATEGORIES}
+        self._build_lights(geometry_count + sum(count for _, count, _ in self.dynamic.values()), nee)
+
+    @staticmethod
+    def _unpack(geometry_data, geometry_offset):
+        """ category -> (geometry index of the first object, object count, intersection parameters) """
+        primitives = {}
+        for category in CATEGORIES:
+            pixels = np.asarray(geometry_data[category], dtype=F).reshape(-1, PIXELS_PER_OBJECT[category], 4)
+            match category:
+                case "spheres":
+                    parameters = (pixels[:, 0, :3], pixels[:, 0, 3])
+                case "cubes":
+                    parameters = (pixels[:, 0, :3], pixels[:, 1, :3], pixels[:, 2])
+                case "cylinders":
+                    parameters = (pixels[:, 0, :3], pixels[:, 1, :3], pixels[:, 1, 3])
+                case "quads":
+                    parameters = (pixels[:, 0, :3], pixels[:, 1, :3], pixels[:, 2, :3], pixels[:, :3, 3])
+            primitives[category] = (geometry_offset, len(pixels), parameters)
+            geometry_offset += len(pixels)
+        return primitives
+
+    def _build_lights(self, geometry_count, nee):
+        """ PackedScene.lights from the unpacked scene: every emissive sphere and quad in geometry order, as
+            (type, geometry index, 12 floats of sphere center and radius or quad vertices). u_light_count is 0 without nee """
+        emissive = self.materials[:, 2, 2] > 0
+        types, geometry, parameters = [], [], []
+        for primitives in (self.primitives, self.dynamic):
+            for category in LIGHT_CATEGORIES:
+                if category not in primitives:
+                    continue
+                offset, count, category_parameters = primitives[category]
+                indices = np.flatnonzero(emissive[self.material_indices[offset:offset + count]])
+                rows = np.zeros((len(indices), 12), dtype=F)
+                if category == "spheres":
+                    rows[:, :3], rows[:, 3] = category_parameters[0][indices], category_parameters[1][indices]
+                else:
+                    rows[:] = np.concatenate([p[indices] for p in category_parameters], axis=1)
+                types.append(np.full(len(indices), PRIMITIVE_TYPES[category]))
+                geometry.append(offset + indices)
+                parameters.append(rows)
+
+        self.light_type = np.concatenate(types) if nee else np.empty(0, dtype=np.int64)
+        self.light_geometry = np.concatenate(geometry) if nee else np.empty(0, dtype=np.int64)
+        self.light_parameters = np.concatenate(parameters) if nee else np.empty((0, 12), dtype=F)
+        self.light_of_geometry = np.full(geometry_count, -1, dtype=np.int64)
+        self.light_of_geometry[self.light_geometry] = np.arange(len(self.light_geometry))
+
+    def _light_pdf(self, light, ro, rd, dist):
+        """ lightPdf, the solid angle pdf of _sample_lights choosing rd """
+        pdf = np.zeros(len(light), dtype=F)
+        parameters = self.light_parameters[light]
+        spheres = self.light_type[light] == PRIMITIVE_TYPES["spheres"]
+        cone, _ = sphere_light_cone(ro[spheres], parameters[spheres, :3], parameters[spheres, 3])
+        pdf[spheres] = np.where(cone > 0.0, F(1.0) / (F(2) * PI * np.where(cone > 0.0, cone, F(1.0))), F(0.0))
+        quads = ~spheres
+        pdf[quads] = quad_light_pdf(*(parameters[quads, i:i + 3] for i in (0, 3, 6, 9)), rd[quads], dist[quads])
+        return pdf / F(len(self.light_type))
+
+    def _emission_weight(self, geometry, ro, rd, hitpoint, bsdf_pdf):
+        """ emissionWeight, MIS weight of emission found by bounce rays """
+        weight = np.ones(len(geometry), dtype=F)
+        light = self.light_of_geometry[geometry]
+        mis = (bsdf_pdf > 0.0) & (light >= 0)
+        if mis.any():
+            offset = hitpoint[mis] - ro[mis]
+            pdf = self._light_pdf(light[mis], ro[mis], rd[mis], np.sqrt(dot(offset, offset)))
+            weight[mis] = power_heuristic(bsdf_pdf[mis], pdf)
+        return weight
+
+    def _sample_lights(self, ro, normal, state, index):
+        """ sampleLights for the rays index that took a diffuse bounce from ro, before multiplying by their throughput """
+        light_count = len(self.light_type)
+        light = np.minimum((random_float01(state, index) * F(light_count)).astype(np.int64), light_count - 1)
+        u = np.stack([random_float01(state, index), random_float01(state, index), random_float01(state, index)], axis=-1)
+
+        rd = np.zeros_like(ro)
+        dist = np.zeros(len(ro), dtype=F)
+        pdf = np.zeros(len(ro), dtype=F)
+        valid = np.zeros(len(ro), dtype=bool)
+        parameters = self.light_parameters[light]
+        spheres = self.light_type[light] == PRIMITIVE_TYPES["spheres"]
+        quads = ~spheres
+        rd[spheres], dist[spheres], pdf[spheres], valid[spheres] = sample_sphere_light(
+            ro[spheres], parameters[spheres, :3], parameters[spheres, 3], u[spheres])
+        rd[quads], dist[quads], pdf[quads], valid[quads] = sample_quad_light(
+            ro[quads], *(parameters[quads, i:i + 3] for i in (0, 3, 6, 9)), u[quads])
+
+        cos_theta = dot(normal, rd)
+        lit = np.flatnonzero(valid & (cos_theta > 0.0))
+        lit = lit[~self.occluded(ro[lit], rd[lit], dist[lit] - F(0.001))]
+
+        radiance = np.zeros_like(ro)
+        pdf = pdf[lit] / F(light_count)
+        bsdf_pdf = cos_theta[lit] / PI
+        emitter = self.materials[self.material_indices[self.light_geometry[light[lit]]]]
+        radiance[lit] = emitter[:, 0, :3] * emitter[:, 2, 2][:, None] * ((bsdf_pdf / pdf) * power_heuristic(pdf, bsdf_pdf))[:, None]
+        return radiance
+
+    #------------------------------------------------------------------------------------------------------
+    def _intersect_primitive(self, category, index, ro, rd, hit, primitives=None):
+        """ Tests one primitive against the rays, keeping the closest hit like intersectPrimitive """
+        geometry_offset, _, parameters = (primitives or self.primitives)[category]
+        t, hitpoint, normal = self._intersect[category](ro, rd, *(p[index] for p in parameters))
+        closer = (t > 0.0) & (t < hit["distance"])
+        hit["distance"][closer] = t[closer]
+        hit["point"][closer] = hitpoint[closer]
+        hit["normal"][closer] = normal[closer]
+        hit["geometry"][closer] = geometry_offset + index
+
+    def _raycast_linear(self, ro, rd, hit, primitives=None):
+        primitives = primitives or self.primitives
+        for category in CATEGORIES:
+            for index in range(primitives[category][1]):
+                self._intersect_primitive(category, index, ro, rd, hit, primitives)
+
+    def _raycast_bvh(self, ro, rd, hit):
+        """ Every node is visited once with the subset of rays that reach it before their current closest hit """
+        bvh = self.bvh
+        inv_rd = F(1.0) / np.where(rd == 0.0, F(1e-20), rd)
+        stack = [(0, np.arange(len(ro)))]
+        while stack:
+            node, rays = stack.pop()
+            t1 = (bvh.node_min[node].astype(F) - ro[rays]) * inv_rd[rays]
+            t2 = (bvh.node_max[node].astype(F) - ro[rays]) * inv_rd[rays]
+            t_near = np.maximum(np.minimum(t1, t2).max(axis=1), 0.0)
+            t_far = np.maximum(t1, t2).min(axis=1)
+            rays = rays[(t_near <= t_far) & (t_near < hit["distance"][rays])]
+            if len(rays) == 0:
+                continue
+
+            count = bvh.count[node]
+            first = bvh.left_first[node]
+            if count == 0:
+                stack.append((first + 1, rays))
+                stack.append((first, rays))
+                continue
+
+            sub_hit = {key: value[rays] for key, value in hit.items()}
+            for primitive in bvh.order[first:first + count]:
+                primitive_type, index, geometry_index, _ = bvh.refs[primitive]
+                category = self._categories_by_type[int(primitive_type)]
+                self._intersect_primitive(category, int(geometry_index) - self.primitives[category][0], ro[rays], rd[rays], sub_hit)
+            for key, value in sub_hit.items():
+                hit[key][rays] = value
+
+    def raycast(self, ro, rd, max_dist=NO_HIT):
+        hit = {
+            "distance": np.broadcast_to(np.asarray(max_dist, dtype=F), len(ro)).copy(),
+            "point": np.zeros_like(ro),
+            "normal": np.zeros_like(ro),
+            "geometry": np.full(len(ro), -1, dtype=np.int64),
+        }
+        if self.bvh is not None and self.bvh.node_count > 0:
+            self._raycast_bvh(ro, rd, hit)
+        else:
+            self._raycast_linear(ro, rd, hit)
+        if self.dynamic:
+            self._raycast_linear(ro, rd, hit, self.dynamic)
+        return hit
+
+    def occluded(self, ro, rd, max_dist):
+        """ occluded() for shadow rays: any primitive closer than max_dist. Starting the closest hit search at max_dist
+            already culls every BVH node beyond it, which is most of the saving of an any-hit query in a wavefront """
+        return self.raycast(ro, rd, max_dist)["geometry"] >= 0
+
+    #------------------------------------------------------------------------------------------------------
+    def trace_sample(self, ro, rd, state, reflections):
+        """ rayTraceSample for a wavefront of rays, state is advanced in place """
+        color = np.zeros_like(ro)
+        ray_color = np.ones_like(ro)
+        bsdf_pdf = np.zeros(len(ro), dtype=F)  # of the last bounce if it was diffuse, see shadeHit
+        alive = np.arange(len(ro))
+
+        for bounce in range(reflections):
+            if len(alive) == 0:
+                break
+            hit = self.raycast(ro[alive], rd[alive])
+            self.raycasts += len(alive)
+            missed = hit["distance"] >= NO_HIT
+
+            # no hit, the sky ends the path
+            escaped = alive[missed]
+            color[escaped] += srgb_to_linear(skybox_color(self.skybox, rd[escaped])) * ray_color[escaped]
+
+            rays = alive[~missed]
+            hitpoint = hit["point"][~missed]
+            normal = hit["normal"][~missed]
+            material = self.materials[self.material_indices[hit["geometry"][~missed]]]
+            albedo, specular_color = material[:, 0, :3], material[:, 1, :3]
+            roughness, metalness, emissive, refractive = material[:, 2].T
+
+            weight = self._emission_weight(hit["geometry"][~missed], ro[rays], rd[rays], hitpoint, bsdf_pdf[rays])
+            color[rays] += albedo * emissive[:, None] * ray_color[rays] * weight[:, None]
+            bsdf_pdf[rays] = 0.0
+
+            direction = rd[rays]
+            origin = hitpoint + normal * F(0.001)
+            refract_dir, fres = my_refract(direction, normal, 1.333)
+            choice = random_float01(state, rays)
+            refract = choice * refractive > fres
+
+            # refract
+            index = rays[refract]
+            diffuse = normalize(normal[refract] + random_unit_vector(state, index))
+            new_direction = np.empty_like(direction)
+            new_direction[refract] = mix(refract_dir[refract], diffuse, roughness[refract][:, None])
+            origin[refract] = hitpoint[refract] + refract_dir[refract] * F(0.001)
+            ray_color[index] *= albedo[refract]
+
+            # reflect
+            reflect_mask = ~refract
+            index = rays[reflect_mask]
+            do_specular = (random_float01(state, index) < metalness[reflect_mask]).astype(F)[:, None]
+            diffuse = normalize(normal[reflect_mask] + random_unit_vector(state, index))
+            specular = reflect(direction[reflect_mask], normal[reflect_mask])
+            rough = roughness[reflect_mask][:, None]
+            specular = normalize(mix(specular, diffuse, rough * rough))
+            new_direction[reflect_mask] = mix(diffuse, specular, do_specular)
+            ray_color[index] *= mix(albedo[reflect_mask], specular_color[reflect_mask], do_specular)
+
+            # next-event estimation from the diffuse bounces, except the last one which isn't traced
+            if len(self.light_type) and bounce + 1 < reflections:
+                diffuse_mask = np.flatnonzero(reflect_mask)[do_specular[:, 0] == 0.0]
+                index = rays[diffuse_mask]
+                color[index] += self._sample_lights(origin[diffuse_mask], normal[diffuse_mask], state, index) * ray_color[index]
+                bsdf_pdf[index] = np.maximum(dot(normal[diffuse_mask], new_direction[diffuse_mask]), F(0.0)) / PI
+
+            ro[rays] = origin
+            rd[rays] = new_direction
+            alive = rays
+
+            # russianRoulette
+            if 0 < self.roulette_depth <= bounce + 1 < reflections:
+                survival = np.minimum(ray_color[alive].max(axis=1), F(1.0))
+                survived = random_float01(state, alive) < survival
+                alive = alive[survived]
+                ray_color[alive] /= survival[survived][:, None]
+        return color
+
+    def render_pixels(self, size, pixel, frame, samples, reflections, camera_position, camera_rotation):
+        """ RT.frag for the given flat pixel indices (y * width + x), (len(pixel), 3) float32.
+            Every pixel seeds its own random stream, so the result doesn't depend on how the image is split up """
+        width, height = size
+        resolution = np.array([width, height], dtype=F)
+        aspect = resolution / resolution[1]
+        x, y = (pixel % width).astype(np.uint32), (pixel // width).astype(np.uint32)
+
+        state = (x * np.uint32(1973) + y * np.uint32(9277) + np.uint32(frame) * np.uint32(26699)) | np.uint32(1)
+        everything = np.arange(len(pixel))
+        jitter = (np.stack([random_float01(state, everything), random_float01(state, everything)], axis=-1) - F(0.5)) / resolution
+
+        uv = (np.stack([x, y], axis=-1).astype(F) + F(0.5)) / resolution
+        norm_uv = (uv + jitter - F(0.5)) * aspect
+        direction = normalize(np.stack([np.full(len(pixel), F(0.7)), norm_uv[:, 1], norm_uv[:, 0]], axis=-1))
+
+        # ray.direction.xy *= rotate(u_mousePos.y); ray.direction.zx *= rotate(u_mousePos.x);
+        s, c = F(np.sin(camera_rotation[1])), F(np.cos(camera_rotation[1]))
+        dx, dy = direction[:, 0].copy(), direction[:, 1].copy()
+        direction[:, 0], direction[:, 1] = dx * c - dy * s, dx * s + dy * c
+        s, c = F(np.sin(camera_rotation[0])), F(np.cos(camera_rotation[0]))
+        dz, dx = direction[:, 2].copy(), direction[:, 0].copy()
+        direction[:, 2], direction[:, 0] = dz * c - dx * s, dz * s + dx * c
+
+        color = np.zeros((len(pixel), 3), dtype=F)
+        for _ in range(samples):
+            origin = np.broadcast_to(np.asarray(camera_position, dtype=F), direction.shape).copy()
+            color += self.trace_sample(origin, direction.copy(), state, reflections)
+        return color / F(samples)
+
+    def render_tile(self, size, tile, frame, samples, reflections, camera_position, camera_rotation):
+        """ tile: (x, y, width, height) in GL pixel coordinates, returns (height, width, 3) """
+        x, y, tile_width, tile_height = tile
+        pixel = ((np.arange(y, y + tile_height) * size[0])[:, None] + np.arange(x, x + tile_width)).reshape(-1)
+        color = np.empty((len(pixel), 3), dtype=F)
+        for start in range(0, len(pixel), self.wavefront_size):
+            chunk = slice(start, start + self.wavefront_size)
+            color[chunk] = self.render_pixels(size, pixel[chunk], frame, samples, reflections, camera_position, camera_rotation)
+        return color.reshape(tile_height, tile_width, 3)
+
+    def render_frame(self, size, frame, samples, reflections, camera_position, camera_rotation):
+        """ One RT pass, (height, width, 3) float32 in GL row order (bottom row first) """
+        return self.render_tile(size, (0, 0, *size), frame, samples, reflections, camera_position, camera_rotation)
+
+
+def accumulate(accumulated, current, frame):
+    """ accumulator.frag """
+    if frame == 0:
+        return current
+    weight = F(1.0) / F(frame + 1)
+    return mix(accumulated, current, weight)
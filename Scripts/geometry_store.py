@@ -0,0 +1,169 @@
+import numpy as np
+
+# one record per primitive, byte for byte the RGBA32F pixels RT.frag reads (see scene_packer.GEOMETRY_ROWS),
+# so a store's buffer is uploaded as it is and the named fields are columnar views into it
+GEOMETRY_DTYPES = {
+    'spheres': np.dtype([
+        ('position', '<f4', 3), ('radius', '<f4'),                                           # 1
+        ('rotation', '<f4', 4),                                                              # 2
+    ]),
+    'cubes': np.dtype([
+        ('position', '<f4', 3), ('_pad0', '<f4'),                                            # 1
+        ('size',     '<f4', 3), ('_pad1', '<f4'),                                            # 2
+        ('rotation', '<f4', 4),                                                              # 3
+    ]),
+    'cylinders': np.dtype([
+        ('top',      '<f4', 3), ('_pad0', '<f4'),                                            # 1
+        ('bottom',   '<f4', 3), ('radius', '<f4'),                                           # 2
+        ('rotation', '<f4', 4),                                                              # 3
+    ]),
+    'quads': np.dtype([
+        ('a', '<f4', 3), ('d_x', '<f4'),                                                     # 1
+        ('b', '<f4', 3), ('d_y', '<f4'),                                                     # 2
+        ('c', '<f4', 3), ('d_z', '<f4'),                                                     # 3
+        ('rotation', '<f4', 4),                                                              # 4
+    ]),
+}
+
+# flat float offsets of every vertex and of the rotation quaternion inside a record
+VERTEX_COMPONENTS = {
+    'spheres':   [[0, 1, 2]],
+    'cubes':     [[0, 1, 2]],
+    'cylinders': [[0, 1, 2], [4, 5, 6]],
+    'quads':     [[0, 1, 2], [4, 5, 6], [8, 9, 10], [3, 7, 11]],
+}
+ROTATION_COMPONENTS = {
+    'spheres':   [4, 5, 6, 7],
+    'cubes':     [8, 9, 10, 11],
+    'cylinders': [8, 9, 10, 11],
+    'quads':     [12, 13, 14, 15],
+}
+
+
+class DirtyRanges:
+    """ Indices changed since the last take(), handed out as coalesced [start, stop) runs """
+
+    def __init__(self):
+        self._indices = set()
+
+    def __bool__(self):
+        return bool(self._indices)
+
+    def add(self, index):
+        self._indices.add(int(index))
+
+    def update(self, indices):
+        self._indices.update(int(index) for index in indices)
+
+    def take(self):
+        runs = []
+        for index in sorted(self._indices):
+            if runs and runs[-1][1] == index:
+                runs[-1][1] += 1
+            else:
+                runs.append([index, index + 1])
+        self._indices.clear()
+        return [tuple(run) for run in runs]
+
+
+class GeometryStore:
+    """ Columnar storage of one primitive type: a growable record array in the GPU layout
+        plus the index of every primitive's material in the scene material table """
+
+    def __init__(self, category, capacity=64, records=None, material_ids=None):
+        self.category = category
+        self.dtype = GEOMETRY_DTYPES[category]
+        if records is None:
+            self._records = np.zeros(capacity, dtype=self.dtype)
+            self._material_ids = np.zeros(capacity, dtype=np.int32)
+            self.count = 0
+        else:
+            self._records = records
+            self._material_ids = material_ids
+            self.count = len(records)
+        # records edited in place since the last upload, see Renderer.updateScene
+        self.dirty = DirtyRanges()
+
+    @classmethod
+    def from_pixels(cls, category, pixels, material_ids):
+        """ Wraps already packed (n * pixels per object, 4) float32 pixels, e.g. a memory mapped cache, without copying """
+        return cls(category, records=pixels.reshape(-1).view(GEOMETRY_DTYPES[category]), material_ids=material_ids)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, record, material_id):
+        """ record: the flat float row of the primitive in pixel order (a scalar fills the whole record) """
+        if self.count == len(self._records):
+            self._grow()
+        self._records.view(np.float32).reshape(len(self._records), -1)[self.count] = record
+        self._material_ids[self.count] = material_id
+        self.count += 1
+
+    def set(self, index, material_id=None, **fields):
+        """ Overwrites named fields (and the material) of one record in place and marks it dirty """
+        if not 0 <= index < self.count:
+            raise IndexError(f"{self.category} index {index} out of range ({self.count} objects)")
+        for name, value in fields.items():
+            self._records[name][index] = value
+        if material_id is not None:
+            self._material_ids[index] = material_id
+        self.dirty.add(index)
+
+    def _grow(self):
+        capacity = max(len(self._records) * 2, 64)
+        records = np.zeros(capacity, dtype=self.dtype)
+        material_ids = np.zeros(capacity, dtype=np.int32)
+        records[:self.count] = self._records[:self.count]
+        material_ids[:self.count] = self._material_ids[:self.count]
+        self._records, self._material_ids = records, material_ids
+
+    @property
+    def records(self):
+        return self._records[:self.count]
+
+    @property
+    def material_ids(self):
+        return self._material_ids[:self.count]
+
+    @property
+    def pixels(self):
+        """ (count * pixels per object, 4) float32 view, ready for texture upload """
+        return self.records.view(np.float32).reshape(-1, 4)
+
+    @property
+    def rows(self):
+        """ (count, floats per record) float32 view """
+        return self.records.view(np.float32).reshape(self.count, -1)
+
+    def column(self, name):
+        return self.records[name]
+
+    @property
+    def rotations(self):
+        return self.records['rotation']
+
+    @property
+    def vertices(self):
+        """ (count, vertex count, 3) vertex positions, a view except for quads whose 4th vertex is spread over the alpha channels """
+        records = self.records
+        match self.category:
+            case 'spheres' | 'cubes':
+                return records['position'][:, None]
+            case 'cylinders':
+                pixels = self.pixels.reshape(self.count, -1, 4)
+                return pixels[:, :2, :3]
+            case 'quads':
+                pixels = self.pixels.reshape(self.count, -1, 4)
+                return np.concatenate([pixels[:, :3, :3], pixels[:, None, :3, 3]], axis=1)
+
+    @property
+    def sizes(self):
+        """ sphere/cylinder radius or cube extents, quads have none """
+        match self.category:
+            case 'spheres' | 'cylinders':
+                return self.records['radius']
+            case 'cubes':
+                return self.records['size']
+            case 'quads':
+                return None
@@ -0,0 +1,64 @@
+import time
+
+import moderngl as mgl
+
+from renderer import Renderer
+from shader_program import enable_disk_cache
+from image_writer import save_image
+
+
+class HeadlessRenderer(Renderer):
+    """ Offline renderer, drives the same RT -> accumulator -> pygameBlit passes as the App without a window """
+
+    def __init__(self, settings, camera_position=None, camera_rotation=None, backend="egl"):
+        self.settings = settings
+        self.window_size = tuple(settings.window_size)
+        self.ctx = self.createContext(backend)
+
+        self.startSceneLoad()
+        self.initShaders()
+        self.initVAO()
+        self.initTextures()
+        self.initScene()
+        self.initCamera()
+        if camera_position is not None:
+            self.cameraPosition = list(camera_position)
+        if camera_rotation is not None:
+            self.cameraRotation = list(camera_rotation)
+        self.initUniforms()
+
+        self.output_texture = self.ctx.texture(self.window_size, components=4)
+        self.output_FBO = self.ctx.framebuffer(self.output_texture)
+        self.frames = 0
+
+    def createContext(self, backend):
+        version = self.settings.gl_version[0] * 100 + self.settings.gl_version[1] * 10
+        kwargs = {"backend": backend} if backend else {}
+        if self.settings.app_shaderCache:
+            enable_disk_cache(self.settings.app_shaderCache)
+        # software GL (llvmpipe) tops out at 4.5, the shaders only need 4.3
+        return mgl.create_standalone_context(require=min(version, 430), **kwargs)
+
+    def render(self, frame_budget, time_budget=None):
+        """ Accumulates up to frame_budget frames, stopping early once time_budget seconds have passed
+            or adaptive sampling has converged """
+        start = time.perf_counter()
+        while self.frames < frame_budget:
+            self.profiler.begin_frame()
+            if self.renderFrame():
+                self.frames += 1
+            self.ctx.finish()
+            self.profiler.end_frame()
+            if self.converged:
+                break
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                break
+
+        self.output_FBO.use()
+        self.screen_surface.render()
+        self.ctx.finish()
+        self.profiler.flush()
+        return time.perf_counter() - start
+
+    def save(self, path):
+        save_image(path, self.output_texture.read(), self.accumulator_texture.read(), self.window_size)
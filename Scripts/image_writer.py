@@ -0,0 +1,59 @@
+import struct
+
+import numpy as np
+
+
+def save_png(path, rgba8, size):
+    """ rgba8: bytes read from an RGBA8 texture (bottom row first, as GL stores it) """
+    from PIL import Image
+
+    image = Image.frombytes("RGBA", tuple(size), rgba8)
+    image.transpose(Image.Transpose.FLIP_TOP_BOTTOM).save(path)
+
+
+def save_exr(path, rgba32f, size):
+    """ Writes an uncompressed, single part, scanline OpenEXR file with 32-bit float RGBA channels.
+        rgba32f: bytes read from an RGBA32F texture (bottom row first, as GL stores it) """
+    width, height = size
+    pixels = np.frombuffer(rgba32f, dtype=np.float32).reshape(height, width, 4)[::-1]
+
+    def attribute(name, type_name, data):
+        return name.encode() + b'\0' + type_name.encode() + b'\0' + struct.pack('<i', len(data)) + data
+
+    channel_names = "ABGR"  # channels are stored in alphabetical order
+    channels = b''.join(name.encode() + b'\0' + struct.pack('<iB3xii', 2, 0, 1, 1) for name in channel_names) + b'\0'
+    window = struct.pack('<iiii', 0, 0, width - 1, height - 1)
+
+    header = b''.join([
+        struct.pack('<ii', 20000630, 2),  # magic number, version 2 single part scanline
+        attribute("channels", "chlist", channels),
+        attribute("compression", "compression", b'\0'),
+        attribute("dataWindow", "box2i", window),
+        attribute("displayWindow", "box2i", window),
+        attribute("lineOrder", "lineOrder", b'\0'),
+        attribute("pixelAspectRatio", "float", struct.pack('<f', 1.0)),
+        attribute("screenWindowCenter", "v2f", struct.pack('<ff', 0.0, 0.0)),
+        attribute("screenWindowWidth", "float", struct.pack('<f', 1.0)),
+        b'\0',
+    ])
+
+    # every scanline block: y, byte count, then each channel's row in channel order
+    line_size = width * 4 * len(channel_names)
+    lines = np.ascontiguousarray(pixels[..., [3, 2, 1, 0]].transpose(0, 2, 1)).astype('<f4')
+    first_block = len(header) + 8 * height
+    offsets = first_block + np.arange(height, dtype='<u8') * (8 + line_size)
+
+    with open(path, 'wb') as file:
+        file.write(header)
+        file.write(offsets.astype('<u8').tobytes())
+        for y in range(height):
+            file.write(struct.pack('<ii', y, line_size))
+            file.write(lines[y].tobytes())
+
+
+def save_image(path, tonemapped_rgba8, linear_rgba32f, size):
+    """ .exr keeps the linear HDR accumulation, anything else gets the tonemapped LDR image """
+    if path.lower().endswith(".exr"):
+        save_exr(path, linear_rgba32f, size)
+    else:
+        save_png(path, tonemapped_rgba8, size)
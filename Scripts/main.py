@@ -1,211 +1,46 @@
-import moderngl as mgl
 import moderngl_window as mglw
-import pygame as pg
-from numpy import cos, pi, sin
-from numpy.random import rand
+from math import cos, pi, sin
+from time import monotonic
 
-from scene import Scene
-from shader_program import ShaderProgram
-from TOMLParser import TOMLParser
-from VAO import VAO
-from GUI import ImGUIManager
-from coloredText import bcolors as colors
+from renderer import Renderer
+from settings import Settings
+from shader_program import enable_disk_cache
 
+HOT_RELOAD_INTERVAL = 0.25  # seconds between two checks of the shader files for changes
 
-class Settings:
-    TOMLParser = TOMLParser()
-    TOMLParser.loadConfig("../settings.toml")
 
-    gl_version = TOMLParser.getValue("settings", "WINDOW/GLversion")
-    title = TOMLParser.getValue("settings", "WINDOW/title")
-    window_size = TOMLParser.getValue("settings", "WINDOW/resolution")
-    resizable = TOMLParser.getValue("settings", "WINDOW/resizable")
-
-    rt_samples = TOMLParser.getValue("settings", "RT/samples")
-    rt_reflections = TOMLParser.getValue("settings", "RT/reflections")
-    rt_accumframes = TOMLParser.getValue("settings", "RT/accumframes")
-    rt_skyboxpath = TOMLParser.getValue("settings", "RT/skyboxpath")
-    rt_scenepath = TOMLParser.getValue("settings", "RT/scenepath")
-
-    rtfx_exposure = TOMLParser.getValue("settings", "RTFX/exposure")
-
-    app_shaderPath = TOMLParser.getValue("settings", "APP/shaderPath")
+class App(Renderer, mglw.WindowConfig):
+    # set by configure() when the app is run, importing main doesn't read settings.toml
+    settings = None
+    resizable = False
 
+    @classmethod
+    def configure(cls, settings):
+        """ run_window_config reads the window options off the class, before any App exists """
+        cls.settings = settings
+        cls.gl_version = settings.gl_version
+        cls.title = settings.title
+        cls.window_size = settings.window_size
 
-class App(mglw.WindowConfig):
-    settings = Settings()
-    gl_version = settings.gl_version
-    title = settings.title
-    window_size = settings.window_size
-    resizable = False
-    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
+        # the scene is imported in the background, on_render shows a placeholder until it's in
+        self.startSceneLoad()
         self.initShaders()
         self.initVAO()
         self.initTextures()
-        self.initScene()
         self.initCamera()
         self.initUniforms()
-        
-
-        self.gui = ImGUIManager(self)
-        self.frames = 0
-    
-    def initShaders(self):
-        resourcePath = self.settings.app_shaderPath
-
-        if not resourcePath:
-            print(f"{colors.HEADER}initShaders{colors.ENDC} - {colors.FAIL}PathNotFound{colors.ENDC} - Terminating!")
-            exit()
-
-        self.shaders = ShaderProgram(self.ctx, resourcePath)
-        self.shaders.load_program("pygameBlit")
-        self.shaders.load_program("RT")
-        self.shaders.load_program("accumulator")
-
-        print(f"{colors.HEADER}initShaders{colors.ENDC} - {colors.OKGREEN}Success{colors.ENDC}")
-
-    def initVAO(self):
-        self.vao = VAO(self.ctx)
-        self.screen_surface = self.vao.get_quadfs(self.shaders.programs["pygameBlit"])
-        self.RT_surface = self.vao.get_quadfs(self.shaders.programs["RT"])
-        self.accumulator_surface = self.vao.get_quadfs(self.shaders.programs["accumulator"])
-        print(f"{colors.HEADER}initSurfaces{colors.ENDC} - {colors.OKGREEN}Success{colors.ENDC}")
-
-    def initTextures(self):
-        self.RT_render_texture = self.ctx.texture(self.window_size, components=4, dtype="f4")
-        self.RT_FBO = self.ctx.framebuffer(self.RT_render_texture, self.ctx.depth_renderbuffer(self.window_size))
-
-        self.accumulator_texture = self.ctx.texture(self.window_size, components=4, dtype="f4")
-        self.accumulator_FBO = self.ctx.framebuffer(self.accumulator_texture, self.ctx.depth_renderbuffer(self.window_size))
-
-        self.geometry_texture = self.ctx.texture((1, 1), components=4, dtype="f4")
-        self.material_texture = self.ctx.texture((1, 1), components=4, dtype="f4")
-
-        self.maskybox_texture = self.ctx.texture((1, 1), components=4, dtype='f4')
-        print(f"{colors.HEADER}initTextures{colors.ENDC} - {colors.OKGREEN}Success{colors.ENDC}")
-
-    def initScene(self):
-        self.scene = Scene()
-        self.scene.importFromFile(self.settings.rt_scenepath)
-        self.createScene()
-        self.createSkybox()
-
-    def initUniforms(self):
-        self.set_uniform("accumulator", "currentFrame", 1)
-        self.RT_render_texture.use(location=1)
-
-        self.set_uniform("pygameBlit", "rtTexture", 5)
-        self.set_uniform("accumulator", "accumFrame", 5)
-        self.accumulator_texture.use(location=5)
-
-        self.set_uniform("RT", "u_geometry_texture", 2)
-        self.geometry_texture.use(location=2)
-
-        self.set_uniform("RT", "u_material_texture", 3)
-        self.material_texture.use(location=3)
-        self.set_uniform("RT", "u_resolution", (self.window_size[0], self.window_size[1]))
-        
-        self.set_uniform("RT", "u_skybox_texture", 4)
-
-        self.updateRTuniforms()
-        self.updateRTFXuniforms()
-        self.updateCameraUniforms()
-
-        print(f"{colors.HEADER}initUniforms{colors.ENDC} - {colors.OKGREEN}Success{colors.ENDC}")
-
-    def initCamera(self):
-        self.allowCameraTranslation = False
-        self.cameraRotation = [0,0]
-        self.cameraPosition = [0,0,0]
-        self.tempDir = [0,0,0]
 
-
-    def createScene(self):
-        self.frames = 0
-        self.geometry_texture.release()
-        self.material_texture.release()
-
-        geometry_data, material_data = self.scene.pack_data()
-
-        geometry_pixel_count = self.scene.get_object_count(in_pixels=True)
-        material_pixel_count = self.scene.get_material_pixel_count()
-        geometry_count = self.scene.get_object_count()
-        
-        self.set_uniform("RT", "u_geometry_count", geometry_count)
-        self.set_uniform("RT", "u_geometry_pixel_count", geometry_pixel_count)
-        
-        self.geometry_texture = self.ctx.texture(
-            (geometry_pixel_count, 1), 
-            components=4, 
-            dtype="f4", 
-            data=geometry_data
-        )
-
-        self.material_texture = self.ctx.texture(
-            (material_pixel_count, 1), 
-            components=4, 
-            dtype="f4", 
-            data=material_data
-        )
-
-        self.geometry_texture.use(location=2)
-        self.material_texture.use(location=3)
-
-        sphere_count = self.scene.get_object_count(count_category="spheres")
-        cube_count = self.scene.get_object_count(count_category="cubes")
-        cylinder_count = self.scene.get_object_count(count_category="cylinders")
-        quad_count = self.scene.get_object_count(count_category="quads")
-        
-        self.set_uniform("RT", "u_sphere_count", sphere_count)
-        self.set_uniform("RT", "u_cube_count", cube_count)
-        self.set_uniform("RT", "u_cylinder_count", cylinder_count)
-        self.set_uniform("RT", "u_quad_count", quad_count)
-        
-        print(f"{colors.HEADER}createScene - {colors.OKGREEN}Success{colors.ENDC}")
-
-    def createSkybox(self):
-        self.frames = 0
-        self.maskybox_texture.release()
-
-        try:
-            f = open(self.settings.rt_skyboxpath, "r")
-            self.set_uniform("RT", "u_skybox_type", 1)
-        except FileNotFoundError:
-            self.set_uniform("RT", "u_skybox_type", 0)
-            print(f"{colors.HEADER}createSkybox{colors.ENDC} - {colors.WARNING}FileNotFoundError: {colors.ENDC}file {colors.OKBLUE}[{self.settings.rt_skyboxpath}]{colors.ENDC} doesn't exist!")
-            return       
-
-        skyboxPath = self.settings.rt_skyboxpath
-        skybox = pg.image.load(skyboxPath)
-
-        self.maskybox_texture = self.ctx.texture(
-            size=skybox.get_size(),
-            components=3,
-            data=pg.image.tostring(skybox, "RGB"),
-        )
-
-        self.maskybox_texture.use(location=4)
-
-        print(f"{colors.HEADER}createSkybox - {colors.OKGREEN}Success{colors.ENDC}")
-
-
-    def updateRTuniforms(self):
-        self.frames = 0
-        
-        self.set_uniform("RT", "u_max_samples", self.settings.rt_samples)
-        self.set_uniform("RT", "u_max_reflections", self.settings.rt_reflections)
-    
-    def updateRTFXuniforms(self):
-        self.set_uniform("pygameBlit", "u_exposure", self.settings.rtfx_exposure)
-
-    def updateCameraUniforms(self):
+        # imgui is imported and set up with the scene, the first frames don't wait for it
+        self.gui = None
         self.frames = 0
+        self.nextShaderCheck = 0.0
 
-        self.set_uniform("RT", "u_cameraPos", self.cameraPosition)
-        self.set_uniform("RT", "u_mousePos", self.cameraRotation)
+    def initGUI(self):
+        from GUI import ImGUIManager
+        self.gui = ImGUIManager(self)
 
     def updateCameraPosition(self):
         yaw = self.cameraRotation[0]
@@ -231,6 +66,11 @@ class App(mglw.WindowConfig):
         self.cameraPosition[2] += -diry/5
 
     def update(self):
+        # every check stats each shader file and include, a few times a second is enough to notice a save
+        if self.settings.app_hotReload and monotonic() >= self.nextShaderCheck:
+            self.nextShaderCheck = monotonic() + HOT_RELOAD_INTERVAL
+            self.reloadShaders()
+        self.updateScene()
         if self.allowCameraTranslation:
             self.frames = 0
             self.updateCameraPosition()
@@ -239,50 +79,58 @@ class App(mglw.WindowConfig):
         
 
     def on_render(self, time, delta_time):
+        if self.sceneLoad is not None:
+            if not self.sceneLoad.done():
+                self.ctx.screen.clear(0.05, 0.05, 0.05)
+                return
+            self.initScene()
+            if self.gui is None:
+                self.initGUI()
+
+        self.profiler.begin_frame()
         self.update()
 
         # Render modernGL
-        # Render RT
-
-        self.set_uniform("RT", "u_frame", self.frames)
-        self.set_uniform("accumulator", "frame", self.frames)
-        self.RT_FBO.use()
-        self.RT_surface.render()
-
-        # Accumulate frames
-
-        self.accumulator_FBO.use()
-        self.accumulator_surface.render()
+        frameDone = self.renderFrame()
 
         # Tonemap and display
 
         self.ctx.screen.use()
-        self.screen_surface.render()
-        self.gui.render()
+        with self.profiler.measure("tonemap"):
+            self.screen_surface.render()
+        with self.profiler.measure("gui"):
+            self.gui.render()
+        self.profiler.end_frame()
 
-        self.frames = self.frames + 1 if self.settings.rt_accumframes else 0
+        if frameDone:
+            self.frames = self.frames + 1 if self.settings.rt_accumframes else 0
 
 
     def on_mouse_position_event(self, x, y, dx, dy):
-        self.gui.imgui.mouse_position_event(x, y, dx, dy)
+        if self.gui is not None:
+            self.gui.imgui.mouse_position_event(x, y, dx, dy)
 
     def on_mouse_drag_event(self, x, y, dx, dy):
-        self.gui.imgui.mouse_drag_event(x, y, dx, dy)
+        if self.gui is not None:
+            self.gui.imgui.mouse_drag_event(x, y, dx, dy)
 
         if self.allowCameraTranslation:
             self.cameraRotation[0] += dx * 0.0174533/9
             self.cameraRotation[1] += dy * 0.0174533/9
 
     def on_mouse_scroll_event(self, x_offset, y_offset):
-        self.gui.imgui.mouse_scroll_event(x_offset, y_offset)
+        if self.gui is not None:
+            self.gui.imgui.mouse_scroll_event(x_offset, y_offset)
 
     def on_mouse_press_event(self, x, y, button):
-        self.gui.imgui.mouse_press_event(x, y, button)
+        if self.gui is not None:
+            self.gui.imgui.mouse_press_event(x, y, button)
         if button == 3:
             self.allowCameraTranslation = True
 
     def on_mouse_release_event(self, x: int, y: int, button: int):
-        self.gui.imgui.mouse_release_event(x, y, button)
+        if self.gui is not None:
+            self.gui.imgui.mouse_release_event(x, y, button)
         if button == 3:
             self.allowCameraTranslation = False
 
@@ -299,7 +147,7 @@ class App(mglw.WindowConfig):
             elif key == self.wnd.keys.A:   self.tempDir[1] = -1
 
 
-            if key == self.wnd.keys.M: self.gui.isHidden = not self.gui.isHidden
+            if key == self.wnd.keys.M and self.gui is not None: self.gui.isHidden = not self.gui.isHidden
 
         elif action == self.wnd.keys.ACTION_RELEASE:
             
@@ -308,15 +156,12 @@ class App(mglw.WindowConfig):
             if key == self.wnd.keys.D or key == self.wnd.keys.A:    self.tempDir[1] = 0
        
     def on_unicode_char_entered(self, char):
-        self.gui.imgui.unicode_char_entered(char)
-
-
-    def set_uniform(self, shader_name, uniform_name, value):
-        try:
-            self.shaders.programs[shader_name][uniform_name] = value
-        except KeyError:
-            print(f"{colors.HEADER}setUniform - {colors.WARNING}KeyError{colors.ENDC}: uniform {colors.OKBLUE}[{shader_name}]{colors.OKCYAN}[{uniform_name}]{colors.ENDC} is not used in the shader!")
+        if self.gui is not None:
+            self.gui.imgui.unicode_char_entered(char)
 
 
 if __name__ == "__main__":
+    App.configure(Settings())
+    if App.settings.app_shaderCache:
+        enable_disk_cache(App.settings.app_shaderCache)
     mglw.run_window_config(App)
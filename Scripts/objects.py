@@ -1,6 +1,7 @@
 from dataclasses import dataclass, field
 from typing import ClassVar
 
+from transforms import world_matrix
 from util import Quaternion, Vector3, Transform
 
 
@@ -33,17 +34,12 @@ class Group:
         if parent != None:
             self.rotation = parent.rotation.hamilton(self.rotation)
 
-            #rotate
-            v = Quaternion(x=self.position.x, y=self.position.y, z=self.position.z, w=0)
-            pointQ = (parent.rotation.hamilton(v)).hamilton(parent.rotation.inverted())
-            point = Vector3(pointQ.x, pointQ.y, pointQ.z)
-            #translate
-            point += parent.position
-            self.position = point
-
-            
+            # the parent's world matrix already holds its whole chain
+            point = parent.worldMatrix @ (self.position.x, self.position.y, self.position.z, 1)
+            self.position = Vector3(*point[:3].tolist())
 
         self.parent = parent
+        self.worldMatrix = world_matrix(self.position, self.rotation)
 
 
 @dataclass
@@ -73,24 +69,31 @@ class Geometry:
         self.group = None
         self.assignGroup(g)
     
-    def rotatePointAround(self, point, pivot, quat):
+    @staticmethod
+    def rotatePointAround(point, pivot, quat):
         local_v = point - pivot
         v_q = Quaternion(x = local_v.x, y = local_v.y, z = local_v.z, w = 0)
         rotated_v_q = (quat.hamilton(v_q)).hamilton(quat.inverted())
         rotated_local_v = Vector3(x = rotated_v_q.x, y = rotated_v_q.y, z = rotated_v_q.z)
         rotated_v = rotated_local_v + pivot
         return rotated_v
-            
+
+    @staticmethod
+    def bakeGroupTransform(vertices, rotation, group):
+        """ World space vertices and rotation of a shape in group, without creating a Geometry """
+        if group == None:
+            return vertices, rotation
+
+        medianVecGeometry = sum(vertices) / len(vertices)
+        baked = []
+        for vertex in vertices:
+            rotated_v = Geometry.rotatePointAround(vertex, medianVecGeometry, rotation)
+            rotated_local_v = Geometry.rotatePointAround(Vector3(rotated_v.x, rotated_v.y, rotated_v.z), Vector3(0,0,0), group.rotation)
+
+            v = Vector3(rotated_local_v.x, rotated_local_v.y, rotated_local_v.z)
+            baked.append(v + group.position)
+        return baked, group.rotation.hamilton(rotation)
 
     def assignGroup(self, group):
-        if group != None: 
-            medianVecGeometry = sum(self.vertices) / len(self.vertices)
-            for i,vertex in enumerate(self.vertices):
-                rotated_v = self.rotatePointAround(vertex, medianVecGeometry, self.rotation)
-                rotated_local_v = self.rotatePointAround(Vector3(rotated_v.x, rotated_v.y, rotated_v.z), Vector3(0,0,0), group.rotation)
-                
-                v = Vector3(rotated_local_v.x, rotated_local_v.y, rotated_local_v.z)
-                point = v + group.position
-                self.vertices[i] = point
-            self.rotation = group.rotation.hamilton(self.rotation)  
-        self.group = group
\ No newline at end of file
+        self.vertices, self.rotation = self.bakeGroupTransform(self.vertices, self.rotation, group)
+        self.group = group
@@ -0,0 +1,130 @@
+import csv
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+
+RING_SIZE = 4   # frames between issuing a frame's queries and reading them
+HISTORY = 600   # frames kept for the panel and the exported trace
+# moderngl reads results with glGetQueryObjectuiv, which clamps anything past ~4.3 s (or a broken reading) to this
+SATURATED = 0xFFFFFFFF
+
+
+class GPUProfiler:
+    """ GPU time of every render pass from GL_TIME_ELAPSED queries, plus CPU frame time and throughput, one record per frame.
+        Every frame uses its own slot of a ring of queries and a slot is only read when it comes round again,
+        RING_SIZE - 1 frames later, when the GPU has long finished it, so reading never stalls the pipeline.
+        Time-elapsed queries can't nest, measured passes must not overlap """
+
+    def __init__(self, ctx, enabled=False, ring_size=RING_SIZE, history=HISTORY):
+        self.ctx = ctx
+        self.enabled = enabled
+        self.active = False
+        self.ring = [{"queries": {}, "pending": None} for _ in range(ring_size)]
+        self.slot = 0
+        self.used = {}
+        self.records = deque(maxlen=history)
+        self.frame = 0
+        self.frame_start = 0.0
+        self.samples = 0
+        self.raycasts = 0
+
+    def begin_frame(self):
+        """ Switching enabled on or off takes effect here, never halfway through a frame """
+        self.active = self.enabled
+        self.frame_start = time.perf_counter()
+
+    @contextmanager
+    def measure(self, name):
+        if not self.active:
+            yield
+            return
+        queries = self.ring[self.slot]["queries"].setdefault(name, [])
+        used = self.used.get(name, 0)
+        if used == len(queries):
+            queries.append(self.ctx.query(time=True))
+        self.used[name] = used + 1
+        with queries[used]:
+            yield
+
+    def count(self, samples, raycasts):
+        """ Work finished during this frame, the renderer reports it once per accumulated frame """
+        self.samples += samples
+        self.raycasts += raycasts
+
+    def end_frame(self):
+        if not self.active:
+            return
+        end = time.perf_counter()
+        self.ring[self.slot]["pending"] = {
+            "frame": self.frame,
+            "time": end,
+            "cpu_ms": (end - self.frame_start) * 1e3,
+            "samples": self.samples,
+            "raycasts": self.raycasts,
+            "used": self.used,
+        }
+        self.slot = (self.slot + 1) % len(self.ring)
+        self.collect(self.ring[self.slot])
+        self.used = {}
+        self.frame += 1
+        self.samples = self.raycasts = 0
+
+    def collect(self, slot):
+        pending = slot["pending"]
+        if pending is None:
+            return
+        gpu_ms = {}
+        for name, count in pending.pop("used").items():
+            elapsed = [query.elapsed for query in slot["queries"][name][:count]]
+            if SATURATED not in elapsed:
+                gpu_ms[name] = sum(elapsed) / 1e6
+        pending["gpu_ms"] = gpu_ms
+        self.records.append(pending)
+        slot["pending"] = None
+
+    def flush(self):
+        """ Reads every frame still in the ring, waiting for the GPU if it has to (e.g. at the end of a headless render) """
+        for offset in range(1, len(self.ring) + 1):
+            self.collect(self.ring[(self.slot + offset) % len(self.ring)])
+
+    def summary(self, frames=None):
+        """ Averages over the last frames records (all by default): GPU ms per pass, CPU ms, samples and raycasts per second """
+        records = list(self.records)[-frames:] if frames else list(self.records)
+        if not records:
+            return {"frames": 0, "gpu_ms": {}, "cpu_ms": 0.0, "samples_per_sec": 0.0, "rays_per_sec": 0.0}
+        passes, counts = {}, {}
+        for record in records:
+            for name, elapsed in record["gpu_ms"].items():
+                passes[name] = passes.get(name, 0.0) + elapsed
+                counts[name] = counts.get(name, 0) + 1
+        # the first record only marks where the measured time starts
+        span = records[-1]["time"] - records[0]["time"]
+        later = records[1:]
+        return {
+            "frames": len(records),
+            "gpu_ms": {name: total / counts[name] for name, total in passes.items()},
+            "cpu_ms": sum(record["cpu_ms"] for record in records) / len(records),
+            "samples_per_sec": sum(record["samples"] for record in later) / span if span > 0 else 0.0,
+            "rays_per_sec": sum(record["raycasts"] for record in later) / span if span > 0 else 0.0,
+        }
+
+    def export(self, path):
+        """ Writes the recorded frames as a JSON trace, or as a CSV table (one gpu_<pass> column per pass) if path ends in .csv """
+        records = list(self.records)
+        if path.lower().endswith(".csv"):
+            passes = sorted({name for record in records for name in record["gpu_ms"]})
+            with open(path, "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(["frame", "time", "cpu_ms", "samples", "raycasts"] + [f"gpu_{name}_ms" for name in passes])
+                for record in records:
+                    writer.writerow([record["frame"], f"{record['time']:.6f}", f"{record['cpu_ms']:.4f}", record["samples"], record["raycasts"]]
+                                    + [f"{record['gpu_ms'][name]:.4f}" if name in record["gpu_ms"] else "" for name in passes])
+        else:
+            with open(path, "w") as file:
+                json.dump({
+                    "renderer": self.ctx.info["GL_RENDERER"],
+                    "version": self.ctx.info["GL_VERSION"],
+                    "summary": self.summary(),
+                    "frames": records,
+                }, file, indent=1)
@@ -20,17 +20,25 @@ class PYRTManager:
         }
 
     def readFile(self, file):
-        lexer = Lexer()
+        source = ""
         try:
             with open(file, 'r') as file:
-                lexer.set_src(file.read())
+                source = file.read()
         except FileNotFoundError:
             assert "FileNotFound", "FileNotFound"
-        
+        self.readSource(source)
+
+    def readSource(self, source):
+        lexer = Lexer()
+        lexer.set_src(source)
+
+        # tokens, units and shapes stream through one at a time, no full AST is ever held
         self.parser.set_lexer(lexer)
-        parsed = self.parser.parse()
-        self.interpreter.interpret(parsed)
+        self.interpreter.interpret_units(self.parser.iter_units())
+        errors = self.parser.errors
         self.parser.clear()
+        if errors:
+            raise Exception(f"{len(errors)} parse error(s), first: {errors[0]}")
 
 a = 1
 b = a or 0
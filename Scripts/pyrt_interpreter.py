@@ -136,7 +136,11 @@ class Interpreter:
             return {k: cls.eval(i, d[k]) for k in d}
 
     def interpret(self, f: File):
+        self.interpret_units(f.units)
+
+    def interpret_units(self, units: Iterable[Unit]):
+        """ Runs units one by one as they come, e.g. straight from Parser.iter_units """
         self._clear()
         do = Interpreter.Switcher.do
-        for u in f.units:
+        for u in units:
             do(self, u)
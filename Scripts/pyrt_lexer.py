@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from enum import Enum, auto
+from typing import Optional
 import re
 
 class TokenType(Enum):
@@ -27,7 +28,7 @@ class TokenType(Enum):
     EOF = auto()
 
 
-@dataclass(repr=True)
+@dataclass(repr=True, slots=True)
 class Token:
     type: TokenType
     source: str
@@ -46,8 +47,8 @@ TOKEN_TO_TOKEN_TYPE = {
     r"\*": TokenType.STAR,
     r"/": TokenType.SLASH,
 
-    r"#.*$": TokenType.COMMENT,
-    r"-?\d+(\.\d*)?": TokenType.NUMBER,
+    r"#[^\n]*": TokenType.COMMENT,
+    r"-?\d+(?:\.\d*)?": TokenType.NUMBER,
 
     r"\$material": TokenType.MATERIAL,
     r"\$group": TokenType.GROUP,
@@ -64,106 +65,85 @@ if set(TokenType) != set(TOKEN_TO_TOKEN_TYPE.values()):
     raise Exception(f"Number of token types is not the same to size of 'TOKEN_TO_TOKEN_TYPE', "
                     f"difference: {', '.join(map(str, set(TokenType).difference(TOKEN_TO_TOKEN_TYPE.values())))}")
 
+# Every token gets a named group (the TokenType name) in one master pattern, tried in table order.
+# Leading spaces/tabs are eaten by the same match, anything else that matches nothing ends up in the
+# catch-all bad token group. Trailing whitespace of the source matches as an empty END group.
+_BAD = "BAD"
+_END = "END"
+_MASTER_RE = re.compile("[ \t]*(?:" + '|'.join(
+    [f"(?P<{token_type.name}>{token})" for token, token_type in TOKEN_TO_TOKEN_TYPE.items()
+     if token_type not in (TokenType.NEWLINE, TokenType.EOF)]
+    + [rf"(?P<{TokenType.NEWLINE.name}>\n)", f"(?P<{_BAD}>.)", f"(?P<{_END}>$)"]
+) + ")")
+_GROUP_TO_TOKEN_TYPE = {token_type.name: token_type for token_type in TokenType}
+
+
 class Lexer:
     def __init__(self):
-        pattern = '|'.join(map(lambda x: f"({x})", TOKEN_TO_TOKEN_TYPE))
-        #print(pattern)
-        self._re = re.compile(pattern)
-        self._src_lines: list[str] = []
-        self._line_no = 0
-        self._symbol_no = 0
+        self._src = ""
+        self._tokens = None
+        self._peeked: Optional[Token] = None
 
     def clear(self):
-        self._line_no = 0
-        self._symbol_no = 0
+        self._tokens = self._tokenize()
+        self._peeked = None
 
     def set_src(self, s: str):
-        self._src_lines = s.split("\n")
+        self._src = s
+        self.clear()
+
+    def _tokenize(self):
+        """ Lazily scans the whole source in one pass, line numbers and spans are per line """
+        src = self._src
+        line_no = 0
+        line_start = 0
+        group_to_token_type = _GROUP_TO_TOKEN_TYPE
+        newline = TokenType.NEWLINE
+
+        for match in _MASTER_RE.finditer(src):
+            group = match.lastgroup
+            token_type = group_to_token_type.get(group)
+            if token_type is None:
+                if group == _END:
+                    break
+                start = match.start(group)
+                line_end = src.find("\n", start)
+                raise ValueError(f"bad token at '{src[start:line_end if line_end != -1 else len(src)]}'")
+
+            # the token group is always the last part of the match
+            start = match.start(group)
+            end = match.end()
+            yield Token(token_type, src[start:end], (start - line_start, end - line_start), line_no)
+
+            if token_type is newline:
+                line_no += 1
+                line_start = end
+
+        # the last line ends with a NEWLINE as well, whether or not the source does
+        column = len(src) - line_start
+        yield Token(TokenType.NEWLINE, "\n", (column, column + 1), line_no)
 
-    @staticmethod
-    def _token_to_token_type(t: str):
-        if (tp := TOKEN_TO_TOKEN_TYPE.get(t)) is not None:
-            return tp
-        for i in TOKEN_TO_TOKEN_TYPE.keys():
-            if re.match(i, t):
-                return TOKEN_TO_TOKEN_TYPE[i]
+        while True:
+            yield Token(TokenType.EOF, "", (0, 0), line_no + 1)
 
     def token_iter(self):
-        while True:
+        if self._peeked is not None:
             yield (t := self.next_token())  # Don't remove brackets
+            if t.type == TokenType.EOF:
+                return
+        for t in self._tokens:
+            yield t
             if t.type == TokenType.EOF:
                 break
 
     # see token
     def see_next_token(self):
-        if self._line_no >= len(self._src_lines):
-            return Token(TokenType.EOF, "", (0, 0), self._line_no)
-        curr_line = self._src_lines[self._line_no][self._symbol_no:]
-
-        def do_if_empty():
-            line_no = self._line_no
-            sym_no = self._symbol_no
-
-            self._line_no += 1
-            self._symbol_no = 0
-            return Token(TokenType.NEWLINE, "\n", (sym_no, sym_no + 1), line_no)
-
-        if curr_line == "":
-            return do_if_empty()
-
-        while curr_line and curr_line[0] in (" ", "\t"):
-            self._symbol_no += 1
-            curr_line = curr_line[1:]
-
-        if curr_line == "":
-            return do_if_empty()
-
-        result = self._re.match(curr_line)
-        size = result.span()[1]
-
-        if size == 0:
-            raise ValueError(f"bad token at '{curr_line}'")
-
-        token = result.group()
-        token_type = self._token_to_token_type(token)
-
-        r = Token(token_type, token, (self._symbol_no, self._symbol_no + size), self._line_no)
-
-        return r
+        if self._peeked is None:
+            self._peeked = next(self._tokens)
+        return self._peeked
 
     def next_token(self):
-        if self._line_no >= len(self._src_lines):
-            return Token(TokenType.EOF, "", (0, 0), self._line_no)
-        curr_line = self._src_lines[self._line_no][self._symbol_no:]
-
-        def do_if_empty():
-            line_no = self._line_no
-            sym_no = self._symbol_no
-
-            self._line_no += 1
-            self._symbol_no = 0
-            return Token(TokenType.NEWLINE, "\n", (sym_no, sym_no + 1), line_no)
-
-        if curr_line == "":
-            return do_if_empty()
-
-        while curr_line and curr_line[0] in (" ", "\t"):
-            self._symbol_no += 1
-            curr_line = curr_line[1:]
-
-        if curr_line == "":
-            return do_if_empty()
-
-        result = self._re.match(curr_line)
-        size = result.span()[1]
-
-        if size == 0:
-            raise ValueError(f"bad token at '{curr_line}'")
-
-        token = result.group()
-        token_type = self._token_to_token_type(token)
-
-        r = Token(token_type, token, (self._symbol_no, self._symbol_no + size), self._line_no)
-
-        self._symbol_no += size
-        return r
\ No newline at end of file
+        if self._peeked is not None:
+            token, self._peeked = self._peeked, None
+            return token
+        return next(self._tokens)
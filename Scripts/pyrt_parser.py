@@ -107,6 +107,24 @@ class Parser:
         self.push_error(e)
         return False
 
+    def iter_units(self):
+        """ Parses lazily, yielding every unit as soon as its line is done. After the first error the rest
+            is only parsed to collect its errors in self.errors, no more units are yielded, since they
+            could name the material or group a broken line was meant to declare. Check self.errors once
+            the generator is exhausted """
+        self.clear()
+        self.advance()
+        while not self.check(TokenType.EOF):
+            errors = len(self.errors)
+            res = self.parse_line()
+            if len(self.errors) > errors:
+                # a half parsed unit would reach the interpreter with missing arguments
+                if not self.check(TokenType.EOF):
+                    self.skip_to_next_line()
+                continue
+            if res and not self.errors:
+                yield res
+
     def parse_body(self) -> list[Unit]:
         r = []
         while not self.check(TokenType.EOF):
@@ -165,7 +183,7 @@ class Parser:
     def parse_shape(self):
         path = self.parse_path()
         exprs = self.parse_brackets_with_args()
-        if path is None and exprs is None:
+        if path is None or exprs is None:
             return None
 
         bracket_tok = self.prev()
@@ -0,0 +1,110 @@
+import argparse
+import os
+import time
+
+from coloredText import bcolors as colors
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Render a .pyrt scene offline, without opening a window.")
+    parser.add_argument("scene", help="path to a .pyrt scene")
+    parser.add_argument("-o", "--output", default="render.png", help="output image, .png or .exr (linear HDR)")
+    parser.add_argument("-r", "--resolution", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"), help="defaults to [WINDOW] resolution")
+    parser.add_argument("-s", "--samples", type=int, help="samples per pixel per frame, defaults to [RT] samples")
+    parser.add_argument("--reflections", type=int, help="defaults to [RT] reflections")
+    parser.add_argument("--roulette-depth", type=int, help="bounces before russian roulette, 0 turns it off, defaults to [RT] roulettedepth")
+    parser.add_argument("-f", "--frames", type=int, default=64, help="number of frames to accumulate")
+    parser.add_argument("-t", "--time-budget", type=float, help="stop accumulating after this many seconds")
+    parser.add_argument("--noise-threshold", type=float, help="turn on adaptive sampling, pixels stop once their relative error is below it "
+                                                                "and the render stops once nearly all of them did")
+    parser.add_argument("--camera", type=float, nargs=3, metavar=("X", "Y", "Z"), help="camera position")
+    parser.add_argument("--rotation", type=float, nargs=2, metavar=("YAW", "PITCH"), help="camera rotation in radians")
+    parser.add_argument("--skybox", help="defaults to [RT] skyboxpath")
+    parser.add_argument("--exposure", type=float, help="defaults to [RTFX] exposure")
+    parser.add_argument("--tile-size", type=int, help="render in tiles of this many pixels, 0 renders whole frames, defaults to [RT] tilesize")
+    parser.add_argument("--wavefront", action="store_true", help="trace with the compute shader queues instead of RT.frag")
+    parser.add_argument("--no-bvh", action="store_true", help="intersect every primitive in per-type loops instead of traversing the BVH")
+    parser.add_argument("--nee", action=argparse.BooleanOptionalAction, help="sample lights directly with next-event estimation, "
+                                                                               "--no-nee finds them only with bounce rays, defaults to [RT] nee")
+    parser.add_argument("--profile", metavar="PATH", help="write per-frame GPU pass times, CPU frame time and throughput to a .json or .csv trace")
+    parser.add_argument("--backend", default="egl", help="moderngl standalone backend, pass '' for the platform default")
+    parser.add_argument("--cpu", action="store_true", help="trace on the CPU with NumPy instead of OpenGL")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes rendering tiles with --cpu, defaults to one per core")
+    args = parser.parse_args()
+    if args.profile and args.cpu:
+        parser.error("--profile times the GPU passes, it can't be combined with --cpu")
+    return args
+
+
+def main():
+    wall_start = time.perf_counter()
+    args = parse_args()
+
+    # paths in settings.toml are relative to Scripts/, the ones on the command line to the caller's directory
+    output = os.path.abspath(args.output)
+    profile = os.path.abspath(args.profile) if args.profile else None
+    scene = os.path.abspath(args.scene)
+    skybox = os.path.abspath(args.skybox) if args.skybox else None
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    # only now the renderer modules are imported, --help and argument errors don't wait for NumPy and OpenGL
+    from settings import Settings
+
+    settings = Settings()
+    settings.rt_scenepath = scene
+    settings.rt_accumframes = True
+    if skybox: settings.rt_skyboxpath = skybox
+    if args.resolution: settings.window_size = args.resolution
+    if args.samples: settings.rt_samples = args.samples
+    if args.reflections: settings.rt_reflections = args.reflections
+    if args.roulette_depth is not None:
+        settings.rt_roulette = args.roulette_depth > 0
+        settings.rt_roulettedepth = args.roulette_depth
+    if args.noise_threshold is not None:
+        settings.rt_adaptive = args.noise_threshold > 0
+        settings.rt_noisethreshold = args.noise_threshold
+    if args.exposure is not None: settings.rtfx_exposure = args.exposure
+    if args.tile_size is not None: settings.rt_tilesize = args.tile_size
+    if args.wavefront: settings.rt_wavefront = True
+    if args.no_bvh: settings.rt_bvh = False
+    if args.nee is not None: settings.rt_nee = args.nee
+
+    if profile: settings.app_profiler = True
+
+    if args.cpu:
+        from cpu_renderer import CPURenderer
+        renderer = CPURenderer(settings, args.camera, args.rotation, args.workers)
+    else:
+        from headless import HeadlessRenderer
+        renderer = HeadlessRenderer(settings, args.camera, args.rotation, args.backend)
+    # the CPU farm's worker processes and shared memory have to go even when rendering or saving fails
+    try:
+        render_time = renderer.render(args.frames, args.time_budget)
+        renderer.save(output)
+    finally:
+        if args.cpu:
+            renderer.close()
+
+    wall_time = time.perf_counter() - wall_start
+
+    print(f"{colors.HEADER}render{colors.ENDC} - {colors.OKGREEN}Success{colors.ENDC}: {colors.OKBLUE}[{output}]{colors.ENDC}")
+    print(f"    frames           {renderer.frames} ({settings.rt_samples} spp each, {renderer.frames * settings.rt_samples} spp total)")
+    print(f"    render time      {render_time:.3f} s")
+    # only samples that were traced count, not those of pixels adaptive sampling skipped
+    print(f"    samples/sec      {renderer.tracedSamples / render_time:,.0f}")
+    print(f"    avg path length  {renderer.averagePathLength:.2f} bounces (last frame)")
+    if settings.rt_adaptive:
+        print(f"    converged pixels {renderer.convergedFraction:.1%} (last frame){', stopped early' if renderer.converged else ''}")
+    if profile:
+        os.makedirs(os.path.dirname(profile), exist_ok=True)
+        renderer.profiler.export(profile)
+        summary = renderer.profiler.summary()
+        for name, elapsed in summary["gpu_ms"].items():
+            print(f"    gpu {name:<13}{elapsed:.3f} ms/frame")
+        print(f"    rays/sec         {summary['rays_per_sec']:,.0f}")
+        print(f"    profile          {profile}")
+    print(f"    total wall time  {wall_time:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,518 @@
+import struct
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bvh import BVH_PIXELS_PER_NODE
+from scene import Scene
+from profiler import GPUProfiler
+from scene_packer import CATEGORIES
+from shader_program import ShaderProgram
+from VAO import VAO
+from tiles import TileScheduler
+from uniforms import UniformCache
+from coloredText import bcolors as colors
+
+# compute passes of the wavefront mode, they read the same uniforms as RT (see set_uniform)
+WAVEFRONT_PROGRAMS = ("RT_generate", "RT_intersect", "RT_shade")
+WAVEFRONT_GROUP_SIZE = 64
+WAVEFRONT_PATH_SIZE = 112  # std430 pathStruct in RT_wavefront.glsl
+WAVEFRONT_HIT_SIZE = 32
+
+CONVERGED_PIXEL_FRACTION = 0.999
+
+# the full screen quad drawn with every vertex/fragment program
+SURFACES = {"pygameBlit": "screen_surface", "RT": "RT_surface", "accumulator": "accumulator_surface"}
+
+# SSBO bindings of the scene data, see RT_common.glsl (0-5 belong to the wavefront queues and PathStats)
+GEOMETRY_BINDINGS = {"spheres": 6, "cubes": 7, "cylinders": 8, "quads": 9}
+MATERIAL_BINDING = 10
+MATERIAL_INDEX_BINDING = 11
+BVH_BINDING = 12
+LIGHT_BINDING = 13
+
+# std140 FrameData block of frame_data.glsl: u_cameraPos, u_frame, u_mousePos
+FRAME_DATA_BINDING = 0
+FRAME_DATA = struct.Struct("<3fi2f8x")
+
+MIN_DYNAMIC_CAPACITY = 16
+
+
+def dynamic_capacity(count):
+    """ records reserved per type for dynamic shapes, doubled whenever they run out """
+    return max(MIN_DYNAMIC_CAPACITY, 1 << (count - 1).bit_length())
+
+
+class Renderer:
+    """ GL side of the app, shared by the interactive window (main.App) and the headless renderer (headless.py).
+        Expects self.ctx, self.settings and self.window_size to be set by the host class. """
+
+    def initShaders(self):
+        resourcePath = self.settings.app_shaderPath
+
+        if not resourcePath:
+            print(f"{colors.HEADER}initShaders{colors.ENDC} - {colors.FAIL}PathNotFound{colors.ENDC} - Terminating!")
+            exit()
+
+        self.shaders = ShaderProgram(self.ctx, resourcePath)
+        # GL calls of the frame being rendered by kind, only counted with [APP] countGLCalls
+        self.glCalls = Counter() if self.settings.app_countGLCalls else None
+        self.glCallsPerFrame = {}
+        self.uniforms = UniformCache(self.shaders.programs, self.glCalls)
+        self.shaders.load_program("pygameBlit")
+        self.shaders.load_program("RT")
+        self.shaders.load_program("accumulator")
+        # the compute passes are only compiled once wavefront mode is first switched on, see initWavefront
+
+        print(f"{colors.HEADER}initShaders{colors.ENDC} - {colors.OKGREEN}Success{colors.ENDC}")
+
+    def initVAO(self):
+        self.vao = VAO(self.ctx)
+        for name, surface in SURFACES.items():
+            setattr(self, surface, self.vao.get_quadfs(self.shaders.programs[name]))
+        print(f"{colors.HEADER}initSurfaces{colors.ENDC} - {colors.OKGREEN}Success{colors.ENDC}")
+
+    def initTextures(self):
+        self.RT_render_texture = self.ctx.texture(self.window_size, components=4, dtype="f4")
+        self.RT_FBO = self.ctx.framebuffer(self.RT_render_texture, self.ctx.depth_renderbuffer(self.window_size))
+
+        self.accumulator_texture = self.ctx.texture(self.window_size, components=4, dtype="f4")
+        self.moments_texture = self.ctx.texture(self.window_size, components=4, dtype="f4")
+        self.accumulator_FBO = self.ctx.framebuffer([self.accumulator_texture, self.moments_texture], self.ctx.depth_renderbuffer(self.window_size))
+
+        self.geometry_buffers = {}
+        self.dynamic_capacity = {}
+        self.material_buffer = self.storageBuffer(MATERIAL_BINDING)
+        self.material_index_buffer = self.storageBuffer(MATERIAL_INDEX_BINDING)
+        self.bvh_buffer = self.storageBuffer(BVH_BINDING)
+        self.light_buffer = self.storageBuffer(LIGHT_BINDING)
+        self.light_count = 0
+
+        self.maskybox_texture = self.ctx.texture((1, 1), components=4, dtype='f4')
+
+        self.frame_buffer = self.ctx.buffer(reserve=FRAME_DATA.size)
+        self.frame_buffer.bind_to_uniform_block(FRAME_DATA_BINDING)
+        self.frame_data = None
+
+        self.wavefront_buffers = None
+        self.path_stats_buffer = self.ctx.buffer(reserve=8)
+        self.path_stats_buffer.clear()
+        self.path_stats_buffer.bind_to_storage_buffer(5)
+        self.averagePathLength = 0.0
+        self.convergedFraction = 0.0
+        self.tracedSamples = 0  # samples actually traced since start, adaptive sampling's skipped pixels don't count
+        self.profiler = GPUProfiler(self.ctx, self.settings.app_profiler)
+        self.initTiles()
+        self.initWavefront()
+        print(f"{colors.HEADER}initTextures{colors.ENDC} - {colors.OKGREEN}Success{colors.ENDC}")
+
+    def initTiles(self):
+        tile_size = self.settings.rt_tilesize
+        self.tiles = TileScheduler(self.window_size, tile_size, self.settings.rt_tilebudget) if tile_size else None
+
+    def initWavefront(self):
+        """ Path, hit and queue buffers for the compute pipeline, only allocated while [RT] wavefront is on """
+        if self.wavefront_buffers is not None:
+            [buffer.release() for buffer in self.wavefront_buffers.values()]
+            self.wavefront_buffers = None
+        if not self.settings.rt_wavefront:
+            return
+
+        self.loadWavefrontPrograms()
+        path_count = self.window_size[0] * self.window_size[1]
+        self.wavefront_buffers = {
+            "paths": self.ctx.buffer(reserve=path_count * WAVEFRONT_PATH_SIZE),
+            "hits": self.ctx.buffer(reserve=path_count * WAVEFRONT_HIT_SIZE),
+            "queue": self.ctx.buffer(reserve=path_count * 4),
+            "nextQueue": self.ctx.buffer(reserve=path_count * 4),
+            "counters": self.ctx.buffer(reserve=5 * 4),
+        }
+
+    def loadWavefrontPrograms(self):
+        for name in WAVEFRONT_PROGRAMS + ("RT_queue",):
+            if name in self.shaders.programs:
+                continue
+            self.shaders.load_compute(name)
+            self.restoreUniforms(name)
+
+    def restoreUniforms(self, name):
+        """ Gives a newly compiled program the values set_uniform last set, the wavefront passes get the RT ones """
+        self.uniforms.restore(name, "RT" if name in WAVEFRONT_PROGRAMS else name)
+
+    def reloadShaders(self):
+        """ Recompiles every program whose source (or an include of it) was saved since it was compiled, then restores
+            the uniforms set_uniform last gave it. Scene buffers and textures stay as they are, accumulation restarts """
+        reloaded = [name for name in self.shaders.changed() if self.shaders.reload(name)]
+        for name in reloaded:
+            self.restoreUniforms(name)
+            if name in SURFACES:
+                getattr(self, SURFACES[name]).release()
+                setattr(self, SURFACES[name], self.vao.get_quadfs(self.shaders.programs[name]))
+            print(f"{colors.HEADER}reloadShaders{colors.ENDC} - {colors.OKGREEN}Success{colors.ENDC}: {colors.OKBLUE}[{name}]{colors.ENDC}")
+        if reloaded:
+            self.resetAccumulation()
+        return reloaded
+
+    def startSceneLoad(self):
+        """ Imports the scene file on a worker thread, so it overlaps the shader compiles. initScene waits for it """
+        self.scene = Scene()
+        executor = ThreadPoolExecutor(1)
+        self.sceneLoad = executor.submit(self.scene.importFromFile, self.settings.rt_scenepath, self.settings.rt_scenecache)
+        executor.shutdown(wait=False)
+
+    def initScene(self):
+        if getattr(self, "sceneLoad", None) is None:
+            self.startSceneLoad()
+        self.sceneLoad.result()
+        self.sceneLoad = None
+        self.createScene()
+        self.createSkybox()
+
+    def initUniforms(self):
+        self.set_uniform("accumulator", "currentFrame", 1)
+        self.RT_render_texture.use(location=1)
+
+        self.set_uniform("pygameBlit", "rtTexture", 5)
+        self.set_uniform("accumulator", "accumFrame", 5)
+        self.accumulator_texture.use(location=5)
+
+        self.set_uniform("RT", "u_moments_texture", 8)
+        self.set_uniform("accumulator", "accumMoments", 8)
+        self.moments_texture.use(location=8)
+        self.set_uniform("RT", "u_resolution", (self.window_size[0], self.window_size[1]))
+        
+        self.set_uniform("RT", "u_skybox_texture", 4)
+
+        self.updateRTuniforms()
+        self.updateRTFXuniforms()
+        self.updateCameraUniforms()
+
+        print(f"{colors.HEADER}initUniforms{colors.ENDC} - {colors.OKGREEN}Success{colors.ENDC}")
+
+    def initCamera(self):
+        self.allowCameraTranslation = False
+        self.cameraRotation = [0,0]
+        self.cameraPosition = [0,0,0]
+        self.tempDir = [0,0,0]
+
+
+    def storageBuffer(self, binding, data=None, reserve=0):
+        """ SSBO bound at a binding of RT_common.glsl, holding data followed by reserve free bytes.
+            An empty one still gets a few bytes since GL can't bind size 0 """
+        data = np.ascontiguousarray(data).reshape(-1).view(np.uint8) if data is not None else b""
+        buffer = self.ctx.buffer(reserve=max(len(data) + reserve, 16))
+        if len(data):
+            buffer.write(data)
+        buffer.bind_to_storage_buffer(binding)
+        return buffer
+
+    def createScene(self):
+        self.resetAccumulation()
+        packed = self.scene.packed
+        [buffer.release() for buffer in self.geometry_buffers.values()]
+        self.material_buffer.release()
+        self.material_index_buffer.release()
+
+        # the stores already hold the std430 records, every primitive type gets its own buffer with room for its dynamic ones after the static ones
+        self.dynamic_capacity = {category: dynamic_capacity(len(store)) for category, store in packed.dynamic.items()}
+        self.geometry_buffers = {
+            category: self.storageBuffer(GEOMETRY_BINDINGS[category], store.records, self.dynamic_capacity[category] * store.dtype.itemsize)
+            for category, store in packed.stores.items()
+        }
+        self.material_buffer = self.storageBuffer(MATERIAL_BINDING, packed.materials)
+        self.material_index_buffer = self.storageBuffer(MATERIAL_INDEX_BINDING, packed.material_ids, sum(self.dynamic_capacity.values()) * 4)
+        packed.materials_resized = False
+        for store in packed.stores.values():
+            store.dirty.take()
+
+        self.set_uniform("RT", "u_geometry_count", self.scene.get_object_count())
+
+        self.createBVH()
+        self.uploadDynamicGeometry()
+        self.uploadLights()
+        self.set_uniform("RT", "u_static_counts", tuple(self.scene.get_object_count(count_category=category) for category in CATEGORIES))
+
+        print(f"{colors.HEADER}createScene - {colors.OKGREEN}Success{colors.ENDC}")
+
+    def createBVH(self):
+        self.bvh_buffer.release()
+
+        if not self.settings.rt_bvh or self.scene.get_object_count() == 0:
+            self.scene.bvh = None
+            self.set_uniform("RT", "u_bvh_node_count", 0)
+            self.bvh_buffer = self.storageBuffer(BVH_BINDING)
+            return
+
+        bvh = self.scene.build_bvh()
+        self.set_uniform("RT", "u_bvh_node_count", bvh.node_count)
+        self.bvh_buffer = self.storageBuffer(BVH_BINDING, bvh.pack())
+
+        print(f"{colors.HEADER}createBVH - {colors.OKGREEN}Success{colors.ENDC}: {bvh.node_count} nodes")
+
+    def growBuffer(self, buffer, binding, keep, size):
+        """ Larger copy of a storage buffer, the first keep bytes are copied on the GPU """
+        grown = self.ctx.buffer(reserve=size)
+        if keep:
+            self.ctx.copy_buffer(grown, buffer, size=keep)
+        buffer.release()
+        grown.bind_to_storage_buffer(binding)
+        return grown
+
+    def uploadDynamicGeometry(self):
+        """ Rewrites the dynamic records behind the static ones (a few objects), growing a buffer only once its reserve runs out.
+            The static records are never sent again """
+        packed = self.scene.packed
+        for category, store in packed.dynamic.items():
+            record_size = store.dtype.itemsize
+            static_size = len(packed.stores[category]) * record_size
+            if len(store) > self.dynamic_capacity[category]:
+                self.dynamic_capacity[category] = dynamic_capacity(len(store))
+                self.geometry_buffers[category] = self.growBuffer(self.geometry_buffers[category], GEOMETRY_BINDINGS[category],
+                                                                  static_size, static_size + self.dynamic_capacity[category] * record_size)
+            if len(store):
+                self.geometry_buffers[category].write(store.records, offset=static_size)
+            store.dirty.take()
+
+        material_ids = packed.dynamic_material_ids
+        static_size = self.scene.get_object_count() * material_ids.itemsize
+        if static_size + material_ids.nbytes > self.material_index_buffer.size:
+            self.material_index_buffer = self.growBuffer(self.material_index_buffer, MATERIAL_INDEX_BINDING,
+                                                         static_size, static_size + sum(self.dynamic_capacity.values()) * material_ids.itemsize)
+        if len(material_ids):
+            self.material_index_buffer.write(material_ids, offset=static_size)
+
+        self.set_uniform("RT", "u_dynamic_counts", tuple(packed.dynamic_counts.values()))
+        packed.dynamic_resized = False
+
+    def uploadLights(self):
+        """ Rebuilds the list of emissive spheres and quads next-event estimation samples, their geometry is read from the scene buffers """
+        lights = self.scene.packed.lights()
+        self.light_buffer.release()
+        self.light_buffer = self.storageBuffer(LIGHT_BINDING, lights)
+        self.light_count = len(lights)
+        self.set_uniform("RT", "u_light_count", self.light_count if self.settings.rt_nee else 0)
+        self.scene.packed.lights_changed = False
+
+    def updateScene(self):
+        """ Uploads what Scene.edit and Scene.add_dynamic changed since the last upload. Edited records, their material ids
+            and the refit BVH nodes are written in place with buffer.write(offset=...), only a resized material table
+            reallocates its (small) buffer. Returns whether anything changed """
+        packed = self.scene.packed
+        changed = packed.materials_resized or packed.dynamic_resized or bool(self.scene.bvh_dirty)
+        lights_changed = packed.dynamic_resized or packed.lights_changed
+
+        if packed.materials_resized:
+            self.material_buffer.release()
+            self.material_buffer = self.storageBuffer(MATERIAL_BINDING, packed.materials)
+            packed.materials_resized = False
+
+        if packed.dynamic_resized:
+            self.uploadDynamicGeometry()
+        if lights_changed:
+            self.uploadLights()
+
+        geometry_count = self.scene.get_object_count()
+        for stores, dynamic in ((packed.stores, False), (packed.dynamic, True)):
+            for category, store in stores.items():
+                # dynamic records sit behind the static ones of their type, their geometry indices behind all static ones
+                first_record = len(packed.stores[category]) if dynamic else 0
+                first_object = packed.object_offset(category, dynamic) + (geometry_count if dynamic else 0)
+                for start, stop in store.dirty.take():
+                    self.geometry_buffers[category].write(store.records[start:stop], offset=(first_record + start) * store.dtype.itemsize)
+                    material_ids = store.material_ids[start:stop]
+                    self.material_index_buffer.write(material_ids, offset=(first_object + start) * material_ids.itemsize)
+                    changed = True
+
+        bvh = self.scene.bvh
+        for start, stop in self.scene.bvh_dirty.take():
+            pixels = bvh.node_pixels(start, stop)
+            self.bvh_buffer.write(pixels, offset=start * BVH_PIXELS_PER_NODE * pixels.strides[0])
+
+        if changed:
+            self.resetAccumulation()
+        return changed
+
+    def createSkybox(self):
+        self.resetAccumulation()
+        self.maskybox_texture.release()
+
+        try:
+            f = open(self.settings.rt_skyboxpath, "r")
+            self.set_uniform("RT", "u_skybox_type", 1)
+        except FileNotFoundError:
+            self.set_uniform("RT", "u_skybox_type", 0)
+            print(f"{colors.HEADER}createSkybox{colors.ENDC} - {colors.WARNING}FileNotFoundError: {colors.ENDC}file {colors.OKBLUE}[{self.settings.rt_skyboxpath}]{colors.ENDC} doesn't exist!")
+            return       
+
+        # pygame is only here to decode the image and takes longer to import than the rest of the renderer
+        import pygame as pg
+
+        skyboxPath = self.settings.rt_skyboxpath
+        skybox = pg.image.load(skyboxPath)
+
+        self.maskybox_texture = self.ctx.texture(
+            size=skybox.get_size(),
+            components=3,
+            data=pg.image.tostring(skybox, "RGB"),
+        )
+
+        self.maskybox_texture.use(location=4)
+
+        print(f"{colors.HEADER}createSkybox - {colors.OKGREEN}Success{colors.ENDC}")
+
+
+    def resetAccumulation(self):
+        self.frames = 0
+        if self.tiles is not None:
+            self.tiles.reset(0)
+
+    def updateRTuniforms(self):
+        self.resetAccumulation()
+        
+        self.set_uniform("RT", "u_max_samples", self.settings.rt_samples)
+        self.set_uniform("RT", "u_max_reflections", self.settings.rt_reflections)
+        self.set_uniform("RT", "u_roulette_depth", self.settings.rt_roulettedepth if self.settings.rt_roulette else 0)
+        self.set_uniform("RT", "u_light_count", self.light_count if self.settings.rt_nee else 0)
+        self.set_uniform("RT", "u_noise_threshold", self.settings.rt_noisethreshold if self.settings.rt_adaptive else 0.0)
+        # the shader takes u_frame modulo this, 0 would be undefined
+        self.set_uniform("RT", "u_adaptive_min_frames", max(self.settings.rt_adaptiveminframes, 1))
+    
+    def updateRTFXuniforms(self):
+        self.set_uniform("pygameBlit", "u_exposure", self.settings.rtfx_exposure)
+
+    def updateCameraUniforms(self):
+        """ The camera itself reaches the shaders through updateFrameData """
+        self.resetAccumulation()
+
+    def renderFrame(self):
+        """ Renders the next part of the frame, returns True once the whole frame has been accumulated """
+        self.updateFrameData()
+
+        if self.tiles is None:
+            self.renderPasses()
+            self.readPathStats()
+            self.takeGLCalls()
+            return True
+
+        # a finished sweep or a frame counter changed from outside starts a new sweep
+        if self.tiles.frame != self.frames or self.tiles.finished():
+            self.tiles.reset(self.frames)
+            self.path_stats_buffer.clear()
+
+        batch = self.tiles.take()
+        for tile in batch:
+            self.renderPasses(scissor=tile)
+        self.RT_FBO.scissor = None
+        self.accumulator_FBO.scissor = None
+        self.ctx.finish()
+        self.tiles.report(len(batch))
+
+        if not self.tiles.finished():
+            return False
+        self.readPathStats()
+        self.takeGLCalls()
+        return True
+
+    def takeGLCalls(self):
+        """ Moves the calls counted during the finished frame to glCallsPerFrame """
+        if self.glCalls is not None:
+            self.glCallsPerFrame = dict(self.glCalls)
+            self.glCalls.clear()
+
+    def readPathStats(self):
+        """ Average raycasts per traced sample and the share of pixels adaptive sampling skipped
+            in the frame that just finished, then restarts the counts """
+        raycasts, converged = struct.unpack("<II", self.path_stats_buffer.read())
+        self.path_stats_buffer.clear()
+        pixels = self.window_size[0] * self.window_size[1]
+        traced = (pixels - converged) * self.settings.rt_samples
+        self.averagePathLength = raycasts / max(traced, 1)
+        self.convergedFraction = converged / pixels
+        self.tracedSamples += traced
+        self.profiler.count(traced, raycasts)
+
+    @property
+    def converged(self):
+        """ Adaptive sampling stopped tracing (nearly) every pixel, more frames won't change the image """
+        return self.settings.rt_adaptive and self.convergedFraction >= CONVERGED_PIXEL_FRACTION
+
+    def renderPasses(self, scissor=None):
+        self.RT_FBO.scissor = scissor
+        self.accumulator_FBO.scissor = scissor
+
+        # Render RT
+
+        if self.wavefront_buffers is not None:
+            with self.profiler.measure("wavefront"):
+                self.renderWavefront(scissor or (0, 0, *self.window_size))
+        else:
+            self.RT_FBO.use()
+            with self.profiler.measure("RT"):
+                self.RT_surface.render()
+            self.countGLCalls("draws")
+
+        # Accumulate frames
+
+        self.accumulator_FBO.use()
+        with self.profiler.measure("accumulator"):
+            self.accumulator_surface.render()
+        self.countGLCalls("draws")
+
+    def renderWavefront(self, tile):
+        """ RT as separate compute passes over ray queues: generate camera paths, then per bounce resize the dispatch
+            to the queue on the GPU, intersect and shade (which restarts finished samples and compacts the survivors).
+            Every path is done after samples * reflections bounces at the latest, so the loop needs no readback. """
+        programs = self.shaders.programs
+        buffers = self.wavefront_buffers
+        # changes with every tile, so write() it without keeping it for restore()
+        tile = tuple(tile)
+        self.uniforms.write("RT_generate", "u_tile", tile)
+        self.uniforms.write("RT_shade", "u_tile", tile)
+
+        buffers["paths"].bind_to_storage_buffer(0)
+        buffers["hits"].bind_to_storage_buffer(1)
+        buffers["counters"].bind_to_storage_buffer(4)
+        queues = [buffers["queue"], buffers["nextQueue"]]
+        queues[0].bind_to_storage_buffer(2)
+        queues[1].bind_to_storage_buffer(3)
+        self.RT_render_texture.bind_to_image(0, read=False, write=True)
+
+        path_count = tile[2] * tile[3]
+        buffers["counters"].clear()
+        programs["RT_generate"].run(group_x=-(-path_count // WAVEFRONT_GROUP_SIZE))
+        self.ctx.memory_barrier()
+
+        for bounce in range(self.settings.rt_samples * self.settings.rt_reflections):
+            programs["RT_queue"].run()
+            self.ctx.memory_barrier()
+            queues.reverse()
+            queues[0].bind_to_storage_buffer(2)
+            queues[1].bind_to_storage_buffer(3)
+
+            programs["RT_intersect"].run_indirect(buffers["counters"])
+            self.ctx.memory_barrier()
+            programs["RT_shade"].run_indirect(buffers["counters"])
+            self.ctx.memory_barrier()
+        self.countGLCalls("dispatches", 1 + 3 * self.settings.rt_samples * self.settings.rt_reflections)
+
+    def set_uniform(self, shader_name, uniform_name, value):
+        if not self.uniforms.set(shader_name, uniform_name, value):
+            print(f"{colors.HEADER}setUniform - {colors.WARNING}KeyError{colors.ENDC}: uniform {colors.OKBLUE}[{shader_name}]{colors.OKCYAN}[{uniform_name}]{colors.ENDC} is not used in the shader!")
+
+        if shader_name == "RT":
+            for name in WAVEFRONT_PROGRAMS:
+                self.uniforms.write(name, uniform_name, self.uniforms.values["RT"][uniform_name])
+
+    def countGLCalls(self, kind, count=1):
+        if self.glCalls is not None:
+            self.glCalls[kind] += count
+
+    def updateFrameData(self):
+        """ Writes the per-frame uniforms of every pass (frame_data.glsl) with one buffer write, skipped while nothing changed """
+        data = FRAME_DATA.pack(*self.cameraPosition, self.frames, *self.cameraRotation)
+        if data == self.frame_data:
+            return
+        self.frame_buffer.write(data)
+        self.frame_data = data
+        self.countGLCalls("buffer writes")
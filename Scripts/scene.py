@@ -1,11 +1,14 @@
-import struct
 from dataclasses import dataclass
 
 import numpy as np
-from numpy.random import rand
 
 from objects import *
+from bvh import build_scene_bvh
+from coloredText import bcolors as colors
 from pyrt import PYRTManager
+from scene_cache import cache_path, load_cache, save_cache, source_hash
+from geometry_store import DirtyRanges
+from scene_packer import GEOMETRY_ROWS, PackedSceneBuilder
 from util import *
 
 class Scene:
@@ -14,13 +17,15 @@ class Scene:
     backup_position = Vector3(0, 0, 0)
 
     groups = {}
-    objects = {'spheres':[], 'cubes':[], 'cylinders':[], 'quads':[]}
     materials = {}
 
     def __init__(self):
         self.groups = {}
-        self.objects = {'spheres':[], 'cubes':[], 'cylinders':[], 'quads':[]}
         self.materials = {}
+        self.builder = None
+        self.packed = PackedSceneBuilder().build()
+        self.bvh = None
+        self.bvh_dirty = DirtyRanges()  # nodes refit by edit() since the last upload
         self.PYRTManager = PYRTManager(shape_handler=lambda *args, **kwargs: self.shapeCallback(*args, **kwargs),
                                        group_handler=lambda *args, **kwargs: self.groupCallback(*args, **kwargs),
                                        material_handler=lambda *args, **kwargs: self.materialCallback(*args, **kwargs)
@@ -28,7 +33,7 @@ class Scene:
         
 
     def shapeCallback(self, line, parent, type, position=VectorN((0, 0, 0)), 
-                      rotation=VectorN((0, 0, 0)), size=None, material=backup_material, **kwargs):
+                      rotation=VectorN((0, 0, 0)), size=None, material=backup_material, dynamic=0, **kwargs):
 
         rotation = Quaternion.from_euler(*rotation)
         parent = self.groups[parent[len(parent)-1]] if len(parent) > 0 else None
@@ -65,22 +70,19 @@ class Scene:
             case _:
                 raise NotImplementedError
         
-        geometry = Geometry(
-            size=size,
-            type=type,
-            material=material,
-            vertices=vertices,
-            rotation=rotation,
-            group=parent
-        )
-        self.objects[type+'s'].append(geometry)
+        category = type + 's'
+        row = GEOMETRY_ROWS[category](vertices, size, rotation)
+        if self.builder is None:
+            # added after loading, see add_dynamic
+            return self.packed.add_dynamic(category, row, material)
+        # grouped shapes stay in local space here, the builder bakes them in one batch
+        return self.builder.append(category, row, material, group=parent, dynamic=bool(dynamic))
 
     def groupCallback(self, line, parent, name, position=VectorN((0, 0, 0)), rotation=VectorN((0, 0, 0)), material=None):
         position = Vector3(position[0], position[1], position[2])
         rotation = Quaternion.from_euler(rotation[0], rotation[1], rotation[2])
 
         new_group = Group(position=position, rotation=rotation, parent=parent)
-        print(rotation)
         self.groups[name] = new_group
         
         return new_group
@@ -96,62 +98,71 @@ class Scene:
         self.materials[name] = newMaterial
         return newMaterial
 
-    def importFromFile(self, path):
+    def importFromFile(self, path, use_cache=True):
         self.groups = {}
-        self.objects = {'spheres':[], 'cubes':[], 'cylinders':[], 'quads':[]}
         self.materials = {}
 
-        self.PYRTManager.readFile(path)
-
-        self.pack_data()
+        self.bvh = None
+        self.bvh_dirty = DirtyRanges()
+
+        try:
+            with open(path, 'r') as file:
+                source = file.read()
+        except FileNotFoundError:
+            print(f"{colors.HEADER}Scene{colors.ENDC} - {colors.WARNING}FileNotFoundError: {colors.ENDC}file {colors.OKBLUE}[{path}]{colors.ENDC} doesn't exist!")
+            use_cache = False
+            source = ""
+
+        # an unchanged scene skips parsing and packing, the cached buffers are only read as the GPU upload touches them
+        if use_cache:
+            digest = source_hash(source)
+            self.packed = load_cache(cache_path(path), digest)
+            if self.packed is not None:
+                print(f"{colors.HEADER}Scene{colors.ENDC} - {colors.OKGREEN}Loaded compiled scene{colors.ENDC} {colors.OKBLUE}[{cache_path(path)}]{colors.ENDC}")
+                return
+
+        # shapes go straight from the interpreter into the packed rows, see shapeCallback
+        self.builder = PackedSceneBuilder()
+        try:
+            self.PYRTManager.readSource(source)
+            self.packed = self.builder.build()
+        finally:
+            self.builder = None
+
+        if use_cache:
+            save_cache(cache_path(path), digest, self.packed)
 
     def get_object_count(self, count_category=None, in_pixels=False):
-        lengths = {"spheres": 2, "cubes": 3, "cylinders": 3, "quads": 4}
-        objects = self.objects if count_category is None else {count_category: self.objects[count_category]}
-
-        return sum([len(objects[category]) * lengths[category] if in_pixels else len(objects[category]) for category in objects])
+        return self.packed.get_object_count(count_category, in_pixels)
     
     def get_material_pixel_count(self):
-         return sum([len(self.objects[category]) * 3 for category in self.objects])
+        return self.packed.get_material_pixel_count()
     
     def pack_data(self):
-        dataGeometry = b''
-        dataMaterial = b''
-
-        pixelDataMaterial = lambda object: (*object.material.color, 0,
-                                            *object.material.specularColor, 0,
-                                            object.material.roughness, object.material.metalness, object.material.emissive, object.material.refractive)
-
-        pixelDataGeometry = {
-            #                            RED                    GREEN                  BLUE                   ALPHA
-            'spheres':   lambda object: (object.vertices[0].x,  object.vertices[0].y,  object.vertices[0].z,  object.size,          # 1
-                                         object.rotation.x,     object.rotation.y,     object.rotation.z,     object.rotation.w),   # 2
-             
-
-            'cubes':     lambda object: (object.vertices[0].x,  object.vertices[0].y,  object.vertices[0].z,  0,                    # 1
-                                         object.size.x,         object.size.y,         object.size.z,         0,                    # 2
-                                         object.rotation.x,     object.rotation.y,     object.rotation.z,     object.rotation.w),   # 3
- 
-
-            'cylinders': lambda object: (object.vertices[0].x,  object.vertices[0].y,  object.vertices[0].z,  0,                    # 1
-                                         object.vertices[1].x,  object.vertices[1].y,  object.vertices[1].z,  object.size,          # 2
-                                         object.rotation.x,     object.rotation.y,     object.rotation.z,     object.rotation.w),   # 3
-             
-
-            'quads':     lambda object: (object.vertices[0].x,  object.vertices[0].y,  object.vertices[0].z,  object.vertices[3].x, # 1
-                                         object.vertices[1].x,  object.vertices[1].y,  object.vertices[1].z,  object.vertices[3].y, # 2
-                                         object.vertices[2].x,  object.vertices[2].y,  object.vertices[2].z,  object.vertices[3].z, # 3
-                                         object.rotation.x,     object.rotation.y,     object.rotation.z,     object.rotation.w),   # 4
-        }
-        
-        for objectType in self.objects:
-
-            if objectType in pixelDataGeometry and len(self.objects[objectType]) > 0: 
-                objects = self.objects[objectType]
-                format_string = f"{len(pixelDataGeometry[objectType](objects[0]))}f"
-
-                for obj in objects:
-                    dataGeometry += struct.pack(format_string, *pixelDataGeometry[objectType](obj))
-                    dataMaterial += struct.pack('12f', *pixelDataMaterial(obj))
-
-        return dataGeometry, dataMaterial
\ No newline at end of file
+        """ Per category geometry pixels (already in the GPU layout), the material table and every object's index into it """
+        return {c: store.pixels for c, store in self.packed.stores.items()}, self.packed.material_data, self.packed.material_index_data
+
+    def pack_dynamic_data(self):
+        """ Same as pack_data for the dynamic geometry (the material table is shared) """
+        return {c: store.pixels for c, store in self.packed.dynamic.items()}, self.packed.dynamic_material_index_data
+
+    def build_bvh(self):
+        self.bvh = build_scene_bvh(self.packed)
+        self.bvh_dirty = DirtyRanges()
+        return self.bvh
+
+    def add_dynamic(self, type, material=backup_material, **kwargs):
+        """ Adds a world space shape (same keywords as in a .pyrt file) to the dynamic geometry, returns its index there """
+        return self.shapeCallback(0, (), type, material=material, **kwargs)
+
+    def edit(self, category, index, dynamic=False, material=None, **fields):
+        """ Changes fields (see geometry_store.GEOMETRY_DTYPES) and/or the material of one shape in place.
+            Renderer.updateScene then uploads just the touched records, static edits also refit the BVH """
+        stores = self.packed.dynamic if dynamic else self.packed.stores
+        material_id = self.packed.material_id(material) if material is not None else None
+        stores[category].set(index, material_id, **fields)
+        if material_id is not None:
+            self.packed.lights_changed = True
+        if fields and not dynamic and self.bvh is not None:
+            primitive = self.packed.object_offset(category) + index
+            self.bvh_dirty.update(self.bvh.refit(self.packed, primitive))
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import struct
+
+import numpy as np
+
+from coloredText import bcolors as colors
+from geometry_store import GeometryStore
+from scene_packer import CATEGORIES, PIXELS_PER_MATERIAL, PACKER_VERSION, PIXELS_PER_OBJECT, PackedScene
+
+# .pyrtc layout (little endian):
+#   header   magic, packer version, sha256 of the .pyrt source, object count per category (CATEGORIES order)
+#            of the static then of the dynamic stores, material table size
+#   padding  up to DATA_ALIGNMENT
+#   data     every static then every dynamic store's records (float32 RGBA pixels), the float32 material table rows,
+#            then the int32 material id of every static and every dynamic object
+MAGIC = b"PYRTC\0\0\0"
+HEADER = struct.Struct(f"<8sI32s{2 * len(CATEGORIES)}IQ")
+DATA_ALIGNMENT = 64
+DATA_OFFSET = -(-HEADER.size // DATA_ALIGNMENT) * DATA_ALIGNMENT
+
+
+def cache_path(source_path):
+    """ scene.pyrt -> scene.pyrtc, next to the source """
+    return os.path.splitext(source_path)[0] + ".pyrtc"
+
+
+def source_hash(source):
+    return hashlib.sha256(source.encode()).digest()
+
+
+def load_cache(path, digest):
+    """ Memory maps a compiled scene, returns None if it is missing, stale or from another packer version """
+    try:
+        with open(path, "rb") as file:
+            header = file.read(HEADER.size)
+    except OSError:
+        return None
+    if len(header) != HEADER.size:
+        return None
+
+    magic, version, cached_digest, *counts, material_count = HEADER.unpack(header)
+    if magic != MAGIC or version != PACKER_VERSION or cached_digest != digest:
+        return None
+    counts = list(zip(CATEGORIES * 2, counts))
+    geometry_pixels = sum(count * PIXELS_PER_OBJECT[c] for c, count in counts)
+    object_count = sum(count for _, count in counts)
+    material_floats = material_count * PIXELS_PER_MATERIAL * 4
+    if os.path.getsize(path) != DATA_OFFSET + (geometry_pixels * 4 + material_floats + object_count) * 4:
+        return None
+
+    # copy-on-write, so callers may edit the buffers without touching the file
+    def mapped(offset, dtype, shape):
+        if shape[0] == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=shape)
+
+    geometry = mapped(DATA_OFFSET, "<f4", (geometry_pixels, 4))
+    materials = mapped(DATA_OFFSET + geometry_pixels * 16, "<f4", (material_count, PIXELS_PER_MATERIAL * 4))
+    material_ids = mapped(DATA_OFFSET + geometry_pixels * 16 + material_floats * 4, "<i4", (object_count,))
+
+    stores = []
+    pixel_offset = 0
+    object_offset = 0
+    for category, count in counts:
+        pixels = geometry[pixel_offset:pixel_offset + count * PIXELS_PER_OBJECT[category]]
+        stores.append((category, GeometryStore.from_pixels(category, pixels, material_ids[object_offset:object_offset + count])))
+        pixel_offset += count * PIXELS_PER_OBJECT[category]
+        object_offset += count
+    return PackedScene(dict(stores[:len(CATEGORIES)]), materials, dict(stores[len(CATEGORIES):]))
+
+
+def save_cache(path, digest, packed):
+    """ Writes to a temporary file first so a crashed write never leaves a half cache behind """
+    store_sets = (packed.stores, packed.dynamic)
+    header = HEADER.pack(MAGIC, PACKER_VERSION, digest, *(len(stores[c]) for stores in store_sets for c in CATEGORIES), len(packed.materials))
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, "wb") as file:
+            file.write(header.ljust(DATA_OFFSET, b"\0"))
+            for stores in store_sets:
+                for category in CATEGORIES:
+                    file.write(stores[category].pixels.tobytes())
+            file.write(np.ascontiguousarray(packed.materials, dtype="<f4").tobytes())
+            file.write(np.ascontiguousarray(packed.material_ids, dtype="<i4").tobytes())
+            file.write(np.ascontiguousarray(packed.dynamic_material_ids, dtype="<i4").tobytes())
+        os.replace(temporary_path, path)
+    except OSError as error:
+        # a read-only scene directory only costs the cache, not the scene
+        print(f"{colors.HEADER}SceneCache{colors.ENDC} - {colors.WARNING}{type(error).__name__}: {colors.ENDC}can't write {colors.OKBLUE}[{path}]{colors.ENDC}")
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
@@ -0,0 +1,223 @@
+from dataclasses import dataclass, field
+from itertools import accumulate
+
+import numpy as np
+
+from geometry_store import GeometryStore, ROTATION_COMPONENTS, VERTEX_COMPONENTS
+from transforms import bake_group_transforms
+
+# bump whenever the packed layout changes, compiled .pyrtc scenes of other versions are rebuilt
+PACKER_VERSION = 3
+
+# every pixel is one RGBA32F texel of the geometry/material textures
+PIXELS_PER_OBJECT = {"spheres": 2, "cubes": 3, "cylinders": 3, "quads": 4}
+PIXELS_PER_MATERIAL = 3
+CATEGORIES = tuple(PIXELS_PER_OBJECT)
+# shapes next-event estimation samples when their material is emissive, the others are only found by bounce rays
+LIGHT_CATEGORIES = ("spheres", "quads")
+MATERIAL_EMISSIVE = 10  # column of material_row
+
+
+def material_row(material):
+    return (*material.color, 0,
+            *material.specularColor, 0,
+            material.roughness, material.metalness, material.emissive, material.refractive)
+
+
+# v: baked vertices, s: size, q: rotation
+GEOMETRY_ROWS = {
+    #                          RED       GREEN     BLUE      ALPHA
+    'spheres':   lambda v, s, q: (v[0].x,  v[0].y,  v[0].z,  s,       # 1
+                                  q.x,     q.y,     q.z,     q.w),    # 2
+
+
+    'cubes':     lambda v, s, q: (v[0].x,  v[0].y,  v[0].z,  0,       # 1
+                                  s.x,     s.y,     s.z,     0,       # 2
+                                  q.x,     q.y,     q.z,     q.w),    # 3
+
+
+    'cylinders': lambda v, s, q: (v[0].x,  v[0].y,  v[0].z,  0,       # 1
+                                  v[1].x,  v[1].y,  v[1].z,  s,       # 2
+                                  q.x,     q.y,     q.z,     q.w),    # 3
+
+
+    'quads':     lambda v, s, q: (v[0].x,  v[0].y,  v[0].z,  v[3].x,  # 1
+                                  v[1].x,  v[1].y,  v[1].z,  v[3].y,  # 2
+                                  v[2].x,  v[2].y,  v[2].z,  v[3].z,  # 3
+                                  q.x,     q.y,     q.z,     q.w),    # 4
+}
+
+
+def empty_stores():
+    return {c: GeometryStore(c) for c in CATEGORIES}
+
+
+@dataclass
+class PackedScene:
+    stores    : dict[str, GeometryStore]    # one per category, in CATEGORIES order
+    materials : np.ndarray                  # (material count, 12) float32 table of unique materials, indexed by material_ids
+    dynamic   : dict[str, GeometryStore] = field(default_factory=empty_stores)  # small separate set for edited/animated shapes, not in the BVH
+
+    # set when the table or the dynamic stores change size, the renderer then reallocates those textures
+    materials_resized : bool = False
+    dynamic_resized   : bool = False
+    # set when a shape got another material, the renderer then rebuilds the light list
+    lights_changed    : bool = False
+
+    @property
+    def counts(self):
+        return {c: len(self.stores[c]) for c in CATEGORIES}
+
+    @property
+    def dynamic_counts(self):
+        return {c: len(self.dynamic[c]) for c in CATEGORIES}
+
+    def get_object_count(self, count_category=None, in_pixels=False, dynamic=False):
+        stores = self.dynamic if dynamic else self.stores
+        categories = CATEGORIES if count_category is None else (count_category,)
+        return sum(len(stores[c]) * PIXELS_PER_OBJECT[c] if in_pixels else len(stores[c]) for c in categories)
+
+    def get_material_pixel_count(self):
+        return len(self.materials) * PIXELS_PER_MATERIAL
+
+    def pixel_offset(self, category, dynamic=False):
+        stores = self.dynamic if dynamic else self.stores
+        offsets = dict(zip(CATEGORIES, accumulate((len(stores[c]) * PIXELS_PER_OBJECT[c] for c in CATEGORIES), initial=0)))
+        return offsets[category]
+
+    def object_offset(self, category, dynamic=False):
+        """ geometry index of the first object of a category, dynamic objects are numbered after all static ones """
+        stores = self.dynamic if dynamic else self.stores
+        offsets = dict(zip(CATEGORIES, accumulate((len(stores[c]) for c in CATEGORIES), initial=0)))
+        return offsets[category]
+
+    def category(self, name, dynamic=False):
+        """ (count, pixels per object, 4) view into the store of a category """
+        store = (self.dynamic if dynamic else self.stores)[name]
+        return store.pixels.reshape(len(store), PIXELS_PER_OBJECT[name], 4)
+
+    def material_id(self, material):
+        """ Table index of a material, a material not in the table yet is appended """
+        row = np.array(material_row(material), dtype=np.float32)
+        matches = np.flatnonzero((self.materials == row).all(axis=1))
+        if len(matches):
+            return int(matches[0])
+        self.materials = np.concatenate([self.materials.reshape(-1, PIXELS_PER_MATERIAL * 4), row[None]])
+        self.materials_resized = True
+        return len(self.materials) - 1
+
+    def add_dynamic(self, category, geometry_row, material):
+        """ Appends a world space shape to the dynamic set, returns its index there """
+        store = self.dynamic[category]
+        store.append(geometry_row, self.material_id(material))
+        self.dynamic_resized = True
+        return store.count - 1
+
+    def lights(self):
+        """ (type, index in the type's buffer, geometry index) int32 rows of every emissive sphere and quad, in geometry order.
+            Types are numbered from 1 in CATEGORIES order and dynamic shapes sit behind the static ones, like in RT_common.glsl """
+        emissive = self.materials.reshape(-1, PIXELS_PER_MATERIAL * 4)[:, MATERIAL_EMISSIVE] > 0
+        geometry_count = self.get_object_count()
+        rows = []
+        for stores, dynamic in ((self.stores, False), (self.dynamic, True)):
+            for category in LIGHT_CATEGORIES:
+                indices = np.flatnonzero(emissive[stores[category].material_ids])
+                first_record = len(self.stores[category]) if dynamic else 0
+                first_object = self.object_offset(category, dynamic) + (geometry_count if dynamic else 0)
+                rows.append(np.stack([np.full(len(indices), CATEGORIES.index(category) + 1), first_record + indices, first_object + indices], axis=1))
+        return np.concatenate(rows).astype(np.int32)
+
+    @property
+    def material_ids(self):
+        """ material table index of every object, in geometry order """
+        return np.concatenate([self.stores[c].material_ids for c in CATEGORIES])
+
+    @property
+    def dynamic_material_ids(self):
+        return np.concatenate([self.dynamic[c].material_ids for c in CATEGORIES])
+
+    @property
+    def material_data(self):
+        return memoryview(np.ascontiguousarray(self.materials)).cast('B')
+
+    @property
+    def material_index_data(self):
+        """ material_ids as float32, one R32F texel per object """
+        return memoryview(self.material_ids.astype(np.float32)).cast('B')
+
+    @property
+    def dynamic_material_index_data(self):
+        return memoryview(self.dynamic_material_ids.astype(np.float32)).cast('B')
+
+
+class _GroupedRows:
+    """ float64 local space rows of grouped objects, baked and written into their store once loading is done """
+
+    def __init__(self, row_size, capacity=64):
+        self.rows = np.empty((capacity, row_size))
+        self.indices = np.empty(capacity, dtype=np.int64)
+        self.group_ids = np.empty(capacity, dtype=np.int32)
+        self.count = 0
+
+    def append(self, index, group_id, row):
+        if self.count == len(self.rows):
+            capacity = len(self.rows) * 2
+            self.rows = np.resize(self.rows, (capacity, self.rows.shape[1]))
+            self.indices = np.resize(self.indices, capacity)
+            self.group_ids = np.resize(self.group_ids, capacity)
+
+        self.rows[self.count] = row
+        self.indices[self.count] = index
+        self.group_ids[self.count] = group_id
+        self.count += 1
+
+
+class PackedSceneBuilder:
+    """ Collects objects straight into the geometry stores while the scene is interpreted.
+        Materials are deduplicated by value, every distinct one gets a single row in the table.
+        Shapes in groups are kept in local space until build(), which bakes them all at once """
+
+    def __init__(self):
+        self.stores = empty_stores()
+        self.dynamic = empty_stores()
+        self._material_rows = {}
+        self._groups = {}
+        self._grouped = {(c, dynamic): _GroupedRows(PIXELS_PER_OBJECT[c] * 4) for c in CATEGORIES for dynamic in (False, True)}
+
+    def material_id(self, material):
+        row = material_row(material)
+        return self._material_rows.setdefault(row, len(self._material_rows))
+
+    def group_id(self, group):
+        return self._groups.setdefault(id(group), (len(self._groups), group))[0]
+
+    def append(self, category, geometry_row, material, group=None, dynamic=False):
+        """ Returns the index of the object in its store """
+        store = (self.dynamic if dynamic else self.stores)[category]
+        if group is not None:
+            self._grouped[category, dynamic].append(store.count, self.group_id(group), geometry_row)
+            geometry_row = 0
+        store.append(geometry_row, self.material_id(material))
+        return store.count - 1
+
+    def _bake_groups(self):
+        if not self._groups:
+            return
+        groups = [group for _, group in self._groups.values()]
+        group_matrices = np.array([group.worldMatrix for group in groups])
+        group_rotations = np.array([(g.rotation.x, g.rotation.y, g.rotation.z, g.rotation.w) for g in groups])
+
+        for (category, dynamic), grouped in self._grouped.items():
+            if grouped.count == 0:
+                continue
+            rows = grouped.rows[:grouped.count]
+            group_ids = grouped.group_ids[:grouped.count]
+            bake_group_transforms(rows, VERTEX_COMPONENTS[category], ROTATION_COMPONENTS[category],
+                                  group_matrices[group_ids], group_rotations[group_ids])
+            (self.dynamic if dynamic else self.stores)[category].rows[grouped.indices[:grouped.count]] = rows
+
+    def build(self):
+        self._bake_groups()
+        # dicts keep insertion order, which is the id order
+        materials = np.array(list(self._material_rows), dtype=np.float32).reshape(-1, PIXELS_PER_MATERIAL * 4)
+        return PackedScene(self.stores, materials, self.dynamic)
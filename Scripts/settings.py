@@ -0,0 +1,50 @@
+SETTINGS_PATH = "../settings.toml"
+
+# attribute of Settings -> key in settings.toml
+KEYS = {
+    "gl_version": "WINDOW/GLversion",
+    "title": "WINDOW/title",
+    "window_size": "WINDOW/resolution",
+    "resizable": "WINDOW/resizable",
+
+    "rt_samples": "RT/samples",
+    "rt_reflections": "RT/reflections",
+    "rt_roulette": "RT/roulette",
+    "rt_roulettedepth": "RT/roulettedepth",
+    "rt_nee": "RT/nee",
+    "rt_adaptive": "RT/adaptive",
+    "rt_noisethreshold": "RT/noisethreshold",
+    "rt_adaptiveminframes": "RT/adaptiveminframes",
+    "rt_accumframes": "RT/accumframes",
+    "rt_skyboxpath": "RT/skyboxpath",
+    "rt_scenepath": "RT/scenepath",
+    "rt_scenecache": "RT/scenecache",
+    "rt_bvh": "RT/bvh",
+    "rt_tilesize": "RT/tilesize",
+    "rt_tilebudget": "RT/tilebudget",
+    "rt_wavefront": "RT/wavefront",
+
+    "rtfx_exposure": "RTFX/exposure",
+
+    "app_shaderPath": "APP/shaderPath",
+    "app_shaderCache": "APP/shaderCache",
+    "app_hotReload": "APP/hotReload",
+    "app_countGLCalls": "APP/countGLCalls",
+    "app_profiler": "APP/profiler",
+    "app_profilePath": "APP/profilePath",
+}
+
+
+class Settings:
+    """ Every key of settings.toml as an attribute. The file is only parsed once the first Settings is created,
+        not when this module is imported, later instances start from the same values """
+    _values = None
+
+    def __init__(self):
+        if Settings._values is None:
+            from TOMLParser import TOMLParser
+
+            parser = TOMLParser()
+            parser.loadConfig(SETTINGS_PATH)
+            Settings._values = {name: parser.getValue("settings", key) for name, key in KEYS.items()}
+        self.__dict__.update(Settings._values)
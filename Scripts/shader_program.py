@@ -1,25 +1,114 @@
+import os
+import re
+import time
+from contextlib import contextmanager
 from os.path import abspath
 from inspect import getsourcefile
 
+import moderngl as mgl
+
+from coloredText import bcolors as colors
+
+INCLUDE = re.compile(r'^[ \t]*#include[ \t]+"([^"]+)"[ \t]*$', re.MULTILINE)
+
+
+def enable_disk_cache(directory):
+    """ Turns on the driver's on-disk shader cache (Mesa, NVIDIA) and points it at directory, has to run before the GL context exists.
+        moderngl can't create a program from glProgramBinary, so the linked binaries are kept by the driver,
+        which keys them on the full source and its own build. Variables already set in the environment win """
+    directory = abspath(directory)
+    os.makedirs(directory, exist_ok=True)
+    for variable, value in (
+        ("MESA_SHADER_CACHE_DISABLE", "false"),
+        ("MESA_SHADER_CACHE_DIR", directory),
+        ("__GL_SHADER_DISK_CACHE", "1"),
+        ("__GL_SHADER_DISK_CACHE_PATH", directory),
+        ("__GL_SHADER_DISK_CACHE_SKIP_CLEANUP", "1"),
+    ):
+        os.environ.setdefault(variable, value)
+    return directory
+
+
 class ShaderProgram:
     def __init__(self, ctx, resource_dir):
         self.path = resource_dir
         self.ctx = ctx
         self.programs = {}
-    
-    def get_program(self, shader_name):
-        with open(self.path+f'/{shader_name}.frag') as file:
-            fragment_shader = file.read()
-            
-        with open(self.path+f'/{shader_name}.vert') as file:
-            vertex_shader = file.read()
-        
-        program = self.ctx.program(vertex_shader=vertex_shader,fragment_shader=fragment_shader)
+        # modification time of every file a program was built from (includes too), see changed()
+        self.files = {}
+        self.loaders = {}
+
+    def read_source(self, file_name, included=(), files=None):
+        """ Shader source with every #include "file" line replaced by that file (relative to the shader directory).
+            The path and modification time of every file read go into files """
+        if file_name in included:
+            raise RecursionError(f"{file_name} includes itself")
+        path = self.path+f'/{file_name}'
+        if files is not None:
+            files[path] = os.stat(path).st_mtime_ns
+        with open(path) as file:
+            source = file.read()
+        return INCLUDE.sub(lambda match: self.read_source(match.group(1), included + (file_name,), files), source)
+
+    def get_program(self, shader_name, files=None):
+        fragment_shader = self.read_source(f'{shader_name}.frag', files=files)
+        vertex_shader = self.read_source(f'{shader_name}.vert', files=files)
+
+        with self.timed(shader_name):
+            program = self.ctx.program(vertex_shader=vertex_shader,fragment_shader=fragment_shader)
         return program
-    
+
+    def get_compute(self, name, files=None):
+        source = self.read_source(f'{name}.comp', files=files)
+        with self.timed(name):
+            return self.ctx.compute_shader(source)
+
     def load_program(self, name):
-        self.programs[name] = self.get_program(name)
-    
+        self.files[name] = {}
+        self.loaders[name] = self.get_program
+        self.programs[name] = self.get_program(name, self.files[name])
+
+    def load_compute(self, name):
+        self.files[name] = {}
+        self.loaders[name] = self.get_compute
+        self.programs[name] = self.get_compute(name, self.files[name])
+
+    def changed(self):
+        """ Names of the loaded programs one of whose files was saved since it was compiled """
+        names = []
+        for name, files in self.files.items():
+            for path, mtime in files.items():
+                try:
+                    if os.stat(path).st_mtime_ns != mtime:
+                        names.append(name)
+                        break
+                except OSError:
+                    # editors that save by replacing the file leave it missing for a moment
+                    pass
+        return names
+
+    def reload(self, name):
+        """ Recompiles a loaded program from its current files in place of the old one.
+            A source that doesn't compile keeps the old program running, returns whether the program was replaced """
+        files = {}
+        try:
+            program = self.loaders[name](name, files)
+        except (mgl.Error, OSError, RecursionError) as error:
+            self.files[name].update(files)
+            print(f"{colors.HEADER}reloadShader{colors.ENDC} - {colors.FAIL}{type(error).__name__}{colors.ENDC}: {colors.OKBLUE}[{name}]{colors.ENDC} keeps the previous program\n{error}")
+            return False
+        self.programs[name].release()
+        self.programs[name] = program
+        self.files[name] = files
+        return True
+
+    @contextmanager
+    def timed(self, name):
+        """ Logs how long compiling name took, a hit in the driver's disk cache shows up as a short time """
+        start = time.perf_counter()
+        yield
+        print(f"{colors.HEADER}compileShader{colors.ENDC} - {colors.OKBLUE}[{name}]{colors.ENDC} in {time.perf_counter() - start:.3f}s")
+
     def destroy(self):
         [program.release() for program in self.programs.values()]
 
@@ -0,0 +1,38 @@
+import time
+
+
+class TileScheduler:
+    """ Splits the frame into tiles and hands out as many per call as fit into the time budget.
+        One full sweep over the tiles equals one accumulated frame. """
+
+    def __init__(self, size, tile_size, budget_ms):
+        width, height = size
+        self.tiles = [
+            (x, y, min(tile_size, width - x), min(tile_size, height - y))
+            for y in range(0, height, tile_size)
+            for x in range(0, width, tile_size)
+        ]
+        self.budget = budget_ms / 1000
+        self.tile_cost = None  # running estimate of seconds per tile
+        self.frame = None      # frame the current sweep renders
+        self.next_tile = 0
+
+    def reset(self, frame):
+        self.frame = frame
+        self.next_tile = 0
+
+    def take(self):
+        """ Next batch of tiles of the current sweep, sized from the measured tile cost """
+        count = 1 if self.tile_cost is None else max(1, int(self.budget / max(self.tile_cost, 1e-6)))
+        batch = self.tiles[self.next_tile:self.next_tile + count]
+        self.next_tile += len(batch)
+        self.batch_start = time.perf_counter()
+        return batch
+
+    def report(self, tile_count):
+        """ Call after the batch finished on the GPU """
+        cost = (time.perf_counter() - self.batch_start) / max(tile_count, 1)
+        self.tile_cost = cost if self.tile_cost is None else self.tile_cost * 0.7 + cost * 0.3
+
+    def finished(self):
+        return self.next_tile >= len(self.tiles)
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+def quaternion_matrices(q):
+    """ (N, 4) xyzw quaternions -> (N, 3, 3) matrices of v -> q * v * q^-1 """
+    x, y, z, w = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    return np.stack([
+        np.stack([w*w + x*x - y*y - z*z, 2 * (x*y - w*z),       2 * (x*z + w*y)],       axis=-1),
+        np.stack([2 * (x*y + w*z),       w*w - x*x + y*y - z*z, 2 * (y*z - w*x)],       axis=-1),
+        np.stack([2 * (x*z - w*y),       2 * (y*z + w*x),       w*w - x*x - y*y + z*z], axis=-1),
+    ], axis=-2)
+
+
+def hamilton(a, b):
+    """ (N, 4) xyzw quaternion products a * b, same as Quaternion.hamilton """
+    ax, ay, az, aw = a[:, 0], a[:, 1], a[:, 2], a[:, 3]
+    bx, by, bz, bw = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+    return np.stack([
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+        aw * bw - ax * bx - ay * by - az * bz,
+    ], axis=-1)
+
+
+def world_matrix(position, rotation):
+    """ 4x4 matrix rotating by the Quaternion, then translating by the Vector3 """
+    matrix = np.identity(4)
+    matrix[:3, :3] = quaternion_matrices(np.array([[rotation.x, rotation.y, rotation.z, rotation.w]]))[0]
+    matrix[:3, 3] = position.x, position.y, position.z
+    return matrix
+
+
+def bake_group_transforms(rows, vertex_components, rotation_components, group_matrices, group_rotations):
+    """ Moves grouped shapes to world space in place, the batched form of Geometry.bakeGroupTransform:
+        every vertex is rotated by the shape's rotation around the vertex median, then by the group's world matrix.
+        rows: (N, row size) float64 local rows, group_matrices: (N, 4, 4), group_rotations: (N, 4) """
+    vertices = rows[:, vertex_components]                                   # (N, vertex count, 3)
+    rotations = rows[:, rotation_components]
+
+    median = vertices.mean(axis=1, keepdims=True)
+    vertices = (vertices - median) @ quaternion_matrices(rotations).transpose(0, 2, 1) + median
+    vertices = vertices @ group_matrices[:, :3, :3].transpose(0, 2, 1) + group_matrices[:, None, :3, 3]
+
+    rows[:, vertex_components] = vertices
+    rows[:, rotation_components] = hamilton(group_rotations, rotations)
@@ -0,0 +1,51 @@
+_UNSET = object()
+
+
+class UniformCache:
+    """ Uniform handles of every program, looked up once, and a shadow of the values written through them,
+        so writing the value a uniform already holds never reaches GL.
+        values keeps what was last asked for per program, a recompiled program gets it back with restore() """
+
+    def __init__(self, programs, calls=None):
+        self.programs = programs
+        self.calls = calls
+        self.handles = {}
+        self.written = {}
+        self.values = {}
+
+    def set(self, program_name, uniform_name, value):
+        """ Returns False if the program doesn't use the uniform (or isn't loaded) """
+        if isinstance(value, list):
+            value = tuple(value)
+        self.values.setdefault(program_name, {})[uniform_name] = value
+        return self.write(program_name, uniform_name, value)
+
+    def write(self, program_name, uniform_name, value):
+        key = (program_name, uniform_name)
+        if self.written.get(key, _UNSET) == value:
+            if self.calls is not None:
+                self.calls["skipped uniforms"] += 1
+            return True
+
+        handle = self.handles.get(key, _UNSET)
+        if handle is _UNSET:
+            program = self.programs.get(program_name)
+            handle = self.handles[key] = program.get(uniform_name, None) if program is not None else None
+            if handle is None:
+                return False
+        elif handle is None:
+            return False
+
+        handle.value = value
+        self.written[key] = value
+        if self.calls is not None:
+            self.calls["uniforms"] += 1
+        return True
+
+    def restore(self, program_name, source_name=None):
+        """ Forgets the handles of a (re)compiled program and writes it the values last set on source_name (itself by default) """
+        for key in [key for key in self.handles if key[0] == program_name]:
+            del self.handles[key]
+            self.written.pop(key, None)
+        for uniform_name, value in self.values.get(source_name or program_name, {}).items():
+            self.write(program_name, uniform_name, value)
@@ -0,0 +1,886 @@
+uniform vec2 u_resolution;
+uniform int u_max_samples;
+uniform int u_max_reflections;
+uniform int u_roulette_depth; // bounces before russian roulette may end a path, 0 = off
+uniform float u_noise_threshold; // relative error below which a pixel stops being traced, 0 = off
+uniform int u_adaptive_min_frames;
+uniform int u_skybox_type;
+
+#include "frame_data.glsl"
+
+uniform sampler2D u_skybox_texture;
+uniform sampler2D u_moments_texture;        // written by accumulator.frag
+
+uniform int u_geometry_count;
+uniform int u_bvh_node_count;
+
+uniform ivec4 u_static_counts;  // spheres, cubes, cylinders, quads at the head of each type's buffer, in Scene.pack_data order
+uniform ivec4 u_dynamic_counts; // spheres, cubes, cylinders, quads outside the BVH, numbered after the static geometry
+uniform int u_light_count;      // entries of lights[], 0 turns next-event estimation off
+
+
+
+const float PI = 3.14159265;
+
+//----------------------------------------------------------------------------------------------------------
+// tonemap (credits to Casual shadertoy Path tracing)
+//----------------------------------------------------------------------------------------------------------
+vec3 LessThan(vec3 f, float value)
+{
+    return vec3(
+        (f.x < value) ? 1.0f : 0.0f,
+        (f.y < value) ? 1.0f : 0.0f,
+        (f.z < value) ? 1.0f : 0.0f);
+}
+ 
+vec3 LinearToSRGB(vec3 rgb)
+{
+    rgb = clamp(rgb, 0.0f, 1.0f);
+     
+    return mix(
+        pow(rgb, vec3(1.0f / 2.4f)) * 1.055f - 0.055f,
+        rgb * 12.92f,
+        LessThan(rgb, 0.0031308f)
+    );
+}
+ 
+vec3 SRGBToLinear(vec3 rgb)
+{
+    rgb = clamp(rgb, 0.0f, 1.0f);
+     
+    return mix(
+        pow(((rgb + 0.055f) / 1.055f), vec3(2.4f)),
+        rgb / 12.92f,
+        LessThan(rgb, 0.04045f)
+    );
+}
+
+//----------------------------------------------------------------------------------------------------------
+// randomness (credits to Casual shadertoy Path tracing)
+//----------------------------------------------------------------------------------------------------------
+uint rngState;
+uint wang_hash(inout uint seed)
+{
+    seed = uint(seed ^ uint(61)) ^ uint(seed >> uint(16));
+    seed *= uint(9);
+    seed = seed ^ (seed >> 4);
+    seed *= uint(0x27d4eb2d);
+    seed = seed ^ (seed >> 15);
+    return seed;
+}
+ 
+float RandomFloat01(inout uint state)
+{
+    return float(wang_hash(state)) / 4294967296.0;
+}
+ 
+vec3 RandomUnitVector(inout uint state)
+{
+    float z = RandomFloat01(state) * 2.0f - 1.0f;
+    float a = RandomFloat01(state) * PI*2;
+    float r = sqrt(1.0f - z * z);
+    float x = r * cos(a);
+    float y = r * sin(a);
+    return vec3(x, y, z);
+}
+vec3 RandomHemisphereVector(inout uint state, in vec3 n){
+    vec3 v = RandomUnitVector(state);
+    return normalize(dot(v,n) * v);
+}
+
+
+//----------------------------------------------------------------------------------------------------------
+// structs
+//----------------------------------------------------------------------------------------------------------
+struct rayStruct{
+    vec3 origin;
+    vec3 direction;
+};
+struct materialStruct{
+    vec3 albedo;
+    vec3 specularColor;
+    float roughness;
+    float metallness;
+    float emissive;
+    float refractive;
+};
+
+// scene records, byte for byte the std430 layout of geometry_store.GEOMETRY_DTYPES and scene_packer.material_row
+struct sphereStruct{
+    vec3 position; float radius;
+    vec4 rotation;
+};
+struct cubeStruct{
+    vec3 position; float _pad0;
+    vec3 size;     float _pad1;
+    vec4 rotation;
+};
+struct cylinderStruct{
+    vec3 top;    float _pad0;
+    vec3 bottom; float radius;
+    vec4 rotation;
+};
+struct quadStruct{
+    vec3 a; float d_x;
+    vec3 b; float d_y;
+    vec3 c; float d_z;
+    vec4 rotation;
+};
+struct packedMaterialStruct{
+    vec4 color;
+    vec4 specularColor;
+    vec4 properties; // roughness, metalness, emissive, refractive
+};
+
+// scene buffers uploaded by Renderer.createScene. Every type's static records are followed by its dynamic ones
+// (edited/animated shapes outside the BVH), whose geometry indices follow all static ones
+layout(std430, binding=6) readonly buffer Spheres { sphereStruct spheres[]; };
+layout(std430, binding=7) readonly buffer Cubes { cubeStruct cubes[]; };
+layout(std430, binding=8) readonly buffer Cylinders { cylinderStruct cylinders[]; };
+layout(std430, binding=9) readonly buffer Quads { quadStruct quads[]; };
+layout(std430, binding=10) readonly buffer Materials { packedMaterialStruct materials[]; };
+layout(std430, binding=11) readonly buffer MaterialIds { int materialIds[]; }; // by geometry index
+layout(std430, binding=12) readonly buffer BVH { vec4 bvhData[]; };
+
+struct lightStruct{ // an emissive sphere or quad, see PackedScene.lights
+    int type;
+    int index;         // in the type's buffer
+    int geometryIndex;
+};
+layout(std430, binding=13) readonly buffer Lights { lightStruct lights[]; };
+//----------------------------------------------------------------------------------------------------------
+// intersections
+//----------------------------------------------------------------------------------------------------------
+vec2 sphIntersect( vec3 ro,  vec3 rd, float ra ){
+    float b = dot( ro, rd );
+    float c = dot( ro, ro ) - ra*ra;
+    float h = b*b - c;
+    if( h<0.0 ) return vec2(-1.0); // no intersection
+    h = sqrt( h );
+    return vec2( -b-h, -b+h ); //-b-h, -b+h
+}
+vec2 boxIntersection( in vec3 ro, in vec3 rd, vec3 boxSize, out vec3 outNormal ) 
+{
+    vec3 m = 1.0/rd; // can precompute if traversing a set of aligned boxes
+    vec3 n = m*ro;   // can precompute if traversing a set of aligned boxes
+    vec3 k = abs(m)*boxSize;
+    vec3 t1 = -n - k;
+    vec3 t2 = -n + k;
+    float tN = max( max( t1.x, t1.y ), t1.z );
+    float tF = min( min( t2.x, t2.y ), t2.z );
+    if( tN>tF || tF<0.0) {return vec2(-1.0);} // no intersection
+    if (tN>0.0){
+        outNormal = step(vec3(tN), t1);
+    } else {
+        outNormal = step(t2,vec3(tF));
+    }
+    //outNormal = (tN>0.0) ? step(vec3(tN),t1)) : // ro ouside the box
+    //                       step(t2,vec3(tF)));  // ro inside the box
+    outNormal *= -sign(rd);
+    return vec2( tN, tF );
+}
+
+// cylinder defined by extremes a and b, and radious ra
+vec4 cylIntersect( in vec3 ro, in vec3 rd, in vec3 a, in vec3 b, float ra )
+{
+    vec3  ba = b  - a;
+    vec3  oc = ro - a;
+    float baba = dot(ba,ba);
+    float bard = dot(ba,rd);
+    float baoc = dot(ba,oc);
+    float k2 = baba            - bard*bard;
+    float k1 = baba*dot(oc,rd) - baoc*bard;
+    float k0 = baba*dot(oc,oc) - baoc*baoc - ra*ra*baba;
+    float h = k1*k1 - k2*k0;
+    if( h<0.0 ) return vec4(-1.0);//no intersection
+    h = sqrt(h);
+    float t = (-k1-h)/k2;
+    // body
+    float y = baoc + t*bard;
+    if( y>0.0 && y<baba ) return vec4( t, (oc+t*rd - ba*y/baba)/ra );
+    // caps
+    t = ( ((y<0.0) ? 0.0 : baba) - baoc)/bard;
+    if( abs(k1+k2*t)<h )
+    {
+        return vec4( t, ba*sign(y)/sqrt(baba) );
+    }
+    return vec4(-1.0);//no intersection
+}
+
+// normal at point p of cylinder (a,b,ra), see above
+vec3 cylNormal( in vec3 p, in vec3 a, in vec3 b, float ra )
+{
+    vec3  pa = p - a;
+    vec3  ba = b - a;
+    float baba = dot(ba,ba);
+    float paba = dot(pa,ba);
+    float h = dot(pa,ba)/baba;
+    return (pa - ba*h)/ra;
+}
+
+
+float ScalarTriple(vec3 u, vec3 v, vec3 w)
+{
+    return dot(cross(u, v), w);
+}
+vec4 quadIntersect(in vec3 rayPos, in vec3 rayDir, in vec3 a, in vec3 b, in vec3 c, in vec3 d)
+{
+    // calculate normal and flip vertices order if needed
+    vec3 normal = normalize(cross(c-a, c-b));
+    if (dot(normal, rayDir) > 0.0f)
+    {
+        normal *= -1.0f;
+        
+		vec3 temp = d;
+        d = a;
+        a = temp;
+        
+        temp = b;
+        b = c;
+        c = temp;
+    }
+    
+    vec3 p = rayPos;
+    vec3 q = rayPos + rayDir;
+    vec3 pq = q - p;
+    vec3 pa = a - p;
+    vec3 pb = b - p;
+    vec3 pc = c - p;
+    
+    // determine which triangle to test against by testing against diagonal first
+    vec3 m = cross(pc, pq);
+    float v = dot(pa, m);
+    vec3 intersectPos;
+    if (v >= 0.0f)
+    {
+        // test against triangle a,b,c
+        float u = -dot(pb, m);
+        if (u < 0.0f) return vec4(-1);
+        float w = ScalarTriple(pq, pb, pa);
+        if (w < 0.0f) return vec4(-1);
+        float denom = 1.0f / (u+v+w);
+        u*=denom;
+        v*=denom;
+        w*=denom;
+        intersectPos = u*a+v*b+w*c;
+    }
+    else
+    {
+        vec3 pd = d - p;
+        float u = dot(pd, m);
+        if (u < 0.0f) return vec4(-1);
+        float w = ScalarTriple(pq, pa, pd);
+        if (w < 0.0f) return vec4(-1);
+        v = -v;
+        float denom = 1.0f / (u+v+w);
+        u*=denom;
+        v*=denom;
+        w*=denom;
+        intersectPos = u*a+v*d+w*c;
+    }
+    
+    float dist;
+    if (abs(rayDir.x) > 0.1f)
+    {
+        dist = (intersectPos.x - rayPos.x) / rayDir.x;
+    }
+    else if (abs(rayDir.y) > 0.1f)
+    {
+        dist = (intersectPos.y - rayPos.y) / rayDir.y;
+    }
+    else
+    {
+        dist = (intersectPos.z - rayPos.z) / rayDir.z;
+    }
+    
+	if (dist > 0)
+    {       
+        return vec4(dist,normal);
+    }    
+    
+    return vec4(-1);
+}
+
+//----------------------------------------------------------------------------------------------------------
+// materials
+//----------------------------------------------------------------------------------------------------------
+float myrefract(inout vec3 dir, vec3 n, float N) // return fres (N supposed to be >1)
+{
+    float dn=dot(dir,n);
+    float fres=1.-abs(dot(dir,n));
+    fres*=fres*fres;
+    fres=.1+.9*fres;
+    if (dn>0.) { N=1./N; }
+    vec3 ds=dir-dn*n;
+    if(length(ds)*(1.-1./N)>1.) {  // total reflection
+        dir=reflect(dir,n); return 1.;
+    }
+    dir-=ds*(1.-1./N);
+    if (dn>0.) {
+        fres=1.-abs(dot(dir,n));
+        fres*=fres*fres;
+        fres=.2+.8*fres;
+    }
+    dir=normalize(dir);
+    return fres;
+}
+
+float FresnelSchlick(float nIn, float nOut, vec3 direction, vec3 normal)
+{
+    float R0 = ((nOut - nIn) * (nOut - nIn)) / ((nOut + nIn) * (nOut + nIn));
+    float fresnel = R0 + (1.0 - R0) * pow((1.0 - abs(dot(direction, normal))), 5.0);
+    return fresnel;
+}
+
+//----------------------------------------------------------------------------------------------------------
+// quaternions
+//----------------------------------------------------------------------------------------------------------
+
+//vec3 Rotate(vec4 q, vec3 v) {
+//    float x = q.x * 2.0;
+//    float y = q.y * 2.0;
+//    float z = q.z * 2.0;
+//    float xx = q.x * x;
+//    float yy = q.y * y;
+//    float zz = q.z * z;
+//    float xy = q.x * y;
+//    float xz = q.x * z;
+//    float yz = q.y * z;
+//    float wx = q.w * x;
+//    float wy = q.w * y;
+//    float wz = q.w * z;
+//
+//    vec3 rotated;
+//    rotated.x = (1f - (yy + zz)) * v.x + (xy - wz) * v.y + (xz + wy) * v.z;
+//    rotated.y = (xy + wz) * v.x + (1f - (xx + zz)) * v.y + (yz - wx) * v.z;
+//    rotated.z = (xz - wy) * v.x + (yz + wx) * v.y + (1f - (xx + yy)) * v.z;
+//    return rotated;
+//}
+
+vec4 Q_rotate(vec4 q1, vec4 q2){
+    vec4 q;
+    q.x = (q1.w * q2.x) + (q1.x * q2.w) + (q1.y * q2.z) - (q1.z * q2.y);
+    q.y = (q1.w * q2.y) - (q1.x * q2.z) + (q1.y * q2.w) + (q1.z * q2.x);
+    q.z = (q1.w * q2.z) + (q1.x * q2.y) - (q1.y * q2.x) + (q1.z * q2.w);
+    q.w = (q1.w * q2.w) - (q1.x * q2.x) - (q1.y * q2.y) - (q1.z * q2.z);
+    return q;
+}
+
+vec4 Q_inverse(vec4 q){
+    return vec4(-q.xyz, q.w);
+}
+
+vec3 q_rotate_v(vec4 q, vec3 v){
+    vec4 qv = vec4(v, 0);
+    vec4 qi = Q_inverse(q);
+    vec4 mult = Q_rotate(Q_rotate(q, qv), qi); // q * qv * qi
+    return mult.xyz;
+}
+
+vec4 Slerp(vec4 p0, vec4 p1, float t)
+{
+  float dotp = dot(normalize(p0), normalize(p1));
+  if ((dotp > 0.9999) || (dotp<-0.9999))
+  {
+    if (t<=0.5)
+      return p0;
+    return p1;
+  }
+  float theta = acos(dotp);
+  vec4 P = ((p0*sin((1-t)*theta) + p1*sin(t*theta)) / sin(theta));
+  P.w = 1;
+  return P;
+}
+
+//----------------------------------------------------------------------------------------------------------
+// path tracing
+//----------------------------------------------------------------------------------------------------------
+// every intersector reads only the fields it uses, e.g. spheres never load their (unused) rotation
+void intersectSphere( in int index, in int geometryIndex, in vec3 ro, in vec3 rd, inout float minDist, inout vec3 hitpoint, inout vec3 hitNormal, inout vec3 hitObjID ){
+    vec3 position = spheres[index].position;
+    vec2 intersection = sphIntersect(ro-position, rd, spheres[index].radius);
+    if (intersection.x > 0 && minDist > intersection.x){
+        hitpoint = ro + rd*(intersection.x);
+        hitNormal = normalize(hitpoint-position);
+        minDist = intersection.x;
+        hitObjID.x = 1;
+        hitObjID.y = geometryIndex;
+        hitObjID.z = index;
+    }
+}
+
+void intersectCube( in int index, in int geometryIndex, in vec3 ro, in vec3 rd, inout float minDist, inout vec3 hitpoint, inout vec3 hitNormal, inout vec3 hitObjID ){
+    cubeStruct cube = cubes[index];
+    vec3 tempNormal;
+    vec4 quaternion = cube.rotation;
+    // TODO: Rotations with proper normals
+    vec3 qro = q_rotate_v(Q_inverse(quaternion), ro-cube.position);//Rotate(quaternion, ro-pos);
+    vec3 qrd = q_rotate_v(Q_inverse(quaternion), rd);//Rotate(quaternion, rd);
+
+    vec2 intersection = boxIntersection(qro, qrd, cube.size, tempNormal);
+    if (intersection.x > 0.0 && intersection.x < minDist){
+        hitpoint = q_rotate_v(quaternion, qro) + cube.position + q_rotate_v(quaternion,qrd)*(intersection.x);
+        minDist = intersection.x;
+        hitNormal = q_rotate_v(quaternion, tempNormal);//normalize(Rotate(Slerp(quaternion, vec4(0,0,0,1), 0), tempNormal).xyz);//quat_mult(quat_mult(quaternion, vec4(tempNormal,0)), quat_inverse(quaternion)).xyz; //q * v * q^-1
+        hitObjID.x = 2;
+        hitObjID.y = geometryIndex;
+        hitObjID.z = index;
+    }
+}
+
+void intersectCylinder( in int index, in int geometryIndex, in vec3 ro, in vec3 rd, inout float minDist, inout vec3 hitpoint, inout vec3 hitNormal, inout vec3 hitObjID ){
+    vec4 intersection = cylIntersect(ro, rd, cylinders[index].top, cylinders[index].bottom, cylinders[index].radius);
+    if (intersection.x > 0.0 && intersection.x < minDist){
+        hitpoint = ro + rd*(intersection.x);
+        minDist = intersection.x;
+        hitNormal = intersection.yzw;
+        hitObjID.x = 3;
+        hitObjID.y = geometryIndex;
+        hitObjID.z = index;
+    }
+}
+
+void intersectQuad( in int index, in int geometryIndex, in vec3 ro, in vec3 rd, inout float minDist, inout vec3 hitpoint, inout vec3 hitNormal, inout vec3 hitObjID ){
+    vec3 D = vec3(quads[index].d_x, quads[index].d_y, quads[index].d_z);
+
+    vec4 intersection = quadIntersect(ro, rd, quads[index].a, quads[index].b, quads[index].c, D);
+    if (intersection.x > 0.0 && intersection.x < minDist){
+        hitpoint = ro + rd*(intersection.x);
+        minDist = intersection.x;
+        hitNormal = intersection.yzw;
+        hitObjID.x = 4;
+        hitObjID.y = geometryIndex;
+        hitObjID.z = index;
+    }
+}
+
+void intersectPrimitive( in int type, in int index, in int geometryIndex, in vec3 ro, in vec3 rd, inout float minDist, inout vec3 hitpoint, inout vec3 hitNormal, inout vec3 hitObjID ){ // static primitive by type and index into its buffer
+    if (type == 1){
+        intersectSphere(index, geometryIndex, ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+    } else if (type == 2){
+        intersectCube(index, geometryIndex, ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+    } else if (type == 3){
+        intersectCylinder(index, geometryIndex, ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+    } else if (type == 4){
+        intersectQuad(index, geometryIndex, ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+    }
+}
+
+//----------------------------------------------------------------------------------------------------------
+// BVH (built by bvh.py: 2 vec4 per node followed by one (type, index, geometryIndex) vec4 per leaf primitive)
+//----------------------------------------------------------------------------------------------------------
+#define BVH_STACK_SIZE 32
+
+vec4 bvhFetch( in int pixelIndex ){
+    return bvhData[pixelIndex];
+}
+
+float bvhNodeDistance( in int node, in vec3 ro, in vec3 invRd, in float maxDist ){
+    vec3 t1 = (bvhFetch(node*2).xyz - ro) * invRd;
+    vec3 t2 = (bvhFetch(node*2+1).xyz - ro) * invRd;
+    vec3 tSmall = min(t1, t2);
+    vec3 tBig = max(t1, t2);
+    float tNear = max(max(max(tSmall.x, tSmall.y), tSmall.z), 0.0);
+    float tFar = min(min(tBig.x, tBig.y), tBig.z);
+    return (tNear <= tFar && tNear < maxDist) ? tNear : 1e30;
+}
+
+void intersectRanges( in ivec4 start, in ivec4 stop, in int geometryIndex, in vec3 ro, in vec3 rd, inout float minDist, inout vec3 hitpoint, inout vec3 hitNormal, inout vec3 hitObjID ){
+    // one tight loop per type over [start, stop) of its buffer instead of a type test per primitive, geometryIndex numbers them in order
+    for (int i=start.x; i<stop.x; i++, geometryIndex++){
+        intersectSphere(i, geometryIndex, ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+    }
+    for (int i=start.y; i<stop.y; i++, geometryIndex++){
+        intersectCube(i, geometryIndex, ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+    }
+    for (int i=start.z; i<stop.z; i++, geometryIndex++){
+        intersectCylinder(i, geometryIndex, ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+    }
+    for (int i=start.w; i<stop.w; i++, geometryIndex++){
+        intersectQuad(i, geometryIndex, ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+    }
+}
+
+void intersectStatic( in vec3 ro, in vec3 rd, inout float minDist, inout vec3 hitpoint, inout vec3 hitNormal, inout vec3 hitObjID ){ // linear loop over the static geometry, without a BVH
+    intersectRanges(ivec4(0), u_static_counts, 0, ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+}
+
+void intersectDynamic( in vec3 ro, in vec3 rd, inout float minDist, inout vec3 hitpoint, inout vec3 hitNormal, inout vec3 hitObjID ){ // always linear, numbered after the static geometry
+    intersectRanges(u_static_counts, u_static_counts + u_dynamic_counts, u_geometry_count, ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+}
+
+int raycastGeometry( in vec3 ro, in vec3 rd, out vec3 hitpoint, out vec3 hitNormal ){ // closest geometry index, -1 on a miss
+
+    float minDist = 99999;
+
+    vec3 hitObjID; //x=type,y=geometryIndex,z=index in the type's buffer
+    
+    if (u_bvh_node_count > 0){
+        vec3 invRd = 1.0 / mix(rd, vec3(1e-20), equal(rd, vec3(0.0)));
+        int stack[BVH_STACK_SIZE];
+        int stackSize = 0;
+        int node = 0;
+        bool traversing = bvhNodeDistance(0, ro, invRd, minDist) < 1e30;
+
+        while (traversing){
+            vec4 nodeData = bvhFetch(node*2);
+            int leftFirst = int(nodeData.w);
+            int primitiveCount = int(bvhFetch(node*2+1).w);
+
+            if (primitiveCount > 0){
+                for (int i=0; i<primitiveCount; i++){
+                    vec4 ref = bvhFetch(u_bvh_node_count*2 + leftFirst + i);
+                    intersectPrimitive(int(ref.x), int(ref.y), int(ref.z), ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+                }
+            } else {
+                int near = leftFirst;
+                int far = leftFirst + 1;
+                float nearDist = bvhNodeDistance(near, ro, invRd, minDist);
+                float farDist = bvhNodeDistance(far, ro, invRd, minDist);
+                if (nearDist > farDist){
+                    int tempNode = near; near = far; far = tempNode;
+                    float tempDist = nearDist; nearDist = farDist; farDist = tempDist;
+                }
+                if (nearDist < 1e30){
+                    if (farDist < 1e30 && stackSize < BVH_STACK_SIZE){
+                        stack[stackSize++] = far;
+                    }
+                    node = near;
+                    continue;
+                }
+            }
+
+            if (stackSize == 0){
+                traversing = false;
+            } else {
+                node = stack[--stackSize];
+            }
+        }
+    } else {
+        intersectStatic(ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+    }
+    intersectDynamic(ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+    return (minDist < 99999) ? int(hitObjID.y) : -1;
+}
+
+bool occludedRanges( in ivec4 start, in ivec4 stop, in vec3 ro, in vec3 rd, in float maxDist ){
+    float minDist = maxDist;
+    vec3 hitpoint, hitNormal, hitObjID;
+    for (int i=start.x; i<stop.x; i++){
+        intersectSphere(i, 0, ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+        if (minDist < maxDist) return true;
+    }
+    for (int i=start.y; i<stop.y; i++){
+        intersectCube(i, 0, ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+        if (minDist < maxDist) return true;
+    }
+    for (int i=start.z; i<stop.z; i++){
+        intersectCylinder(i, 0, ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+        if (minDist < maxDist) return true;
+    }
+    for (int i=start.w; i<stop.w; i++){
+        intersectQuad(i, 0, ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+        if (minDist < maxDist) return true;
+    }
+    return false;
+}
+
+bool occluded( in vec3 ro, in vec3 rd, in float maxDist ){ // shadow rays: any primitive closer than maxDist, without looking for the closest one
+    if (u_bvh_node_count > 0){
+        float minDist = maxDist;
+        vec3 hitpoint, hitNormal, hitObjID;
+        vec3 invRd = 1.0 / mix(rd, vec3(1e-20), equal(rd, vec3(0.0)));
+        int stack[BVH_STACK_SIZE];
+        int stackSize = 0;
+        if (bvhNodeDistance(0, ro, invRd, maxDist) < 1e30){
+            stack[stackSize++] = 0;
+        }
+
+        while (stackSize > 0){
+            int node = stack[--stackSize];
+            int leftFirst = int(bvhFetch(node*2).w);
+            int primitiveCount = int(bvhFetch(node*2+1).w);
+
+            if (primitiveCount > 0){
+                for (int i=0; i<primitiveCount; i++){
+                    vec4 ref = bvhFetch(u_bvh_node_count*2 + leftFirst + i);
+                    intersectPrimitive(int(ref.x), int(ref.y), int(ref.z), ro, rd, minDist, hitpoint, hitNormal, hitObjID);
+                    if (minDist < maxDist) return true;
+                }
+            } else { // no near/far ordering, any hit will do
+                for (int child=leftFirst; child<leftFirst+2; child++){
+                    if (stackSize < BVH_STACK_SIZE && bvhNodeDistance(child, ro, invRd, maxDist) < 1e30){
+                        stack[stackSize++] = child;
+                    }
+                }
+            }
+        }
+    } else if (occludedRanges(ivec4(0), u_static_counts, ro, rd, maxDist)){
+        return true;
+    }
+    return occludedRanges(u_static_counts, u_static_counts + u_dynamic_counts, ro, rd, maxDist);
+}
+
+materialStruct fetchMaterial( in int geometryIndex ){
+    materialStruct hitMaterial;
+    packedMaterialStruct material = materials[materialIds[geometryIndex]];
+
+    hitMaterial.albedo = material.color.rgb;
+    hitMaterial.specularColor = material.specularColor.rgb;
+    hitMaterial.roughness = material.properties.r;
+    hitMaterial.metallness = material.properties.g;
+    hitMaterial.emissive = material.properties.b;
+    hitMaterial.refractive = material.properties.a;
+    return hitMaterial;
+}
+
+bool raycast( in vec3 ro, in vec3 rd, out materialStruct hitMaterial, out vec3 hitpoint, out vec3 hitNormal ){
+    int geometryIndex = raycastGeometry(ro, rd, hitpoint, hitNormal);
+    if (geometryIndex < 0){
+        return false;
+    }
+    hitMaterial = fetchMaterial(geometryIndex);
+    return true;
+}
+
+//----------------------------------------------------------------------------------------------------------
+// lights (next-event estimation): emissive spheres are sampled by the cone they subtend, quads by area
+//----------------------------------------------------------------------------------------------------------
+ivec2 primitiveOf( in int geometryIndex ){ // (type, index in the type's buffer), the inverse of the numbering in intersectRanges
+    ivec4 counts = u_static_counts;
+    ivec4 first = ivec4(0);
+    if (geometryIndex >= u_geometry_count){
+        geometryIndex -= u_geometry_count;
+        counts = u_dynamic_counts;
+        first = u_static_counts;
+    }
+    for (int type=0; type<4; type++){
+        if (geometryIndex < counts[type]){
+            return ivec2(type+1, first[type] + geometryIndex);
+        }
+        geometryIndex -= counts[type];
+    }
+    return ivec2(0);
+}
+
+float sphereLightCone( in int index, in vec3 ro, out vec3 axis ){ // 1 - cos of the cone's half angle, 0 from inside the sphere
+    vec3 toCenter = spheres[index].position - ro;
+    float distance2 = dot(toCenter, toCenter);
+    float radius2 = spheres[index].radius * spheres[index].radius;
+    axis = toCenter * inversesqrt(distance2);
+    if (distance2 <= radius2){
+        return 0.0;
+    }
+    float sin2 = radius2 / distance2;
+    return sin2 / (1.0 + sqrt(1.0 - sin2)); // 1 - sqrt(1 - sin2) without the cancellation of small lights
+}
+
+vec3 quadLightAreas( in int index ){ // areas of the (a, b, c) and (a, c, d) triangles quadIntersect splits the quad into, and their sum
+    vec3 a = quads[index].a;
+    vec3 c = quads[index].c;
+    vec3 d = vec3(quads[index].d_x, quads[index].d_y, quads[index].d_z);
+    float first = 0.5 * length(cross(quads[index].b - a, c - a));
+    float second = 0.5 * length(cross(c - a, d - a));
+    return vec3(first, second, first + second);
+}
+
+float quadLightPdf( in int index, in vec3 rd, in float dist ){
+    vec3 a = quads[index].a;
+    float cosLight = abs(dot(normalize(cross(quads[index].b - a, quads[index].c - a)), rd)); // quads emit on both sides
+    return (cosLight > 1e-6) ? dist * dist / (cosLight * quadLightAreas(index).z) : 0.0;
+}
+
+float lightPdf( in ivec2 light, in vec3 ro, in vec3 rd, in float dist ){ // solid angle pdf of sampleLight choosing rd, that reaches the light after dist
+    float pdf = 0.0;
+    if (light.x == 1){
+        vec3 axis;
+        float cone = sphereLightCone(light.y, ro, axis);
+        pdf = (cone > 0.0) ? 1.0 / (2*PI * cone) : 0.0;
+    } else if (light.x == 4){
+        pdf = quadLightPdf(light.y, rd, dist);
+    }
+    return pdf / float(u_light_count);
+}
+
+bool sampleLight( in lightStruct light, in vec3 ro, in vec3 u, out vec3 rd, out float dist, out float pdf ){
+    if (light.type == 1){
+        vec3 axis;
+        float cone = sphereLightCone(light.index, ro, axis);
+        if (cone <= 0.0){
+            return false;
+        }
+        float cosTheta = 1.0 - u.x * cone;
+        float sinTheta = sqrt(max(1.0 - cosTheta*cosTheta, 0.0));
+        float phi = 2*PI * u.y;
+        float s = (axis.z >= 0.0) ? 1.0 : -1.0; // orthonormal basis around the axis (Duff et al. 2017)
+        float a = -1.0 / (s + axis.z);
+        float b = axis.x * axis.y * a;
+        vec3 tangent = vec3(1.0 + s * axis.x * axis.x * a, s * b, -s * axis.x);
+        vec3 bitangent = vec3(b, s + axis.y * axis.y * a, -axis.y);
+        rd = normalize(tangent * (cos(phi) * sinTheta) + bitangent * (sin(phi) * sinTheta) + axis * cosTheta);
+        dist = sphIntersect(ro - spheres[light.index].position, rd, spheres[light.index].radius).x;
+        pdf = 1.0 / (2*PI * cone);
+        return dist > 0.0;
+    }
+    // quad, uniform over the area of the triangle picked by u.z
+    vec3 areas = quadLightAreas(light.index);
+    vec3 a = quads[light.index].a;
+    vec3 b = quads[light.index].b;
+    vec3 c = quads[light.index].c;
+    if (u.z * areas.z >= areas.x){
+        b = c;
+        c = vec3(quads[light.index].d_x, quads[light.index].d_y, quads[light.index].d_z);
+    }
+    float root = sqrt(u.x);
+    vec3 point = a * (1.0 - root) + b * (root * (1.0 - u.y)) + c * (root * u.y);
+    rd = point - ro;
+    dist = length(rd);
+    rd /= dist;
+    pdf = quadLightPdf(light.index, rd, dist);
+    return pdf > 0.0;
+}
+
+float powerHeuristic( in float pdf, in float otherPdf ){
+    return (pdf * pdf) / (pdf * pdf + otherPdf * otherPdf);
+}
+
+float emissionWeight( in int geometryIndex, in vec3 ro, in vec3 rd, in vec3 hitpoint, in float bsdfPdf ){ // MIS weight of emission found by a bounce ray
+    if (bsdfPdf <= 0.0 || u_light_count == 0){ // that bounce was not light sampled
+        return 1.0;
+    }
+    ivec2 light = primitiveOf(geometryIndex);
+    if (light.x != 1 && light.x != 4){ // emissive cubes and cylinders are only found by bounces
+        return 1.0;
+    }
+    return powerHeuristic(bsdfPdf, lightPdf(light, ro, rd, length(hitpoint - ro)));
+}
+
+vec3 sampleLights( in vec3 ro, in vec3 normal ){ // next-event estimation for the diffuse lobe at ro, weighted by the path throughput by the caller
+    lightStruct light = lights[min(int(RandomFloat01(rngState) * float(u_light_count)), u_light_count-1)];
+    vec3 u;
+    u.x = RandomFloat01(rngState);
+    u.y = RandomFloat01(rngState);
+    u.z = RandomFloat01(rngState);
+    vec3 rd;
+    float dist;
+    float pdf;
+    if (!sampleLight(light, ro, u, rd, dist, pdf)){
+        return vec3(0);
+    }
+    float cosTheta = dot(normal, rd);
+    if (cosTheta <= 0.0 || occluded(ro, rd, dist - 0.001)){
+        return vec3(0);
+    }
+    pdf /= float(u_light_count);
+    float bsdfPdf = cosTheta / PI;
+    materialStruct emitter = fetchMaterial(light.geometryIndex);
+    return emitter.albedo * emitter.emissive * (bsdfPdf / pdf) * powerHeuristic(pdf, bsdfPdf);
+}
+
+vec3 getSkyboxColor( in vec3 rd ){
+    vec3 col;
+    if (u_skybox_type == 0){
+        vec2 uv = vec2(0.5 + atan(rd.x, rd.z)/(2*PI), 0.5 + asin(-rd.y)/PI);
+        col = vec3(max(sin(uv.x*100)*100 * cos(uv.y*100)*100,0), 0, max(sin(uv.x*100)*100 * cos(uv.y*100)*100,0)); 
+        //col = vec3(0);
+    } else if (u_skybox_type == 1) {
+        col = texture(u_skybox_texture, vec2(0.5 + atan(rd.x, rd.z)/(2*PI), 0.5 + asin(-rd.y)/PI)).xyz;
+    }
+    return col;
+}
+
+//----------------------------------------------------------------------------------------------------------
+// path tracing steps, shared by the RT.frag megakernel and the wavefront compute passes
+//----------------------------------------------------------------------------------------------------------
+layout(std430, binding=5) buffer PathStats { // counts of the frame, read back by Renderer.readPathStats
+    uint statRaycasts;
+    uint statConvergedPixels;
+};
+
+bool pixelConverged( in ivec2 pixel ){ // adaptive sampling, true once the accumulated error is low enough to skip the pixel
+    // every u_adaptive_min_frames-th frame traces everything, so a skipped pixel whose rare bright paths
+    // hadn't shown up yet still gets found out instead of staying biased dark
+    if (u_noise_threshold <= 0.0 || u_frame % u_adaptive_min_frames == 0){
+        return false;
+    }
+    vec4 moments = texelFetch(u_moments_texture, pixel, 0);
+    if (moments.y >= u_adaptive_min_frames && moments.z < u_noise_threshold){
+        atomicAdd(statConvergedPixels, 1);
+        return true;
+    }
+    return false;
+}
+
+bool russianRoulette( in int bounces, inout vec3 rayColor ){ // false ends the path, survivors are reweighted so the estimate stays unbiased
+    if (u_roulette_depth <= 0 || bounces < u_roulette_depth){
+        return true;
+    }
+    float survival = min(max(max(rayColor.r, rayColor.g), rayColor.b), 1.0);
+    if (RandomFloat01(rngState) >= survival){
+        return false;
+    }
+    rayColor /= survival;
+    return true;
+}
+
+bool scatter( inout rayStruct ray, inout vec3 rayColor, in materialStruct hitMaterial, in vec3 hitpoint, in vec3 hitnormal ){ // true if the cosine weighted diffuse lobe was sampled
+    ray.origin = hitpoint + (hitnormal * 0.001);
+    vec3 refractDir = ray.direction;
+    float fres = myrefract(refractDir,hitnormal,1.333);
+    float choice = RandomFloat01(rngState);
+    if (choice*hitMaterial.refractive > fres){ //refract
+        ray.direction = mix(refractDir,normalize(hitnormal + RandomUnitVector(rngState)), hitMaterial.roughness);
+        ray.origin = hitpoint + refractDir*0.001;
+        rayColor *= hitMaterial.albedo;//mix(hitMaterial.albedo, hitMaterial.specularColor, doSpecular);
+        //ray.direction = reflect(ray.direction, hitnormal);
+    } else { //reflect
+        float doSpecular = (RandomFloat01(rngState) < hitMaterial.metallness) ? 1.0 : 0.0;
+        vec3 diffuseDir = normalize(hitnormal + RandomUnitVector(rngState));
+        vec3 specularDir = reflect(ray.direction, hitnormal);
+        specularDir = normalize(mix(specularDir, diffuseDir, hitMaterial.roughness * hitMaterial.roughness));
+        ray.direction = mix(diffuseDir, specularDir, doSpecular);
+        rayColor *= mix(hitMaterial.albedo, hitMaterial.specularColor, doSpecular);
+        return doSpecular == 0.0;
+    }
+    return false;
+}
+
+vec3 shadeHit( inout rayStruct ray, inout vec3 rayColor, inout float bsdfPdf, in int geometryIndex, in vec3 hitpoint, in vec3 hitnormal, in bool lastBounce ){
+    // emission of the hit, then the next bounce, light sampled if it left through the diffuse lobe.
+    // bsdfPdf carries the solid angle pdf of a diffuse bounce to the next hit for its MIS weight, 0 for any other bounce.
+    // The last bounce isn't traced, so it isn't light sampled either: lights it could reach are out of reach with or without NEE
+    materialStruct hitMaterial = fetchMaterial(geometryIndex);
+    vec3 color = vec3(0);
+    if (hitMaterial.emissive > 0.0){
+        color += (hitMaterial.albedo * hitMaterial.emissive) * rayColor * emissionWeight(geometryIndex, ray.origin, ray.direction, hitpoint, bsdfPdf);
+    }
+
+    bsdfPdf = 0.0;
+    if (scatter(ray, rayColor, hitMaterial, hitpoint, hitnormal) && u_light_count > 0 && !lastBounce){
+        color += sampleLights(ray.origin, hitnormal) * rayColor;
+        bsdfPdf = max(dot(hitnormal, ray.direction), 0.0) / PI;
+    }
+    return color;
+}
+
+mat2 rotate(float a){
+    float s = sin(a);
+    float c = cos(a);
+    return mat2(c, -s, s, c);
+}
+
+rayStruct cameraRay( in ivec2 pixel, in vec2 uv ){ // seeds rngState for the pixel
+    vec2 aspect_ratio = u_resolution/u_resolution.y;
+    rngState = uint(uint(pixel.x) * uint(1973) + uint(pixel.y) * uint(9277) + uint(u_frame) * uint(26699)) | uint(1);
+    vec2 jitter = (vec2(RandomFloat01(rngState), RandomFloat01(rngState)) - 0.5)/u_resolution;
+    vec2 norm_uv = (uv.xy+jitter-0.5)*aspect_ratio;
+
+    rayStruct ray;
+    ray.origin = u_cameraPos;//vec3(-8,0,0);
+    ray.direction = normalize( vec3( 0.7,norm_uv.yx ) );
+
+    //ray.direction = Rotate(quat, ray.direction);
+    ray.direction.xy *= rotate(u_mousePos.y);
+    ray.direction.zx *= rotate(u_mousePos.x);
+    return ray;
+}
@@ -0,0 +1,36 @@
+//----------------------------------------------------------------------------------------------------------
+// wavefront queues (bound by Renderer.renderWavefront), one path per pixel of the tile
+//----------------------------------------------------------------------------------------------------------
+#define WAVEFRONT_GROUP_SIZE 64
+
+struct pathStruct{
+    vec4 origin;
+    vec4 direction;        // w: pdf of the diffuse bounce that chose it, see shadeHit
+    vec4 primaryDirection; // camera ray, every sample of the pixel restarts from it
+    vec4 rayColor;
+    vec4 color;            // radiance of the current sample
+    vec4 colorSum;         // finished samples
+    uint rngState;
+    int pixel;             // index inside the tile
+    int smple;
+    int bounce;
+};
+
+struct hitStruct{
+    vec4 hitpoint;         // w: geometry index, -1 on a miss
+    vec4 hitnormal;
+};
+
+layout(std430, binding=0) buffer Paths { pathStruct paths[]; };
+layout(std430, binding=1) buffer Hits { hitStruct hits[]; };
+layout(std430, binding=2) buffer RayQueue { int rayQueue[]; };          // paths to advance this bounce
+layout(std430, binding=3) buffer NextRayQueue { int nextRayQueue[]; };  // paths still alive after it
+layout(std430, binding=4) buffer Counters {
+    uint groupsX;          // indirect dispatch size of the next intersect/shade pass
+    uint groupsY;
+    uint groupsZ;
+    uint rayCount;
+    uint nextRayCount;
+};
+
+uniform ivec4 u_tile; // x, y, width, height
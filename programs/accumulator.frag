@@ -1,22 +1,47 @@
-#version 460
+#version 450
 
 in vec2 v_uv;
-out vec4 fragColor;
+layout(location=0) out vec4 fragColor;
+layout(location=1) out vec4 momentsColor; // x: mean luminance², y: accumulated frames, z: relative error of the mean
 
 uniform sampler2D accumFrame;
+uniform sampler2D accumMoments;
 uniform sampler2D currentFrame;
-uniform int frame;
+#include "frame_data.glsl"
+
+const vec3 LUMINANCE = vec3(0.2126, 0.7152, 0.0722);
 
 void main(){
 
+    // texelFetch, a filtered lookup would blend in neighbours and their skip flags
+    ivec2 pixel = ivec2(gl_FragCoord.xy);
+    vec4 current = texelFetch(currentFrame, pixel, 0);
+    vec4 moments = texelFetch(accumMoments, pixel, 0);
+    float frames = (u_frame == 0) ? 0.0 : moments.y;
+
+    if (u_frame != 0 && current.a == 0.0){ // RT skipped the converged pixel, keep everything as it is
+        fragColor = texelFetch(accumFrame, pixel, 0);
+        momentsColor = moments;
+        return;
+    }
+
     //fragColor = texture(currentFrame, v_uv);
-    float weight = 1.0 / (frame + 1);
+    float weight = 1.0 / (frames + 1);
     //vec3 color = texture(lastFrame, v_uv).rgb * (1 - weight) + texture(Tex, v_uv).rgb * weight;
-    if (frame==0){
-        fragColor = texture(currentFrame,v_uv);
+    float luminance = dot(current.rgb, LUMINANCE);
+    if (u_frame==0){
+        fragColor = current;
+        momentsColor.x = luminance * luminance;
     }else{
         
-        fragColor = mix(texture(accumFrame, v_uv), texture(currentFrame,v_uv),weight);
+        fragColor = mix(texelFetch(accumFrame, pixel, 0), current, weight);
+        momentsColor.x = mix(moments.x, luminance * luminance, weight);
     }
-    
-}
\ No newline at end of file
+
+    // standard error of the mean luminance, relative to it (dark pixels are judged on an absolute scale)
+    float meanLuminance = dot(fragColor.rgb, LUMINANCE);
+    float variance = max(momentsColor.x - meanLuminance * meanLuminance, 0.0);
+    momentsColor.y = frames + 1;
+    momentsColor.z = sqrt(variance / (frames + 1)) / max(meanLuminance, 0.05);
+    momentsColor.w = 1.0;
+}
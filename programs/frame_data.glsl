@@ -0,0 +1,5 @@
+layout(std140, binding=0) uniform FrameData { // rewritten at most once per frame by Renderer.updateFrameData
+    vec3 u_cameraPos;
+    int u_frame;
+    vec2 u_mousePos;
+};
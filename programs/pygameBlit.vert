@@ -1,4 +1,4 @@
-#version 460
+#version 450
 
 in vec3 in_vert;
 in vec2 in_uv;